@@ -0,0 +1,774 @@
+"""
+odb2zdf的benchmark。
+使用standin目录中的odbAccess/abaqusConstants替身，不需要安装Abaqus:
+    python benchmark.py [--sizes 10000 100000] [--benchmarks invariants fields ...]
+"""
+import argparse
+import gzip
+import importlib.util
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "standin"))
+
+import odbAccess
+from abaqusConstants import *
+from zdf_cache import ZdfCache
+from zdf_client import request, submit
+from zdf_reader import ZdfLazyReader, ZdfRangeArray, load_zdf
+from zdf_writer import (ZdfPrecision, ZdfRecordBuffer, ZdfSharedIds, ZdfSidecar, ZdfStreamWriter, dump_zdf,
+                        encode_ranges)
+
+#==============================================================================#
+
+def load_odb2zdf():
+    """
+    导入odb2zdf脚本(main1.8.py)，脚本中的odbAccess会使用standin中的替身
+    """
+    spec = importlib.util.spec_from_file_location("odb2zdf", os.path.join(ROOT, "main1.8.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["odb2zdf"] = module # worker进程需要通过模块名找到任务函数
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_field_odb(num_values, block_size=None, seed=0):
+    """
+    构建只包含一个step、一个frame的odb, frame中有节点上的U, 积分点上的S、LE以及壳单元上的平面应力SP
+    :param num_values: 每个field的值的个数
+    :param block_size: bulkDataBlocks中每个block的行数
+    :param seed: 随机数种子
+    :return: odb对象
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.arange(1, num_values + 1)
+    field_outputs = {
+        "U": odbAccess.FieldOutput("U", VECTOR, NODAL, ("U1", "U2", "U3"),
+                                   rng.normal(scale=1e-3, size=(num_values, 3)),
+                                   nodeLabels=labels, blockSize=block_size),
+        "S": odbAccess.FieldOutput("S", TENSOR_3D_FULL, INTEGRATION_POINT,
+                                   ("S11", "S22", "S33", "S12", "S13", "S23"),
+                                   rng.normal(scale=1e4, size=(num_values, 6)),
+                                   elementLabels=labels, blockSize=block_size),
+        "LE": odbAccess.FieldOutput("LE", TENSOR_3D_FULL, INTEGRATION_POINT,
+                                    ("LE11", "LE22", "LE33", "LE12", "LE13", "LE23"),
+                                    rng.normal(scale=1e-3, size=(num_values, 6)),
+                                    elementLabels=labels, blockSize=block_size),
+        "SP": odbAccess.FieldOutput("SP", TENSOR_3D_PLANAR, INTEGRATION_POINT, ("SP11", "SP22", "SP12"),
+                                    rng.normal(scale=1e4, size=(num_values, 3)),
+                                    elementLabels=labels, blockSize=block_size),
+    }
+    frame = odbAccess.OdbFrame(0, 1.0, field_outputs)
+    return odbAccess.Odb("bench", {"Step-1": odbAccess.OdbStep("Step-1", 1, [frame])})
+
+
+def make_mesh_odb(num_elements, seed=0):
+    """
+    构建只包含一个instance的odb, element由C3D10、C3D8R和C3D4三种type交替组成, connectivity是随机的node label
+    :param num_elements: element的个数
+    :param seed: 随机数种子
+    :return: odb对象
+    """
+    rng = np.random.default_rng(seed)
+    element_types = [("C3D10", 10), ("C3D8R", 8), ("C3D4", 4)]
+    elements = []
+    for label in range(1, num_elements + 1):
+        element_type, node_num = element_types[label % len(element_types)]
+        elements.append(odbAccess.OdbMeshElement(label, element_type,
+                                                 rng.integers(1, num_elements, size=node_num).tolist()))
+    instance = odbAccess.OdbInstance("PART-1-1", [], elements)
+    return odbAccess.Odb("bench", {}, odbAccess.OdbAssembly({"PART-1-1": instance}))
+
+
+def make_tetra_odb(num_elements):
+    """
+    构建只包含一个instance的结构化C3D10网格: 每个立方体分成6个四面体, 角节点和边的中点都是加密一倍的网格上的节点,
+    节点label按网格的顺序编号, 与实际的网格一样, 同一个element的节点label相近
+    :param num_elements: element的大致个数
+    :return: odb对象
+    """
+    cells = max(int(round((num_elements / 6) ** (1 / 3))), 1) # 每个方向上立方体的个数
+    points = 2 * cells + 1 # 加密的网格每个方向上的节点个数
+    origins = 2 * np.stack(np.meshgrid(*[np.arange(cells)] * 3, indexing="ij"), axis=-1).reshape(-1, 1, 3)
+    # 沿三个坐标轴的每种排列从(0, 0, 0)走到(2, 2, 2), 经过的4个角节点构成一个四面体
+    corners = []
+    for axes in ((0, 1, 2), (0, 2, 1), (1, 0, 2), (1, 2, 0), (2, 0, 1), (2, 1, 0)):
+        steps = np.zeros((4, 3), dtype=np.int64)
+        for index, axis in enumerate(axes):
+            steps[index + 1:, axis] = 2
+        corners.append(origins + steps)
+    corners = np.concatenate(corners)
+    # C3D10的边中点依次为1-2、2-3、3-1、1-4、2-4、3-4边的中点
+    edges = np.array([[0, 1], [1, 2], [2, 0], [0, 3], [1, 3], [2, 3]])
+    nodes = np.concatenate([corners, (corners[:, edges[:, 0]] + corners[:, edges[:, 1]]) // 2], axis=1)
+    connectivity = 1 + nodes[..., 0] + points * (nodes[..., 1] + points * nodes[..., 2])
+    elements = [odbAccess.OdbMeshElement(label, "C3D10", connect)
+                for label, connect in enumerate(connectivity.tolist(), start=1)]
+    instance = odbAccess.OdbInstance("PART-1-1", [], elements)
+    return odbAccess.Odb("bench", {}, odbAccess.OdbAssembly({"PART-1-1": instance}))
+
+
+def timeit(func, repeat=3):
+    """
+    :return: 多次运行中最短的时间(秒)和最后一次的返回值
+    """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def assert_close(actual, expected, rtol=1e-5):
+    """
+    float32精度下的比较, 误差相对于每一列的最大绝对值
+    """
+    actual, expected = np.asarray(actual, dtype=np.float64), np.asarray(expected, dtype=np.float64)
+    scale = np.maximum(np.abs(expected).max(axis=0), np.finfo(np.float32).tiny)
+    error = (np.abs(actual - expected) / scale).max()
+    assert error <= rtol, f"relative error {error:.3g} exceeds {rtol:.3g}"
+    return error
+
+
+# FieldValue中invariant对应的属性
+INVARIANT_ATTRIBUTES = {
+    MAGNITUDE: "magnitude", MISES: "mises", TRESCA: "tresca", PRESS: "press", INV3: "inv3",
+    MAX_PRINCIPAL: "maxPrincipal", MID_PRINCIPAL: "midPrincipal", MIN_PRINCIPAL: "minPrincipal",
+    MAX_INPLANE_PRINCIPAL: "maxInPlanePrincipal", MIN_INPLANE_PRINCIPAL: "minInPlanePrincipal",
+    OUTOFPLANE_PRINCIPAL: "outOfPlanePrincipal",
+}
+
+
+def read_example_fields(path=os.path.join(ROOT, "example.zdf")):
+    """
+    读取example.zdf(由Abaqus的odb转换得到, 数组只保留了前几行)中各field的值
+    :return: {field名称: (variables, 值数组)}, 值数组的前几列为Abaqus计算的invariant, 其余为分量
+    """
+    with open(path) as f:
+        text = f.read()
+    fields = {}
+    pattern = r'"([^"]+)": \{\s*"variables": (\[[^\]]*\]).*?"value": \{.*?"__data__": \[(.*?)\.\.\.\.\.\.'
+    for name, variables, rows in re.findall(pattern, text, re.DOTALL):
+        values = [json.loads(row) for row in re.findall(r"\[[^\[\]]+\]", rows)]
+        fields[name.replace(" element result", "")] = (json.loads(variables), np.array(values))
+    return fields
+
+
+def bench_invariants(odb2zdf, sizes):
+    """
+    用example.zdf中Abaqus计算的invariant检查ZdfInvariants, 然后比较逐个FieldValue读取属性和批量计算的耗时
+    """
+    print("invariants: Abaqus values in example.zdf vs ZdfInvariants")
+    for field_name, (variables, values) in read_example_fields().items():
+        symbols = {str(symbol): symbol for symbol in INVARIANT_ATTRIBUTES}
+        invariant_symbols = [symbols[name] for name in variables if name in symbols]
+        components = len(invariant_symbols)
+        actual = odb2zdf.ZdfInvariants(field_name, variables[components:]).get_data(
+            values[:, components:].astype(np.float32), invariant_symbols)
+        error = assert_close(actual, values[:, :components])
+        print(f"  {field_name:2s} {len(values)} row(s) {variables[:components]}  max relative error {error:.2e}")
+
+    print("invariants: FieldValue attributes vs ZdfInvariants")
+    for size in sizes:
+        odb = make_field_odb(size)
+        for field_name in ("S", "LE", "SP"):
+            field = odb.steps["Step-1"].frames[-1].fieldOutputs[field_name]
+            invariant_symbols = field.validInvariants
+
+            def read_attributes():
+                return [[getattr(value, INVARIANT_ATTRIBUTES[invariant_symbol])
+                         for invariant_symbol in invariant_symbols] for value in field.values]
+
+            def compute():
+                data = field.bulkDataBlocks[0].data
+                return odb2zdf.ZdfInvariants(field_name, field.componentLabels).get_data(data, invariant_symbols)
+
+            attribute_time, _ = timeit(read_attributes, repeat=1)
+            compute_time, _ = timeit(compute)
+            print(f"  {field_name:2s} n={size:>9d}  attributes {attribute_time:8.3f}s"
+                  f"  vectorized {compute_time:8.3f}s  speedup {attribute_time / compute_time:7.1f}x")
+
+
+def bench_field_extraction(odb2zdf, sizes):
+    """
+    比较ZdfField逐值读取和bulkDataBlocks批量读取的耗时, 并检查两者结果一致
+    """
+    print("ZdfField.get_data: per-value vs bulk")
+    for size in sizes:
+        odb = make_field_odb(size, block_size=max(size // 4, 1))
+        for field_name in ("U", "S", "LE", "SP"):
+            values_time, values_data = timeit(odb2zdf.ZdfField(odb, "Step-1", field_name).get_data)
+            bulk_time, bulk_data = timeit(odb2zdf.ZdfField(odb, "Step-1", field_name, bulk=True).get_data)
+            assert np.array_equal(bulk_data["id"]["__data__"], values_data["id"]["__data__"])
+            assert_close(bulk_data["value"]["__data__"], values_data["value"]["__data__"])
+            print(f"  {field_name:2s} n={size:>9d}  per-value {values_time:8.3f}s"
+                  f"  bulk {bulk_time:8.3f}s  speedup {values_time / bulk_time:7.1f}x")
+
+
+def bench_elements(odb2zdf, sizes):
+    """
+    比较逐个element构建list和按type分组后批量转换node顺序的耗时, 并检查两者结果一致
+    """
+    print("ZdfElement.get_data: per-element lists vs grouped arrays")
+    for size in sizes:
+        odb = make_mesh_odb(size)
+        element = odb2zdf.ZdfElement(odb)
+
+        def per_element():
+            typename2elements = {}
+            for aba_element in odb.rootAssembly.instances["PART-1-1"].elements:
+                zdf_type, type_id = element._abaqus_type_2_zdf_type(aba_element.type)
+                node_order = element.node_order_map.get(zdf_type, range(len(aba_element.connectivity)))
+                connect = list(aba_element.connectivity)
+                ids, values = typename2elements.setdefault(zdf_type, ([], []))
+                ids.append(aba_element.label)
+                values.append([connect[i] for i in node_order])
+            return typename2elements
+
+        reference_time, reference = timeit(per_element, repeat=1)
+        grouped_time, grouped = timeit(element.get_data)
+        for zdf_type, (ids, values) in reference.items():
+            assert grouped[zdf_type]["id"]["__data__"].tolist() == ids
+            assert grouped[zdf_type]["value"]["__data__"].tolist() == values
+        print(f"  n={size:>9d}  per-element {reference_time:8.3f}s  grouped {grouped_time:8.3f}s"
+              f"  speedup {reference_time / grouped_time:7.1f}x")
+
+
+def bench_nodal_average(odb2zdf, sizes):
+    """
+    比较在python中逐行累加、一次处理整个field(np.unique之后按分量np.bincount)和逐块累加(ZdfNodalAverage)
+    计算ELEMENT_NODAL数据的节点平均的耗时, 并检查结果一致。逐块累加时内存只与节点个数和一个block有关
+    """
+    print("ZdfNodalAverage.average: per-row python averaging vs whole field vs block-wise sums")
+    for size in sizes:
+        odb = odbAccess.make_odb(num_nodes=size, fields=["S"], element_types=["C3D10", "C3D8R"])
+        subset = odb.steps["Step-1"].frames[-1].fieldOutputs["S"].getSubset(position=ELEMENT_NODAL)
+        blocks = [(np.asarray(block.nodeLabels, dtype=np.int64), np.asarray(block.data).reshape(len(block.data), -1))
+                  for block in subset.bulkDataBlocks]
+        node_ids = np.concatenate([ids for ids, _ in blocks])
+        data = np.concatenate([values for _, values in blocks])
+
+        def per_row():
+            sums, counts = {}, {}
+            for label, row in zip(node_ids.tolist(), data.tolist()):
+                total = sums.setdefault(label, [0.0] * len(row))
+                for column, value in enumerate(row):
+                    total[column] += value
+                counts[label] = counts.get(label, 0) + 1
+            return {label: [value / counts[label] for value in total] for label, total in sums.items()}
+
+        def whole_field():
+            ids, inverse, counts = np.unique(node_ids, return_inverse=True, return_counts=True)
+            result = np.empty((len(ids), data.shape[1]), dtype=data.dtype)
+            for column in range(data.shape[1]):
+                result[:, column] = np.bincount(inverse, weights=data[:, column], minlength=len(ids)) / counts
+            return ids, result
+
+        nodal_average = odb2zdf.ZdfNodalAverage(odb)
+        reference_time, reference = timeit(per_row, repeat=1)
+        whole_time, (whole_ids, whole_values) = timeit(whole_field)
+        # 第一次需要从odb中读取所有节点的id, 之后所有的field和frame共用
+        cold_time, _ = timeit(lambda: nodal_average.average(iter(blocks)), repeat=1)
+        warm_time, (ids, values) = timeit(lambda: nodal_average.average(iter(blocks)))
+        assert ids.tolist() == sorted(reference)
+        assert np.allclose(values, [reference[label] for label in ids.tolist()], rtol=1e-5, atol=1e-2)
+        # 跨越多个block的节点的和按block分段累加, 与一次处理整个field时只有舍入误差
+        assert np.array_equal(ids, whole_ids) and np.allclose(values, whole_values, rtol=1e-6, atol=1e-6)
+        print(f"  n={size:>9d}  rows {len(node_ids):>9d}  per-row {reference_time:8.3f}s  whole field {whole_time:8.3f}s"
+              f"  block-wise {warm_time:8.3f}s (first call {cold_time:8.3f}s)  speedup {reference_time / warm_time:7.1f}x")
+
+
+def bench_connectivity(odb2zdf, sizes):
+    """
+    比较element的连接关系按行编码为差前后的文件大小和读取(包括解码)的耗时, 并检查读取的数据一致
+    """
+    print("tetra10 connectivity: plain vs delta encoding")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            elements = odb2zdf.ZdfElement(make_tetra_odb(size)).get_data()
+            num_elements = sum(element["id"]["__dims__"][0] for element in elements.values())
+            data = {"model": {"mesh": {"elements": elements}}}
+            for use_sidecar in (False, True):
+                results = []
+                for delta in (False, True):
+                    zdf_file = os.path.join(temp_dir, f"bench-{size}-{use_sidecar}-{delta}.zdf")
+                    with open(zdf_file, "w") as f, open(zdf_file + ".bin", "wb") as sidecar_file:
+                        sidecar = ZdfSidecar(sidecar_file, os.path.basename(zdf_file) + ".bin") if use_sidecar else None
+                        dump_zdf(data, f, sidecar, delta_connectivity=delta)
+                    with open(zdf_file, "rb") as f:
+                        gzip_size = len(gzip.compress(f.read() + open(zdf_file + ".bin", "rb").read(), 6))
+                    file_size = os.path.getsize(zdf_file) + os.path.getsize(zdf_file + ".bin")
+
+                    def load():
+                        mesh = load_zdf(zdf_file, mmap=False)["model"]["mesh"]["elements"]
+                        return [np.asarray(element["value"]["__data__"]) for element in mesh.values()]
+
+                    load_time, connectivity = timeit(load)
+                    results.append((file_size, gzip_size, load_time, connectivity))
+                for actual, expected in zip(results[1][3], results[0][3]):
+                    assert np.array_equal(actual, expected)
+                (plain_size, plain_gzip, plain_time, _), (delta_size, delta_gzip, delta_time, _) = results
+                print(f"  n={num_elements:>9d}  {'sidecar' if use_sidecar else 'json':7s}"
+                      f"  size {plain_size / 2**20:8.2f}MB -> {delta_size / 2**20:8.2f}MB"
+                      f"  gzip {plain_gzip / 2**20:8.2f}MB -> {delta_gzip / 2**20:8.2f}MB"
+                      f"  load {plain_time:8.3f}s -> {delta_time:8.3f}s")
+
+
+def bench_parallel(odb2zdf, sizes, workers_list):
+    """
+    测量多进程提取field的加速比, 并检查不同进程数的输出一致
+    """
+    print("ZdfAllData.dump: worker scaling")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            odb_file = os.path.join(temp_dir, f"bench-{size}.odb")
+            with open(odb_file, "w") as f:
+                json.dump({"num_nodes": size, "num_steps": 2, "fields": ["U", "RF", "S", "LE"]}, f)
+
+            def convert(workers):
+                f = io.StringIO()
+                odb2zdf.ZdfAllData(odb_file, workers=workers).dump(f)
+                # 去掉header中的日期后再比较
+                return [line for line in f.getvalue().splitlines() if '"date"' not in line]
+
+            serial_time, expected = timeit(lambda: convert(1), repeat=1)
+            print(f"  n={size:>9d}  workers= 1  {serial_time:8.3f}s")
+            for workers in workers_list:
+                parallel_time, actual = timeit(lambda: convert(workers), repeat=1)
+                assert actual == expected
+                print(f"  n={size:>9d}  workers={workers:2d}  {parallel_time:8.3f}s"
+                      f"  speedup {serial_time / parallel_time:5.2f}x")
+
+
+def bench_chunks(odb2zdf, sizes, chunk_sizes=(1024, 8192, 65536)):
+    """
+    比较提取整个field后写出和逐块提取、写出(ZdfField.dump)的峰值内存和耗时, 并检查输出一致
+    """
+    print("field output: whole field vs chunks")
+    # 逐块写出的文本总是写到磁盘上的临时文件中, 与转换很大的field时相同
+    spool_size, ZdfRecordBuffer.spool_size = ZdfRecordBuffer.spool_size, 1
+    for size in sizes:
+        odb = make_field_odb(size)
+        for field_name in ("U", "S"):
+            def dump_whole():
+                f = io.StringIO()
+                writer = ZdfStreamWriter(f)
+                writer.begin_object()
+                field = odb2zdf.ZdfField(odb, "Step-1", field_name)
+                writer.write_item(field.field_name, field.get_data())
+                writer.end_object()
+                return f.getvalue()
+
+            def dump_chunks(chunk_size):
+                f = io.StringIO()
+                writer = ZdfStreamWriter(f, chunk_size=chunk_size)
+                writer.begin_object()
+                odb2zdf.ZdfField(odb, "Step-1", field_name, chunk_size=chunk_size).dump(writer)
+                writer.end_object()
+                return f.getvalue()
+
+            # 峰值内存中不包括输出的文本
+            whole_time, expected = timeit(dump_whole, repeat=1)
+            tracemalloc.start()
+            dump_whole()
+            whole_peak = tracemalloc.get_traced_memory()[1] - len(expected)
+            tracemalloc.stop()
+            print(f"  {field_name:2s} n={size:>9d}  whole field  {whole_time:8.3f}s  peak {whole_peak / 2**20:8.1f}MB")
+            for chunk_size in chunk_sizes:
+                chunk_time, actual = timeit(lambda: dump_chunks(chunk_size), repeat=1)
+                assert actual == expected
+                tracemalloc.start()
+                dump_chunks(chunk_size)
+                chunk_peak = tracemalloc.get_traced_memory()[1] - len(actual)
+                tracemalloc.stop()
+                print(f"  {field_name:2s} n={size:>9d}  chunk {chunk_size:>6d} {chunk_time:8.3f}s"
+                      f"  peak {chunk_peak / 2**20:8.1f}MB")
+    ZdfRecordBuffer.spool_size = spool_size
+
+
+def iter_records(data):
+    """
+    按顺序遍历zdf字典中所有__isRecord__的__data__
+    """
+    if isinstance(data, dict):
+        if data.get("__isRecord__"):
+            yield data["__data__"]
+        else:
+            for value in data.values():
+                yield from iter_records(value)
+
+
+def bench_sidecar(odb2zdf, sizes):
+    """
+    比较json文本和二进制sidecar两种形式的文件大小、写出和读取的耗时, 并检查读取的数据一致
+    """
+    print("zdf size and load time: json text vs binary sidecar")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            odb_file = os.path.join(temp_dir, f"bench-{size}.odb")
+            with open(odb_file, "w") as f:
+                json.dump({"num_nodes": size, "num_steps": 2, "fields": ["U", "RF", "S", "LE"]}, f)
+            all_data = odb2zdf.ZdfAllData(odb_file, bulk=True)
+            json_file = os.path.join(temp_dir, f"bench-{size}.zdf")
+            sidecar_file = os.path.join(temp_dir, f"bench-{size}-sidecar.zdf")
+
+            def dump_json():
+                with open(json_file, "w") as f:
+                    all_data.dump(f)
+
+            def dump_sidecar():
+                with open(sidecar_file, "w") as f, open(sidecar_file + ".bin", "wb") as sidecar:
+                    all_data.dump(f, ZdfSidecar(sidecar, os.path.basename(sidecar_file) + ".bin"))
+
+            json_dump_time, _ = timeit(dump_json, repeat=1)
+            sidecar_dump_time, _ = timeit(dump_sidecar, repeat=1)
+            json_load_time, expected = timeit(lambda: load_zdf(json_file), repeat=1)
+            # mmap时只有访问数组才会读入, 这里把所有数组都读一遍, 与json的读取时间才有可比性
+            sidecar_load_time, actual = timeit(
+                lambda: [np.array(data) for data in iter_records(load_zdf(sidecar_file))], repeat=1)
+            for actual_data, expected_data in zip(actual, iter_records(expected)):
+                assert np.array_equal(actual_data, np.asarray(expected_data, dtype=actual_data.dtype))
+
+            json_size = os.path.getsize(json_file)
+            sidecar_size = os.path.getsize(sidecar_file) + os.path.getsize(sidecar_file + ".bin")
+            print(f"  n={size:>9d}  json {json_size / 2**20:8.2f}MB  sidecar {sidecar_size / 2**20:8.2f}MB"
+                  f"  ratio {json_size / sidecar_size:5.1f}x")
+            print(f"  n={size:>9d}  dump json {json_dump_time:8.3f}s  sidecar {sidecar_dump_time:8.3f}s"
+                  f"  load json {json_load_time:8.3f}s  sidecar {sidecar_load_time:8.3f}s"
+                  f"  speedup {json_load_time / sidecar_load_time:7.1f}x")
+
+
+def bench_lazy_reader(odb2zdf, sizes):
+    """
+    比较json.load整个zdf和ZdfLazyReader(建立索引、使用保存的索引、使用zdf末尾的目录)读取一个field的耗时,
+    并检查读取的数据一致
+    """
+    print("read one field: json.load of the whole zdf vs lazy reader")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            odb_file = os.path.join(temp_dir, f"bench-{size}.odb")
+            with open(odb_file, "w") as f:
+                json.dump({"num_nodes": size, "num_steps": 2, "fields": ["U", "RF", "S", "LE"]}, f)
+            zdf_file = os.path.join(temp_dir, f"bench-{size}.zdf")
+            toc_file = os.path.join(temp_dir, f"bench-{size}-toc.zdf")
+            all_data = odb2zdf.ZdfAllData(odb_file, bulk=True)
+            with open(zdf_file, "w") as f:
+                all_data.dump(f)
+            with open(toc_file, "w") as f:
+                all_data.dump(f, toc=True)
+            pointer = f"/result_sets/bench-{size}/items/Step-2/S element result"
+
+            def read_lazy(file_path):
+                with ZdfLazyReader(file_path) as reader:
+                    return reader.read(pointer)
+
+            json_time, expected = timeit(lambda: load_zdf(zdf_file), repeat=1)
+            index_time, actual = timeit(lambda: read_lazy(zdf_file), repeat=1)
+            cached_time, _ = timeit(lambda: read_lazy(zdf_file))
+            toc_time, toc_actual = timeit(lambda: read_lazy(toc_file))
+            expected = expected["result_sets"][f"bench-{size}"]["items"]["Step-2"]["S element result"]
+            for key in ("id", "value"):
+                assert np.array_equal(actual[key]["__data__"], np.asarray(expected[key]["__data__"]))
+                assert np.array_equal(toc_actual[key]["__data__"], actual[key]["__data__"])
+            print(f"  n={size:>9d}  zdf {os.path.getsize(zdf_file) / 2**20:8.2f}MB  json.load {json_time:8.3f}s"
+                  f"  lazy {index_time:8.3f}s  (cached index {cached_time:8.3f}s, toc {toc_time:8.3f}s)"
+                  f"  speedup {json_time / cached_time:7.1f}x")
+
+
+def bench_shared_ids(odb2zdf, sizes):
+    """
+    比较共享id数组前后的文件大小和写出耗时, 并检查读取的数据一致
+    """
+    print("zdf size: every id array vs shared id arrays")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            odb_file = os.path.join(temp_dir, f"bench-{size}.odb")
+            with open(odb_file, "w") as f:
+                json.dump({"num_nodes": size, "num_steps": 2, "fields": ["U", "RF", "NT11", "S", "LE", "PEEQ"]}, f)
+            all_data = odb2zdf.ZdfAllData(odb_file, bulk=True)
+            plain_file = os.path.join(temp_dir, f"bench-{size}.zdf")
+            shared_file = os.path.join(temp_dir, f"bench-{size}-shared.zdf")
+            shared_ids = ZdfSharedIds()
+
+            def dump(file_path, shared_ids):
+                with open(file_path, "w") as f:
+                    all_data.dump(f, shared_ids=shared_ids)
+
+            plain_time, _ = timeit(lambda: dump(plain_file, None), repeat=1)
+            shared_time, _ = timeit(lambda: dump(shared_file, shared_ids), repeat=1)
+            expected, actual = load_zdf(plain_file), load_zdf(shared_file)
+            expected["header"].pop("date"), actual["header"].pop("date")
+            assert actual == expected
+
+            plain_size, shared_size = os.path.getsize(plain_file), os.path.getsize(shared_file)
+            print(f"  n={size:>9d}  plain {plain_size / 2**20:8.2f}MB {plain_time:8.3f}s"
+                  f"  shared {shared_size / 2**20:8.2f}MB {shared_time:8.3f}s"
+                  f"  saved {1 - shared_size / plain_size:6.1%}  {shared_ids.describe()}")
+
+
+def bench_ranges(odb2zdf, sizes):
+    """
+    range编码的耗时和编码后的项数(range或单个id的个数), 并检查展开后与原数组一致
+    """
+    print("range encoding of id arrays")
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        # 连续的label; 每个instance从1开始编号并加上偏移量(中间有空缺); 删除了部分element之后的label
+        cases = {
+            "contiguous": np.arange(1, size + 1),
+            "instances": np.concatenate([np.arange(1, size // 4 + 1) + offset
+                                         for offset in range(0, 4 * size, size)]),
+            "sparse": np.flatnonzero(rng.random(size) > 0.01) + 1,
+        }
+        for name, ids in cases.items():
+            encode_time, segments = timeit(lambda: encode_ranges(ids))
+            expanded = np.asarray(ZdfRangeArray(segments)) if segments is not None else ids
+            assert np.array_equal(expanded, ids)
+            print(f"  {name:10s} n={size:>9d}  encode {encode_time:8.4f}s"
+                  f"  {len(ids):>9d} ids -> {len(segments) if segments is not None else len(ids):>7d} items")
+
+
+def bench_precision(odb2zdf, sizes, digits=6):
+    """
+    比较各种精度策略的文件大小(json文本和sidecar)和写出耗时, 并检查读取的数据在误差界以内
+    """
+    print(f"zdf size and dump time: precision policies (digits={digits})")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            odb_file = os.path.join(temp_dir, f"bench-{size}.odb")
+            with open(odb_file, "w") as f:
+                json.dump({"num_nodes": size, "num_steps": 2, "fields": ["U", "RF", "S", "LE"]}, f)
+            all_data = odb2zdf.ZdfAllData(odb_file, bulk=True)
+            zdf_file = os.path.join(temp_dir, f"bench-{size}.zdf")
+
+            def dump(precision):
+                with open(zdf_file, "w") as f:
+                    all_data.dump(f, precision=precision)
+                return os.path.getsize(zdf_file)
+
+            def dump_sidecar(precision):
+                with open(zdf_file, "w") as f, open(zdf_file + ".bin", "wb") as sidecar:
+                    all_data.dump(f, ZdfSidecar(sidecar, os.path.basename(zdf_file) + ".bin"), precision=precision)
+                return os.path.getsize(zdf_file) + os.path.getsize(zdf_file + ".bin")
+
+            reference_sidecar_size = dump_sidecar(None)
+            reference_time, reference_size = timeit(lambda: dump(None), repeat=1)
+            expected = [np.asarray(data) for data in iter_records(load_zdf(zdf_file))]
+            print(f"  n={size:>9d}  {'double repr':26s} {reference_size / 2**20:8.2f}MB  {reference_time:8.3f}s"
+                  f"  sidecar {reference_sidecar_size / 2**20:8.2f}MB")
+            for mode in ZdfPrecision.modes:
+                precision = ZdfPrecision(mode, digits)
+                sidecar_size = dump_sidecar(precision)
+                dump_time, dump_size = timeit(lambda: dump(precision), repeat=1)
+                # 按每种模式自己的定义重新计算误差: 逐个值的相对误差, 或相对于每一列最大值的误差
+                error = 0.0
+                for actual, reference in zip(iter_records(load_zdf(zdf_file)), expected):
+                    if reference.dtype.kind != "f":
+                        assert np.array_equal(actual, reference)
+                        continue
+                    actual = np.asarray(actual)
+                    if mode == "quantize":
+                        scale = np.maximum(np.abs(reference).max(axis=0), np.finfo(np.float64).tiny)
+                    else:
+                        scale = np.where(reference != 0, np.abs(reference), 1.0)
+                    error = max(error, float((np.abs(actual - reference) / scale).max(initial=0.0)))
+                assert error <= precision.error_bound * (1 + 1e-9), f"{mode}: error {error:.3g}"
+                print(f"  n={size:>9d}  {mode:26s} {dump_size / 2**20:8.2f}MB  {dump_time:8.3f}s"
+                      f"  size {reference_size / dump_size:4.2f}x  time {reference_time / dump_time:4.2f}x"
+                      f"  sidecar {sidecar_size / 2**20:8.2f}MB ({reference_sidecar_size / sidecar_size:4.2f}x)"
+                      f"  max error {error:.3g} (bound {precision.error_bound:.3g})")
+
+
+def bench_cache(odb2zdf, sizes):
+    """
+    比较没有缓存、缓存为空(提取并写入缓存)和缓存命中时的转换耗时, 并检查输出一致。
+    转换的耗时中写出zdf的部分与缓存无关, 因此另外比较只提取field(ZdfResultItems.get_data)的耗时, 命中时应更快
+    """
+    print("ZdfAllData.dump: extraction cache")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for size in sizes:
+            odb_file = os.path.join(temp_dir, f"bench-{size}.odb")
+            with open(odb_file, "w") as f:
+                json.dump({"num_nodes": size, "num_steps": 2, "fields": ["U", "RF", "S", "LE"]}, f)
+            cache_dir = os.path.join(temp_dir, f"cache-{size}")
+
+            def convert(cache):
+                f = io.StringIO()
+                odb2zdf.ZdfAllData(odb_file, cache=cache).dump(f)
+                return [line for line in f.getvalue().splitlines() if '"date"' not in line]
+
+            def extract(cache):
+                items = odb2zdf.ZdfAllData(odb_file, cache=cache).items
+                return timeit(items.get_data)
+
+            reference_time, expected = timeit(lambda: convert(None))
+            cold_cache, warm_cache = ZdfCache(cache_dir), ZdfCache(cache_dir)
+            cold_time, cold = timeit(lambda: convert(cold_cache), repeat=1)
+            warm_time, warm = timeit(lambda: convert(warm_cache))
+            assert cold == expected and warm == expected
+            extract_time, extracted = extract(None)
+            hit_time, hit = extract(ZdfCache(cache_dir))
+            assert hit.keys() == extracted.keys()
+            # 命中时只从缓存中逐块读取, 应比从odb中提取快
+            assert hit_time < extract_time, f"warm cache {hit_time:.3f}s is not faster than extracting {extract_time:.3f}s"
+            print(f"  n={size:>9d}  no cache {reference_time:8.3f}s  cold {cold_time:8.3f}s  warm {warm_time:8.3f}s"
+                  f"  speedup {reference_time / warm_time:5.2f}x  ({warm_cache.describe()})")
+            print(f"  n={size:>9d}  extract fields {extract_time:8.3f}s  from cache {hit_time:8.3f}s"
+                  f"  speedup {extract_time / hit_time:5.2f}x")
+
+
+def bench_server(odb2zdf, sizes, jobs=3):
+    """
+    比较每次启动新的python进程转换与提交给常驻的转换服务器(ZdfServer)时每个任务的耗时, 并检查输出一致
+    """
+    print("ZdfServer: cold process vs warm server")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(ROOT, "standin"), ROOT]))
+        odb_files, cold_times = {}, {}
+        # 先在没有服务器线程时启动新进程转换, 再启动服务器
+        for size in sizes:
+            odb_files[size] = os.path.join(temp_dir, f"bench-{size}.odb")
+            with open(odb_files[size], "w") as f:
+                json.dump({"num_nodes": size, "num_steps": 2, "fields": ["U", "S"]}, f)
+            command = [sys.executable, os.path.join(ROOT, "main1.8.py"), odb_files[size],
+                       os.path.join(temp_dir, f"cold-{size}.zdf")]
+            cold_times[size], _ = timeit(lambda: subprocess.run(command, env=env, check=True,
+                                                                stdout=subprocess.DEVNULL), repeat=jobs)
+
+        address = r"\\.\pipe\odb2zdf-benchmark" if sys.platform == "win32" else os.path.join(temp_dir, "server.sock")
+        authkey = b"benchmark"
+        server = odb2zdf.ZdfServer(odb2zdf._serve_job, address, authkey)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        server.ready.wait()
+        try:
+            for size in sizes:
+                warm_file = os.path.join(temp_dir, f"warm-{size}.zdf")
+
+                def convert_warm():
+                    events = list(submit([odb_files[size], warm_file], address, authkey))
+                    assert events[-1]["status"] == "ok", events[-1]
+
+                warm_time, _ = timeit(convert_warm, repeat=jobs)
+                with open(os.path.join(temp_dir, f"cold-{size}.zdf")) as f_cold, open(warm_file) as f_warm:
+                    assert ([line for line in f_cold if '"date"' not in line] ==
+                            [line for line in f_warm if '"date"' not in line])
+                print(f"  n={size:>9d}  cold {cold_times[size]:8.3f}s  warm {warm_time:8.3f}s  "
+                      f"saved {cold_times[size] - warm_time:6.3f}s per job")
+        finally:
+            list(request({"command": "shutdown"}, address, authkey))
+            thread.join()
+
+
+# bench_stages使用的模型: tetra10、hexa20、wedge15、S4和B31混合的mesh, 以及位移、带invariant的应力和标量field
+STAGE_ELEMENT_TYPES = ["C3D10", "C3D20R", "C3D15", "S4", "B31"]
+STAGE_FIELDS = ["U", "S", "PEEQ", "NT11"]
+
+
+def bench_stages(odb2zdf, sizes, save=None, compare=None, tolerance=0.25):
+    """
+    分别测量转换的每个阶段(ZdfModelMesh、ZdfElement.get_data、每个field的ZdfField.get_data以及写出)的耗时。
+    结果可以保存为json, 之后与保存的结果比较, 耗时超过基准的(1 + tolerance)倍(且至少慢5ms)时视为性能退化
+    :param save: 保存结果的json文件, 为None时不保存
+    :param compare: 作为基准的json文件, 为None时不比较
+    :param tolerance: 允许的相对耗时增加
+    :return: 是否没有性能退化
+    """
+    print(f"stages: elements {STAGE_ELEMENT_TYPES}, fields {STAGE_FIELDS}")
+    results = {}
+    for size in sizes:
+        odb = odbAccess.make_odb(num_nodes=size, fields=STAGE_FIELDS, element_types=STAGE_ELEMENT_TYPES)
+        stages = {
+            "ZdfModelMesh.get_data": odb2zdf.ZdfModelMesh(odb).get_data,
+            "ZdfElement.get_data": odb2zdf.ZdfElement(odb).get_data,
+        }
+        for field_name in STAGE_FIELDS:
+            stages[f"ZdfField.get_data[{field_name}]"] = odb2zdf.ZdfField(odb, "Step-1", field_name).get_data
+            stages[f"ZdfField.get_data[{field_name}, bulk]"] = odb2zdf.ZdfField(odb, "Step-1", field_name,
+                                                                                bulk=True).get_data
+        mesh_data = odb2zdf.ZdfModelMesh(odb).get_data()
+        field_data = {field_name: odb2zdf.ZdfField(odb, "Step-1", field_name, bulk=True).get_data()
+                      for field_name in STAGE_FIELDS}
+
+        def serialize(key, value):
+            writer = ZdfStreamWriter(io.StringIO())
+            writer.begin_object()
+            writer.write_item(key, value)
+            writer.end_object()
+
+        stages["serialize[mesh]"] = lambda: serialize("mesh", mesh_data)
+        stages["serialize[fields]"] = lambda: serialize("fields", field_data)
+
+        for stage, func in stages.items():
+            stage_time, _ = timeit(func)
+            results[f"{stage} n={size}"] = stage_time
+            print(f"  n={size:>9d}  {stage:36s} {stage_time:8.3f}s")
+
+    if save is not None:
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2)
+    passed = True
+    if compare is not None:
+        with open(compare) as f:
+            baseline = json.load(f)
+        for key, stage_time in results.items():
+            # 很短的阶段容易受计时误差影响, 至少慢5ms才视为退化
+            if key in baseline and stage_time > baseline[key] + max(baseline[key] * tolerance, 0.005):
+                passed = False
+                print(f"  REGRESSION {key}: {stage_time:.3f}s, baseline {baseline[key]:.3f}s")
+    return passed
+
+
+BENCHMARKS = {
+    "invariants": lambda odb2zdf, args: bench_invariants(odb2zdf, args.sizes),
+    "fields": lambda odb2zdf, args: bench_field_extraction(odb2zdf, args.sizes),
+    "elements": lambda odb2zdf, args: bench_elements(odb2zdf, args.sizes),
+    "connectivity": lambda odb2zdf, args: bench_connectivity(odb2zdf, args.sizes),
+    "nodal": lambda odb2zdf, args: bench_nodal_average(odb2zdf, args.sizes),
+    "parallel": lambda odb2zdf, args: bench_parallel(odb2zdf, args.sizes, args.workers),
+    "chunks": lambda odb2zdf, args: bench_chunks(odb2zdf, args.sizes),
+    "sidecar": lambda odb2zdf, args: bench_sidecar(odb2zdf, args.sizes),
+    "precision": lambda odb2zdf, args: bench_precision(odb2zdf, args.sizes, args.digits),
+    "lazy_reader": lambda odb2zdf, args: bench_lazy_reader(odb2zdf, args.sizes),
+    "shared_ids": lambda odb2zdf, args: bench_shared_ids(odb2zdf, args.sizes),
+    "ranges": lambda odb2zdf, args: bench_ranges(odb2zdf, args.sizes),
+    "cache": lambda odb2zdf, args: bench_cache(odb2zdf, args.sizes),
+    "server": lambda odb2zdf, args: bench_server(odb2zdf, args.sizes),
+    "stages": lambda odb2zdf, args: bench_stages(odb2zdf, args.sizes, args.save, args.compare, args.tolerance),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark odb2zdf with the stand-in odbAccess")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4],
+                        help="worker counts to compare with a serial conversion")
+    parser.add_argument("--digits", type=int, default=6,
+                        help="significant digits of the digits and quantize precision policies")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="benchmarks to run, all by default")
+    parser.add_argument("--save", metavar="JSON_FILE", help="save the stage timings as a baseline")
+    parser.add_argument("--compare", metavar="JSON_FILE",
+                        help="compare the stage timings with a saved baseline, exit with 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown of a stage that counts as a regression")
+    args = parser.parse_args()
+
+    odb2zdf = load_odb2zdf()
+    passed = True
+    for name in args.benchmarks:
+        # 只有bench_stages返回是否通过, 其它benchmark内部通过assert检查结果
+        passed = BENCHMARKS[name](odb2zdf, args) is not False and passed
+    sys.exit(0 if passed else 1)
@@ -1,46 +1,102 @@
 import numpy as np
 import odbAccess
 from abaqusConstants import *
+import argparse
+import collections
+import contextlib
+import fnmatch
+import glob
+import io
+import itertools
 import json
+import multiprocessing
+import operator
 import time
 import os
 import sys
+import traceback
+
+from zdf_cache import ZdfCache
+from zdf_compress import CODECS, ZdfCompressedFile, check_codec
+from zdf_profiler import ZdfProfiler, count_rows
+from zdf_server import ZdfServer, parse_address
+from zdf_reader import read_toc
+from zdf_writer import ZdfPrecision, ZdfSharedIds, ZdfSidecar, ZdfStreamWriter, ZdfTableOfContents
 
 #==============================================================================#
 
-class ZdfElement:
+class ZdfElementTypeRegistry:
     """
-    抽取odb中的element数据
-    目前只支持beam和continuum element
+    abaqus element type到zdf element type的转换表。
+    # abaqus element的命名规则参照
+    # 1. https://classes.engineering.wustl.edu/2009/spring/mase5513/abaqus/docs/v6.6/books/gss/default.htm?startat=ch03s01.html
+    # 2. http://130.149.89.49:2080/v2016/books/usb/default.htm?startat=pt06ch29s03ael14.html
+    每种abaqus type只按命名规则解析一次，之后直接查表。
+    用户可以通过register为某个abaqus type指定转换结果，或者通过register_prefix为某一类type添加解析函数，不需要修改代码。
     """
-    def __init__(self, odb):
-        self.odb = odb
+    # 决定 zdf_type_id and zdf_type_str, 第一层key是维度, 第二层key是node个数
+    continuum_id_and_str = {
+        1: {
+            2: ("edge2", 6),
+            3: ("edge3", 7),
+        },
+        2: {
+            3: ("faceq3", 20),
+            6: ("faceq6", 21),
+            4: ("faceq4", 22),
+            8: ("faceq8", 23),
+        },
+        3: {
+            4: ("tetra4", 27),
+            10: ("tetra10", 28),
 
-    @classmethod
-    def _node_order_transform(cls, aba_connect, element_type):
-        """
-        将abaqus的element的node顺序转换为zdf的node顺序。
-        相同形状的element，比如四面体，abaqus和zdf的node顺序是不一样的，所以需要转换。
-        :param aba_connect: abaqus element的node顺序
-        :param element_type: zwsim的element类型
-        :return:
-        """
-        node_order_map = {
-            "faceq6": [0, 1, 2, 4, 5, 3],
-            "tetra": [1, 0, 2, 3],
-            "tetra10": [1, 0, 2, 3, 6, 5, 4, 8, 7, 9],
-            "wedge15": [0, 1, 2, 3, 4, 5, 12, 13, 14, 7, 8, 6, 10, 11, 9],
-            "pyram13": [0, 1, 2, 3, 4, 9, 10, 11, 12, 5, 6, 7, 8]
+            8: ("hexa8", 29),
+            20: ("hexa20", 30),
+            27: ("hexa27", 31),
+
+            5: ("pyramid5", 32),
+            13: ("pyramid13", 33),
+            14: ("pyramid14", 34),
+
+            6: ("wedge6", 35),
+            15: ("wedge15", 36),
+            18: ("wedge18", 37)
         }
+    }
+    # continuum element名称的前缀和维度, CPS/CPE/CAX分别是平面应力、平面应变和轴对称单元
+    continuum_prefix_dims = {"C1D": 1, "C2D": 2, "C3D": 3, "CPS": 2, "CPE": 2, "CAX": 2}
+
+    # key是node个数
+    shell_id_and_str = {
+        3: ("tria3", 20),
+        4: ("quad4", 22),
+        8: ("quad8", 23),
+    }
 
-        if element_type not in node_order_map:
-            # 如果element type不在node_order_map中，则说明该element的node顺序不需要转换
-            return aba_connect
+    def __init__(self) -> None:
+        self._custom_types = {}  # 用户指定的转换结果, abaqus type -> (zdf type, type id)
+        self._parsed_types = {}  # 按命名规则解析得到的转换结果
+        self._parsers = [
+            ("B", self._abaqus_type_2_zdf_type_beam), # Beam
+            ("C", self._abaqus_type_2_zdf_type_continuum), # Continuum
+            ("S", self._abaqus_type_2_zdf_type_shell), # Shell
+            ("I", self._abaqus_type_2_zdf_type_coupling), # IDCOUP 耦合
+        ]
 
-        zdf_connect = []
-        for i in node_order_map[element_type]:
-            zdf_connect.append(aba_connect[i])
-        return zdf_connect
+    @staticmethod
+    def _leading_node_num(aba_type, start):
+        """
+        读取type名称中从start开始的数字, 即element的node个数
+        """
+        node_num_str = ""
+        for c in aba_type[start:]:
+            if c.isdigit():
+                node_num_str += c
+            else:
+                break
+        if not node_num_str:
+            raise ValueError(f"unknown abaqus element type: {aba_type}")
+        return int(node_num_str)
 
     @classmethod
     def _abaqus_type_2_zdf_type_beam(cls, aba_type):
@@ -63,166 +119,330 @@ class ZdfElement:
         :param aba_type: abaqus element的type, 以C开头
         :return: zdf element的type和type id
         """
-        dims, node_num, zdf_type_id = -1, -1, -1
-        zdf_type_str = ""
-        if aba_type[:3] == "C1D":
-            dims = 1
-        elif aba_type[:3] == "C2D":
-            dims = 2
-        elif aba_type[:3] == "C3D":
-            dims = 3
+        dims = cls.continuum_prefix_dims.get(aba_type[:3])
+        node_num = cls._leading_node_num(aba_type, 3)
+        if dims is None or node_num not in cls.continuum_id_and_str[dims]:
+            raise ValueError(f"unknown abaqus continuum element type: {aba_type}")
+        return cls.continuum_id_and_str[dims][node_num]
 
-        # 决定node_num
-        node_num_str = ""
-        for c in aba_type[3:]:
-            if c.isdigit():
-                node_num_str += c
-            else:
-                break
-        node_num = int(node_num_str)
+    @classmethod
+    def _abaqus_type_2_zdf_type_shell(cls, aba_type):
+        """
+        将abaqus的shell element的type转换为zdf的type
+        :param aba_type: abaqus element的type, 以S开头
+        :return: zdf element的type和type id
+        """
+        node_num = cls._leading_node_num(aba_type, 1)
+        # 检查node_num是否在字典中
+        if node_num not in cls.shell_id_and_str:
+            raise ValueError(f"Unknown number of nodes for shell element type: {aba_type}")
+        return cls.shell_id_and_str[node_num]
 
-        # 决定 zdf_type_id and zdf_type_str
-        id_and_str = {
-            1: {
-                2: ("edge2", 6),
-                3: ("edge3", 7),
-            },
-            2: {
-                3: ("faceq3", 20),
-                6: ("faceq6", 21),
-                4: ("faceq4", 22),
-                8: ("faceq8", 23),
-            },
-            3: {
-                4: ("tetra4", 27),
-                10: ("tetra10", 28),
+    @classmethod
+    def _abaqus_type_2_zdf_type_coupling(cls, aba_type):
+        """
+        将abaqus的耦合element(如IDCOUP3D)的type转换为zdf的type
+        zdf没有对应的耦合element type, 需要通过register或--element-types指定转换结果
+        :param aba_type: abaqus element的type, 以I开头
+        :return: zdf element的type和type id
+        """
+        raise ValueError(f"unmapped abaqus coupling element type: {aba_type}, "
+                         f"register it with --element-types")
 
-                8: ("hexa8", 29),
-                20: ("hexa20", 30),
-                27: ("hexa27", 31),
+    def register(self, aba_type, zdf_type, type_id):
+        """
+        指定某个abaqus type的转换结果, 优先于命名规则
+        :param aba_type: abaqus element的type, 如C3D10HS
+        :param zdf_type: zdf element的type, 如tetra10
+        :param type_id: zdf element的type id
+        :return:
+        """
+        self._custom_types[aba_type] = (zdf_type, type_id)
 
-                5: ("pyramid5", 32),
-                13: ("pyramid13", 33),
-                14: ("pyramid14", 34),
+    def register_prefix(self, prefix, parser):
+        """
+        为以prefix开头的abaqus type添加解析函数, 后添加的解析函数优先
+        :param prefix: abaqus element type的前缀, 如"M3D"
+        :param parser: 解析函数, 参数为abaqus type, 返回zdf element的type和type id
+        :return:
+        """
+        self._parsers.insert(0, (prefix, parser))
+        self._parsed_types.clear()
 
-                6: ("wedge6", 35),
-                7: ("wedge15", 36),
-                18: ("wedge18", 37)
-            }
-        }
+    def fingerprint(self):
+        """
+        :return: 转换规则的摘要, 用户添加的转换规则不同时, 缓存的element数据不能共用
+        """
+        return [sorted([aba_type, list(result)] for aba_type, result in self._custom_types.items()),
+                [[prefix, getattr(parser, "__qualname__", repr(parser))] for prefix, parser in self._parsers]]
 
-        return id_and_str[dims][node_num]
+    def snapshot(self):
+        """
+        :return: 当前的转换规则(用户指定的转换结果和解析函数), 用于之后通过restore恢复
+        """
+        return dict(self._custom_types), list(self._parsers)
 
-    def _abaqus_type_2_zdf_type_shell(cls,aba_type):
+    def restore(self, snapshot):
         """
-        将abaqus的shell element的type转换为zdf的type
-        :param aba_type: abaqus element的type, 以S开头
+        恢复到snapshot时的转换规则
+        :param snapshot: snapshot的返回值
+        """
+        custom_types, parsers = snapshot
+        self._custom_types = dict(custom_types)
+        self._parsers = list(parsers)
+        self._parsed_types.clear()
+
+    @contextlib.contextmanager
+    def scoped(self):
+        """
+        with语句中注册的转换规则只在with语句中有效, 结束时恢复原来的转换规则
+        """
+        snapshot = self.snapshot()
+        try:
+            yield self
+        finally:
+            self.restore(snapshot)
+
+    def load(self, file_path):
+        """
+        从json文件中读取用户指定的转换结果, 文件格式为 {"abaqus type": ["zdf type", type id], ...}
+        :param file_path: json文件的路径
+        :return:
+        """
+        with open(file_path) as f:
+            for aba_type, (zdf_type, type_id) in json.load(f).items():
+                self.register(aba_type, zdf_type, type_id)
+
+    def resolve(self, aba_type):
+        """
+        将abaqus的element的type转换为zdf的type
+        :param aba_type: abaqus element的type
         :return: zdf element的type和type id
         """
-        node_num, zdf_type_id = -1, -1
-        
-        # 决定node_num
-        node_num_str = ""
-        for c in aba_type[1:]:
-            if c.isdigit():
-                node_num_str += c
+        if aba_type in self._custom_types:
+            return self._custom_types[aba_type]
+        if aba_type not in self._parsed_types:
+            for prefix, parser in self._parsers:
+                if aba_type.startswith(prefix):
+                    self._parsed_types[aba_type] = parser(aba_type)
+                    break
             else:
-                break
-        node_num = int(node_num_str)
+                raise ValueError(f"unknown abaqus element type: {aba_type}")
+        return self._parsed_types[aba_type]
 
-        # 决定 zdf_type_id and zdf_type_str
-        id_and_str = {
-                3: ("tria3", 20),
-                4: ("quad4", 22),
-                8: ("quad8", 23),
-        }
 
-        # 检查node_num是否在字典中
-        if node_num not in id_and_str:
-            raise ValueError(f"Unknown number of nodes for shell element type: {aba_type}")
+# 默认的element type转换表, 所有ZdfElement共用
+element_type_registry = ZdfElementTypeRegistry()
+
+
+class ZdfInstanceOffsets:
+    """
+    多个instance合并为一个zdf mesh时的label偏移量。
+    odb中节点和element的label在每个instance内部编号，不同instance的label会重复，
+    合并时每个instance的label加上该instance的偏移量得到全局的label，偏移量为之前所有instance的最大label之和。
+    只有一个instance时偏移量为0，label不变
+    """
+    def __init__(self, odb) -> None:
+        self.instance_names = [] # instance的名称, 按odb中的顺序
+        self.node_offsets = {} # instance的名称 -> 节点label的偏移量
+        self.element_offsets = {} # instance的名称 -> element label的偏移量
+        node_offset, element_offset = 0, 0
+        for instance_name, instance in odb.rootAssembly.instances.items():
+            self.instance_names.append(instance_name)
+            self.node_offsets[instance_name] = node_offset
+            self.element_offsets[instance_name] = element_offset
+            node_offset += self._max_label(instance.nodes)
+            element_offset += self._max_label(instance.elements)
+
+    @staticmethod
+    def _max_label(objects):
+        # instance中的label不一定有序也不一定连续，逐个比较得到最大的label，保证各instance的全局label不会重叠
+        return max((obj.label for obj in objects), default=0)
+
+    def node_offset(self, instance):
+        """
+        :param instance: OdbInstance对象或instance的名称, 为None时(如assembly上的节点)偏移量为0
+        :return: 节点label的偏移量
+        """
+        if instance is None:
+            return 0
+        return self.node_offsets.get(getattr(instance, "name", instance), 0)
+
+    def element_offset(self, instance):
+        """
+        :param instance: OdbInstance对象或instance的名称, 为None时偏移量为0
+        :return: element label的偏移量
+        """
+        if instance is None:
+            return 0
+        return self.element_offsets.get(getattr(instance, "name", instance), 0)
+
+
+class ZdfElement:
+    """
+    抽取odb中的element数据
+    支持的element type参见ZdfElementTypeRegistry
+    """
+    def __init__(self, odb, type_registry=None, offsets=None):
+        """
+        :param odb: odb对象
+        :param type_registry: element type的转换表, 为None时使用默认的element_type_registry
+        :param offsets: ZdfInstanceOffsets对象, 为None时根据odb计算
+        """
+        self.odb = odb
+        self.type_registry = type_registry if type_registry is not None else element_type_registry
+        self.offsets = offsets if offsets is not None else ZdfInstanceOffsets(odb)
 
-        return id_and_str[node_num]
+    # 相同形状的element，比如四面体，abaqus和zdf的node顺序是不一样的，所以需要转换。
+    # 如果element type不在node_order_map中，则说明该element的node顺序不需要转换
+    node_order_map = {
+        "faceq6": [0, 1, 2, 4, 5, 3],
+        "tetra4": [1, 0, 2, 3],
+        "tetra10": [1, 0, 2, 3, 6, 5, 4, 8, 7, 9],
+        "wedge15": [0, 1, 2, 3, 4, 5, 12, 13, 14, 7, 8, 6, 10, 11, 9],
+        "pyramid13": [0, 1, 2, 3, 4, 9, 10, 11, 12, 5, 6, 7, 8]
+    }
+
+    @classmethod
+    def _node_order_transform(cls, connectivity, offsets, node_num, element_type):
+        """
+        从展开的connectivity中取出一组element的node，同时将abaqus的node顺序转换为zdf的node顺序。
+        取出和转换通过一次fancy indexing完成，不再为每个element构建list。
+        :param connectivity: 所有element的node依次展开得到的一维数组
+        :param offsets: 这组element的第一个node在connectivity中的位置
+        :param node_num: 这组element的node个数
+        :param element_type: zwsim的element类型
+        :return: 形状为(len(offsets), node_num)的数组
+        """
+        node_order = np.asarray(cls.node_order_map.get(element_type, range(node_num)))
+        return connectivity[offsets[:, None] + node_order[None, :]]
 
     def _abaqus_type_2_zdf_type(self, aba_type):
         """
         将abaqus的element的type转换为zdf的type
-        # abaqus element的命名规则参照
-        # 1. https://classes.engineering.wustl.edu/2009/spring/mase5513/abaqus/docs/v6.6/books/gss/default.htm?startat=ch03s01.html
-        # 2. http://130.149.89.49:2080/v2016/books/usb/default.htm?startat=pt06ch29s03ael14.html
         :param aba_type: abaqus element的type
         :return: zdf element的type和type id
         """
-        if aba_type[0] == "B": # Beam
-            return self._abaqus_type_2_zdf_type_beam(aba_type)
-        elif aba_type[0] == "C": # Continuum
-            return self._abaqus_type_2_zdf_type_continuum(aba_type)
-        elif aba_type[0] == "S": # Shell
-            return self._abaqus_type_2_zdf_type_shell(aba_type)
-        elif aba_type[0] == "I":# IDCOUP 耦合
-            return ("IDCOUP3D",000)
-        raise ValueError(f"unknown abaqus element type: {aba_type}")
-
+        return self.type_registry.resolve(aba_type)
 
     def get_data(self):
         """
         获取element的数据
         :return:
         """
-        elements = []
-        for part_name, part in self.odb.rootAssembly.instances.items():
-            elements = part.elements
-            break  # TODO：考虑多个part的情况，只取第一个part的element
+        # 每个instance的type序号、label和connectivity分别通过np.fromiter直接读入数组，不再逐个element追加到list
+        # abaqus element type -> 序号, 第一次遇到的type取下一个序号
+        aba_types = collections.defaultdict(itertools.count().__next__)
+        node_nums = []  # 每种type的node个数
+        type_indices, labels, connectivity, sizes = [], [], [], []
+        for instance_name, instance in self.odb.rootAssembly.instances.items():
+            elements = instance.elements
+            num_elements = len(elements)
+            instance_type_indices = np.fromiter(map(aba_types.__getitem__, map(operator.attrgetter("type"), elements)),
+                                                dtype=np.int32, count=num_elements)
+            # 每个instance的label和connectivity(即节点label)加上该instance的偏移量，得到全局的label
+            instance_labels = np.fromiter(map(operator.attrgetter("label"), elements),
+                                          dtype=np.int64, count=num_elements)
+            element_connectivity = list(map(operator.attrgetter("connectivity"), elements))
+            element_sizes = np.fromiter(map(len, element_connectivity), dtype=np.int64, count=num_elements)
+            instance_connectivity = np.fromiter(itertools.chain.from_iterable(element_connectivity),
+                                                dtype=np.int64, count=int(element_sizes.sum()))
+            # 这个instance中新出现的type, 以第一个element的node个数作为该type的node个数
+            node_nums.extend(int(element_sizes[np.argmax(instance_type_indices == type_index)])
+                             for type_index in range(len(node_nums), len(aba_types)))
+            type_indices.append(instance_type_indices)
+            labels.append(instance_labels + self.offsets.element_offset(instance_name))
+            connectivity.append(instance_connectivity + self.offsets.node_offset(instance_name))
+            sizes.append(element_sizes)
+
+        type_indices = np.concatenate(type_indices or [np.zeros(0, dtype=np.int32)])
+        labels = np.concatenate(labels or [np.zeros(0, dtype=np.int64)])
+        connectivity = np.concatenate(connectivity or [np.zeros(0, dtype=np.int64)])
+        sizes = np.concatenate(sizes or [np.zeros(0, dtype=np.int64)])
+        node_nums = np.array(node_nums, dtype=np.int64)
+        if np.any(sizes != node_nums[type_indices]):
+            raise ValueError("inconsistent node number for abaqus element type")
+        # 每个element的第一个node在connectivity中的位置
+        offsets = np.cumsum(sizes) - sizes
+
+        # 每种abaqus element type只转换一次，多种abaqus type可能对应同一种zdf type
+        zdf_types = {}  # zdf type -> (type id, 对应的abaqus type的序号)
+        for aba_type, type_index in aba_types.items():
+            zdf_type, type_id = self._abaqus_type_2_zdf_type(aba_type)
+            zdf_types.setdefault(zdf_type, (type_id, []))[1].append(type_index)
+
         typename2elements = {}
-        for element in elements:
-            # 遍历每一个element，根据type将element分类
-            zdf_type, type_id = self._abaqus_type_2_zdf_type(element.type)
-            if zdf_type not in typename2elements:
-                # 如果typename2elements中没有该type，则添加该type
-                typename2elements[zdf_type] = {
-                    "type id": type_id,
-                    "id" : {
-                        "__isRecord__": True,
-                        "__dims__": [],
-                        "__data__": []
-                    },
-                    "value": {
-                        "__isRecord__": True,
-                        "__dims__": [],
-                        "__data__": []
-                    }
+        for zdf_type, (type_id, aba_type_indices) in zdf_types.items():
+            if len(set(node_nums[aba_type_indices])) > 1:
+                raise ValueError(f"inconsistent node number for zdf element type: {zdf_type}")
+            node_num = int(node_nums[aba_type_indices[0]])
+            # 保持element在odb中的顺序
+            element_indices = np.flatnonzero(np.isin(type_indices, aba_type_indices))
+            typename2elements[zdf_type] = {
+                "type id": type_id,
+                "id" : {
+                    "__isRecord__": True,
+                    "__dims__": [len(element_indices)],
+                    "__data__": labels[element_indices]
+                },
+                "value": {
+                    "__isRecord__": True,
+                    "__dims__": [len(element_indices), node_num],
+                    "__data__": self._node_order_transform(connectivity, offsets[element_indices],
+                                                           node_num, zdf_type)
                 }
-            # 添加element的id和value
-            typename2elements[zdf_type]["id"]["__data__"].append(element.label)
-            typename2elements[zdf_type]["value"]["__data__"].append(self._node_order_transform(list(element.connectivity), zdf_type))
-
-        # 添加__dims__
-        for key in typename2elements:
-            typename2elements[key]["id"]["__dims__"] = [len(typename2elements[key]["id"]["__data__"])]
-            typename2elements[key]["value"]["__dims__"] = [len(typename2elements[key]["value"]["__data__"]),
-                                               len(typename2elements[key]["value"]["__data__"][0])]
+            }
         return typename2elements
 
 class ZdfModelMesh:
     """
     抽取odb中的model mesh数据, 包括node和element
+    所有instance合并为一个mesh, label的转换参见ZdfInstanceOffsets
     """
-    def __init__(self, odb) -> None:
+    def __init__(self, odb, offsets=None, cache=None) -> None:
+        """
+        :param odb: odb对象
+        :param offsets: ZdfInstanceOffsets对象, 为None时根据odb计算
+        :param cache: 该odb的ZdfOdbCache, 为None时不使用缓存
+        """
         self.odb = odb
-
-        # 获取所有节点的id和坐标
-        nodes = []
-        for part_name, part in self.odb.rootAssembly.instances.items():
-            nodes = part.nodes
-            break # TODO：考虑多个part的情况
-        self.node_ids = [] # 节点的id
-        self.coordinates = [] # 节点的坐标
-        for node in nodes:
-            self.node_ids.append(node.label)
-            self.coordinates.append(node.coordinates.tolist())
+        self.offsets = offsets if offsets is not None else ZdfInstanceOffsets(odb)
+        self.cache = cache
 
         # 获取所有element的数据
-        self.elements = ZdfElement(self.odb)
+        self.elements = ZdfElement(self.odb, offsets=self.offsets)
+
+    def _get_nodes_data(self):
+        """
+        获取所有节点的id和坐标。
+        节点数据只在需要写出时才读取，不在对象中长期保存，以减少内存占用
+        :return:
+        """
+        node_ids = [] # 节点的id
+        coordinates = [] # 节点的坐标
+        node_counts, node_offsets = [], [] # 每个instance的节点个数和label的偏移量
+        for instance_name, instance in self.odb.rootAssembly.instances.items():
+            num_nodes = len(node_ids)
+            for node in instance.nodes:
+                node_ids.append(node.label)
+                coordinates.append(node.coordinates)
+            node_counts.append(len(node_ids) - num_nodes)
+            node_offsets.append(self.offsets.node_offset(instance_name))
+        node_ids = np.array(node_ids, dtype=np.int64) + np.repeat(node_offsets, node_counts)
+        coordinates = np.asarray(coordinates).reshape(len(node_ids), -1)
 
+        return {
+            "id": {
+                "__isRecord__": True,
+                "__dims__": [len(node_ids)],
+                "__data__": node_ids
+            },
+            "value": {
+                "__isRecord__": True,
+                "__dims__": [len(node_ids), coordinates.shape[1]],
+                "__data__": coordinates
+            }
+        }
 
     def get_data(self):
         """
@@ -230,191 +450,947 @@ class ZdfModelMesh:
         :return:
         """
         result = {
-            "nodes" : {
-                "id": {
-                    "__isRecord__": True,
-                    "__dims__": [len(self.node_ids)],
-                    "__data__": self.node_ids if self.node_ids[0] is not None else list(range(1, len(self.node_ids) + 1))
-                },
-                "value": {
-                    "__isRecord__": True,
-                    "__dims__": [len(self.node_ids), len(self.coordinates[0])],
-                    "__data__": self.coordinates
-                }
-            },
-            "elements" : self.elements.get_data()
+            "nodes" : self._get_cached_data(["nodes"], self._get_nodes_data),
+            "elements" : self._get_cached_data(["elements", self.elements.type_registry.fingerprint()],
+                                               self.elements.get_data)
         }
 
         return result
 
+    def dump(self, writer):
+        """
+        将model mesh的数据逐块写入writer, 每一块写完后即释放
+        :param writer: ZdfStreamWriter对象
+        :return:
+        """
+        writer.write_item("nodes", self._get_cached_data(["nodes"], self._get_nodes_data))
+        writer.write_item("elements", self._get_cached_data(["elements", self.elements.type_registry.fingerprint()],
+                                                            self.elements.get_data))
+
+    def _get_cached_data(self, parts, compute):
+        if self.cache is None:
+            return compute()
+        return self.cache.get_or_compute(parts, compute)
+
+class ZdfInvariants:
+    """
+    根据field的分量数组批量计算invariant, 代替逐个FieldValue读取mises、maxPrincipal等属性。
+    invariant的定义与Abaqus一致:
+        MISES = sqrt(3/2 S':S'), PRESS = -trace(S)/3, INV3 = (9/2 S'.S':S')^(1/3), TRESCA = 最大主值 - 最小主值
+    其中S'为偏应力张量, 主值通过批量的特征值计算得到
+    """
+    # Abaqus中应变类field的剪切分量是工程剪应变(gamma = 2 * epsilon)，组装张量时需要除以2
+    STRAIN_FIELD_NAMES = ("E", "LE", "NE", "PE", "EE", "IE", "THE", "ER", "DE")
+
+    def __init__(self, field_name, component_labels) -> None:
+        """
+        :param field_name: field在odb中的名称, 如S, LE
+        :param component_labels: field的分量名称, 如("S11", "S22", "S33", "S12", "S13", "S23")
+        """
+        self.field_name = field_name
+        self.component_labels = list(component_labels)
+        self._tensor_cache = None
+        self._principal_cache = None
+
+    def get_data(self, data, invariant_symbols):
+        """
+        计算所有位置上的invariant
+        :param data: 分量数组, 形状为(n, 分量个数)
+        :param invariant_symbols: invariant的列表, 如field.validInvariants
+        :return: 形状为(n, len(invariant_symbols))的float64数组
+        """
+        self._tensor_cache, self._principal_cache = None, None
+        result = np.empty((len(data), len(invariant_symbols)))
+        for column, invariant_symbol in enumerate(invariant_symbols):
+            result[:, column] = self._get_invariant_data(data, invariant_symbol)
+        self._tensor_cache, self._principal_cache = None, None
+        return result
+
+    def _get_invariant_data(self, data, invariant_symbol):
+        if invariant_symbol == MAGNITUDE:
+            return np.sqrt(np.sum(np.square(data, dtype=np.float64), axis=1))
+        elif invariant_symbol == MISES:
+            deviator = self._deviator(data)
+            return np.sqrt(1.5 * np.sum(deviator * deviator, axis=(1, 2)))
+        elif invariant_symbol == TRESCA:
+            principals = self._principals(data)
+            return principals[:, 2] - principals[:, 0]
+        elif invariant_symbol == PRESS:
+            return -np.trace(self._tensor(data), axis1=1, axis2=2) / 3.0
+        elif invariant_symbol == INV3:
+            return np.cbrt(13.5 * np.linalg.det(self._deviator(data)))
+        elif invariant_symbol == MAX_PRINCIPAL:
+            return self._principals(data)[:, 2]
+        elif invariant_symbol == MID_PRINCIPAL:
+            return self._principals(data)[:, 1]
+        elif invariant_symbol == MIN_PRINCIPAL:
+            return self._principals(data)[:, 0]
+        elif invariant_symbol == MAX_INPLANE_PRINCIPAL:
+            center, radius = self._inplane_circle(data)
+            return center + radius
+        elif invariant_symbol == MIN_INPLANE_PRINCIPAL:
+            center, radius = self._inplane_circle(data)
+            return center - radius
+        elif invariant_symbol == OUTOFPLANE_PRINCIPAL:
+            return self._tensor(data)[:, 2, 2]
+        raise ValueError(f"unknown invariant: {invariant_symbol}")
+
+    def _tensor(self, data):
+        """
+        根据分量名称(如S12中的1和2)把分量数组组装为(n, 3, 3)的对称张量, 缺少的分量为0
+        """
+        if self._tensor_cache is None:
+            tensor = np.zeros((len(data), 3, 3))
+            is_strain = self.field_name in self.STRAIN_FIELD_NAMES
+            for column, label in enumerate(self.component_labels):
+                i, j = int(label[-2]) - 1, int(label[-1]) - 1
+                component = data[:, column].astype(np.float64)
+                if i != j and is_strain:
+                    component = component / 2.0
+                tensor[:, i, j] = component
+                tensor[:, j, i] = component
+            self._tensor_cache = tensor
+        return self._tensor_cache
+
+    def _deviator(self, data):
+        tensor = self._tensor(data)
+        return tensor - (np.trace(tensor, axis1=1, axis2=2) / 3.0)[:, None, None] * np.eye(3)
+
+    def _principals(self, data):
+        """
+        :return: 形状为(n, 3)的主值, 每一行从小到大排列
+        """
+        if self._principal_cache is None:
+            self._principal_cache = np.linalg.eigvalsh(self._tensor(data))
+        return self._principal_cache
+
+    def _inplane_circle(self, data):
+        """
+        1-2平面内的莫尔圆
+        :return: 圆心和半径
+        """
+        tensor = self._tensor(data)
+        center = (tensor[:, 0, 0] + tensor[:, 1, 1]) / 2.0
+        radius = np.hypot((tensor[:, 0, 0] - tensor[:, 1, 1]) / 2.0, tensor[:, 0, 1])
+        return center, radius
+
+
 class ZdfField:
     """
     抽取odb中的field数据, 包括位移、应力、应变等
     """
-    def __init__(self, odb, step_name, field_name) -> None:
+    def __init__(self, odb, step_name, field_name, bulk=False, frame=-1, offsets=None, cache=None,
+                 chunk_size=65536) -> None:
+        """
+        :param odb: odb对象
+        :param step_name: step的名称
+        :param field_name: field的名称
+        :param bulk: 是否通过bulkDataBlocks以NumPy数组的形式批量读取field的数据
+        :param frame: frame在step.frames中的序号, 默认为最后一个frame
+        :param offsets: ZdfInstanceOffsets对象, 用于将各instance中的label转换为全局的label, 为None时根据odb计算
+        :param cache: 该odb的ZdfOdbCache, 为None时不使用缓存
+        :param chunk_size: 逐块提取数据时每块的行数(FieldValue的个数)
+        """
         self.odb = odb
         self.step_name = step_name
         self.field_name = field_name
-        self.field = self.odb.steps[self.step_name].frames[-1].fieldOutputs[self.field_name]
+        self.odb_field_name = field_name # field在odb中的名称, field_name可能会加上"element result"
+        self.bulk = bulk
+        self.frame = frame
+        self.offsets = offsets if offsets is not None else ZdfInstanceOffsets(odb)
+        self.cache = cache
+        self.chunk_size = chunk_size
+        field = self.odb.steps[self.step_name].frames[self.frame].fieldOutputs[self.field_name]
 
         # 获取field的component labels, 包括mises, tresca, press， s11等
-        self.component_labels = (list(map(str, self.field.validInvariants))
-                                 + list(self.field.componentLabels))
+        self.valid_invariants = list(field.validInvariants)
+        self.component_labels = (list(map(str, self.valid_invariants))
+                                 + list(field.componentLabels))
+        self.invariants = ZdfInvariants(field_name, field.componentLabels)
+
+        self.position = field.locations[0].position
+        if self.position == INTEGRATION_POINT:
+            # ZwSim根据field名称中有无"element result"来判断是作用在element上的还是作用在节点上
+            self.field_name = self.field_name + " element result"
 
-        position = self.field.locations[0].position
-        if position == INTEGRATION_POINT:
+    def _get_field(self):
+        """
+        获取odb中的FieldOutput。
+        FieldOutput只在提取数据时获取，不在对象中保存，因此同时存在很多ZdfField(例如很多个frame)时也不会占用大量内存
+        :return:
+        """
+        field = self.odb.steps[self.step_name].frames[self.frame].fieldOutputs[self.odb_field_name]
+        if self.position == INTEGRATION_POINT:
             # 一般来说，ZwSim的仿真分析结果都是作用在节点或者元素上的，比如每个节点上的位移，
             # 但是abaqus中position为INTERGRATION_POINT的结果是作用在积分点上，这既不是节点也不是元素，
             # 所以我们需要把积分点上的数据转为在element质心(CENTROID)上的数据
-            self.field = self.field.getSubset(position=CENTROID)
-            # ZwSim根据field名称中有无"element result"来判断是作用在element上的还是作用在节点上
-            self.field_name = self.field_name + " element result"
+            field = field.getSubset(position=CENTROID)
+        return field
+
+    @property
+    def cache_key(self):
+        """
+        缓存中field数据的名称, 数据按chunk_size分块缓存(参见_iter_cached_chunks), 块的大小不同时不能共用
+        """
+        frame = self.frame % len(self.odb.steps[self.step_name].frames)
+        return ["field", self.step_name, frame, self.odb_field_name, self.bulk, self.chunk_size]
+
+    def extract_task(self):
+        """
+        :return: 在worker进程中提取这个field的任务参数, 参见_extract_field
+        """
+        return self.step_name, self.odb_field_name, self.bulk, self.frame, self.chunk_size
 
     def get_data(self):
+        """
+        获取field的全部数据, 即把各块拼接起来, 使用缓存时先从缓存中读取
+        :return:
+        """
         ids, values = [], []
-        node_ids,element_ids=[],[]
-        # 遍历所有节点的数据
-        for value in self.field.values:
-            element_ids.append(value.elementLabel)# 如果是单元上的场数据
-            node_ids.append(value.nodeLabel)# 如果是节点上的场数据
-
-            invariant_data = [self._get_invariant_data(value, invariant_symbol)
-                              for invariant_symbol in self.field.validInvariants]
-                # 如果 component_labels 为空，则跳过 values 的添加
-            if not self.component_labels:
-                values.append(invariant_data)  # 如果没有component_labels，则只添加invariant_data
+        for chunk_ids, chunk_values in self._iter_data_chunks():
+            ids.append(chunk_ids)
+            values.append(chunk_values)
+        if not values or values[0].shape[1] == 0:
+            return {}
+        return self._get_result(np.concatenate(ids), np.concatenate(values))
+
+    def _get_values(self, data, mises=None):
+        """
+        将invariant和分量拼接为field的值, invariant由ZdfInvariants根据分量批量计算
+        :param data: 分量数组, 形状为(n, 分量个数)
+        :param mises: odb中已经给出的mises, 没有则为None
+        :return: 形状为(n, invariant个数 + 分量个数)的数组
+        """
+        invariant_symbols = self.valid_invariants
+        # 如果 component_labels 为空，则只添加invariant的数据
+        num_columns = len(invariant_symbols) + (data.shape[1] if self.component_labels else 0)
+
+        values = np.empty((len(data), num_columns), dtype=data.dtype)
+        values[:, :len(invariant_symbols)] = self.invariants.get_data(data, invariant_symbols)
+        if mises is not None and MISES in invariant_symbols:
+            values[:, list(invariant_symbols).index(MISES)] = mises
+        if self.component_labels:
+            values[:, len(invariant_symbols):] = data
+        return values
+
+    def _get_result(self, ids, values):
+        return {
+            # data中有很多个字段，比如s11, s22, s33, mises, tresca等
+            # self.component_labels中包含了这些字段的名称f
+            "variables": self.component_labels,
+            "type": "translation",
+            "id": {
+                "__isRecord__": True,
+                "__dims__": [len(ids)],
+                "__data__": ids
+            },
+            "value": {
+                "__isRecord__": True,
+                "__dims__": [len(ids), values.shape[1]],
+                "__data__": values
+            }
+        }
+
+    def dump(self, writer):
+        """
+        逐块提取field的数据并写入writer。
+        值(value)每提取一块就写出一块, 内存中只保留当前的一块和所有的id(每行一个整数)
+        :param writer: ZdfStreamWriter对象, 应与self使用相同的chunk_size
+        :return:
+        """
+        chunks = self._iter_data_chunks()
+        first = next(chunks, None)
+        if first is None or first[1].shape[1] == 0:
+            writer.write_item(self.field_name, {})
+            return
+        writer.begin_object(self.field_name)
+        writer.write_item("variables", self.component_labels)
+        writer.write_item("type", "translation")
+        ids = []
+        buffer = writer.record_buffer()
+        for chunk_ids, chunk_values in itertools.chain([first], chunks):
+            ids.append(chunk_ids)
+            buffer.write(chunk_values)
+        ids = np.concatenate(ids)
+        writer.write_item("id", {"__isRecord__": True, "__dims__": [len(ids)], "__data__": ids})
+        writer.write_record("value", buffer)
+        writer.end_object()
+
+    def _iter_data_chunks(self):
+        """
+        :return: 逐块给出field数据的生成器, 使用缓存时为_iter_cached_chunks, 否则为_iter_chunks
+        """
+        return self._iter_cached_chunks() if self.cache is not None else self._iter_chunks()
+
+    def _iter_cached_chunks(self):
+        """
+        按块缓存field的数据: 每块是缓存中的一项, 所有块写入之后再写入块数(self.cache_key), 因此有块数时所有块都已写入。
+        命中时逐块从缓存中读取, 否则逐块提取, 每块写入缓存之后给出, 内存中只有当前的一块(与不使用缓存时相同)。
+        读取过程中某一块被删除(例如其它进程按LRU删除)时, 重新提取并跳过已经给出的行
+        :return: (id数组, 值数组)的生成器
+        """
+        rows = 0 # 已经从缓存中给出的行数
+        num_chunks = self.cache.get(self.cache_key)
+        if num_chunks is not None:
+            for index in range(num_chunks):
+                chunk = self.cache.get(self.cache_key + ["chunk", index], count=False)
+                if chunk is None:
+                    break
+                rows += len(chunk[0])
+                yield chunk
             else:
-            # 如果 component_labels 不为空，则将invariant_data和value.data添加到 values
+                return
+        num_chunks = 0
+        for ids, values in self._iter_chunks():
+            self.cache.put(self.cache_key + ["chunk", num_chunks], (ids, values), miss=False)
+            num_chunks += 1
+            if rows >= len(ids):
+                rows -= len(ids)
+                continue
+            yield ids[rows:], values[rows:]
+            rows = 0
+        self.cache.put(self.cache_key, num_chunks, miss=False)
+
+    def put_cache(self, data):
+        """
+        将调用者提取的数据(例如由worker进程提取, 即get_data的返回值)按chunk_size分块写入缓存, 计为一次miss
+        :param data: field的数据
+        """
+        num_chunks = 0
+        if data:
+            ids, values = data["id"]["__data__"], data["value"]["__data__"]
+            for start in range(0, len(ids), self.chunk_size):
+                self.cache.put(self.cache_key + ["chunk", num_chunks],
+                               (ids[start:start + self.chunk_size], values[start:start + self.chunk_size]), miss=False)
+                num_chunks += 1
+        self.cache.put(self.cache_key, num_chunks)
+
+    def _iter_chunks(self):
+        """
+        逐块提取field的数据, 每块chunk_size行(最后一块可能更少), 不会给出空的块。
+        bulk模式下按bulkDataBlocks读取, 否则逐个FieldValue读取, 两者都重新分成chunk_size行的块
+        :return: (id数组, 值数组)的生成器
+        """
+        field = self._get_field()
+        blocks = self._iter_bulk_blocks(field) if self.bulk else self._iter_value_blocks(field)
+        ids, values, rows = [], [], 0
+        for block_ids, block_values in blocks:
+            ids.append(block_ids)
+            values.append(block_values)
+            rows += len(block_values)
+            if rows < self.chunk_size:
+                continue
+            ids = ids[0] if len(ids) == 1 else np.concatenate(ids)
+            values = values[0] if len(values) == 1 else np.concatenate(values)
+            stop = rows - rows % self.chunk_size
+            for start in range(0, stop, self.chunk_size):
+                yield ids[start:start + self.chunk_size], values[start:start + self.chunk_size]
+            ids, values, rows = [ids[stop:]], [values[stop:]], rows - stop
+        if rows > 0:
+            yield np.concatenate(ids), np.concatenate(values)
+
+    def _iter_value_blocks(self, field):
+        """
+        逐个FieldValue读取field的数据, 每次读取chunk_size个
+        :param field: odb中的FieldOutput
+        :return: (id数组, 值数组)的生成器
+        """
+        field_values = iter(field.values)
+        position = 0 # 已经读取的FieldValue个数, 没有label时id为序号
+        while True:
+            chunk = list(itertools.islice(field_values, self.chunk_size))
+            if not chunk:
+                return
+            data = []
+            instance_names = [] # 每个值所在的instance
+            for value in chunk:
+                instance_names.append(None if value.instance is None else value.instance.name)
                 if isinstance(value.data, (list, np.ndarray)):
-                    values.append(invariant_data + value.data.tolist())  # 对于数组或列表，调用 .tolist()
+                    data.append(value.data)
                 else:
-                    values.append(invariant_data + [value.data])  # 对于单个数据，直接添加
-
-        # 过滤掉 node_ids 中的 None 值
-        node_ids = [node_id for node_id in node_ids if node_id is not None]
-        # 过滤掉 element_ids 中的 None 值
-        element_ids = [element_id for element_id in element_ids if element_id is not None]      
-        if node_ids :  # 如果 node_ids 不为空
-            ids = node_ids
-        elif element_ids :  # 如果 element_ids 为空
-            ids = element_ids
-
-        result={}
-        if len(values) > 0 and len(values[0]) > 0:
-            result = {
-                # data中有很多个字段，比如s11, s22, s33, mises, tresca等
-                # self.component_labels中包含了这些字段的名称f
-                "variables": self.component_labels,
-                "type": "translation",
-                "id": {
-                    "__isRecord__": True,
-                    "__dims__": [len(ids)],
-                    "__data__": ids if ids[0] is not None else list(range(1, len(ids) + 1))
-                },
-                "value": {
-                    "__isRecord__": True,
-                    "__dims__": [len(ids), len(values[0])],
-                    "__data__": values
-                }
-            }
-        return result
+                    data.append([value.data])  # 对于单个数据，转为只有一个分量的list
+            # invariant按块批量计算
+            values = self._get_values(np.asarray(data).reshape(len(data), -1))
+
+            # 节点上的场数据使用nodeLabel, 单元上的场数据使用elementLabel, 并加上所在instance的偏移量
+            node_offsets = self._get_instance_offsets(instance_names, self.offsets.node_offset)
+            element_offsets = self._get_instance_offsets(instance_names, self.offsets.element_offset)
+            ids = np.array([value.nodeLabel + node_offset if value.nodeLabel is not None
+                            else value.elementLabel + element_offset if value.elementLabel is not None
+                            else position + i + 1
+                            for i, (value, node_offset, element_offset)
+                            in enumerate(zip(chunk, node_offsets, element_offsets))], dtype=np.int64)
+            position += len(chunk)
+            yield ids, values
+
+    def _iter_bulk_blocks(self, field):
+        """
+        通过bulkDataBlocks批量读取field的数据。
+        label和data从读取到写出始终保存为连续的NumPy数组, 不再为每个FieldValue构建list
+        :param field: odb中的FieldOutput
+        :return: 每个block的(id数组, 值数组)的生成器
+        """
+        position = 0 # 已经读取的值的个数, 没有label时id为序号
+        for block in field.bulkDataBlocks:
+            data = np.asarray(block.data)
+            values = self._get_values(data.reshape(len(data), -1), block.mises)
 
+            # 每个block属于一个instance, label加上该instance的偏移量
+            if block.nodeLabels is not None: # 如果是节点上的场数据
+                ids = np.asarray(block.nodeLabels) + self.offsets.node_offset(block.instance)
+            elif block.elementLabels is not None: # 如果是单元上的场数据
+                ids = np.asarray(block.elementLabels) + self.offsets.element_offset(block.instance)
+            else:
+                ids = np.arange(position + 1, position + len(values) + 1)
+            position += len(values)
+            yield ids, values
 
     @staticmethod
-    def _get_invariant_data(value, invariant_symbol):
+    def _get_instance_offsets(instance_names, get_offset):
         """
-        获取invariant的数据
-        :param value:
-        :param invariant_symbol:
-        :return:
+        获取每个值所在instance的label偏移量，每个instance只查询一次
+        :param instance_names: 每个值所在的instance的名称
+        :param get_offset: ZdfInstanceOffsets.node_offset或ZdfInstanceOffsets.element_offset
+        :return: 每个值的偏移量
         """
-        if invariant_symbol == MAGNITUDE:
-            return value.magnitude
-        elif invariant_symbol == MISES:
-            return value.mises
-        elif invariant_symbol == TRESCA:
-            return value.tresca
-        elif invariant_symbol == PRESS:
-            return value.press
-        elif invariant_symbol == INV3:
-            return value.inv3
-        elif invariant_symbol == MAX_PRINCIPAL:
-            return value.maxPrincipal
-        elif invariant_symbol == MID_PRINCIPAL:
-            return value.midPrincipal
-        elif invariant_symbol == MIN_PRINCIPAL:
-            return value.minPrincipal
-        elif invariant_symbol == MAX_INPLANE_PRINCIPAL:
-            return value.maxInPlanePrincipal
-        elif invariant_symbol == MIN_INPLANE_PRINCIPAL:
-            return value.minInPlanePrincipal
-        elif invariant_symbol == OUTOFPLANE_PRINCIPAL:
-            return value.outOfPlanePrincipal
+        instance_indices = {}
+        codes = np.array([instance_indices.setdefault(name, len(instance_indices)) for name in instance_names],
+                         dtype=np.int64)
+        offsets = np.array([get_offset(name) for name in instance_indices], dtype=np.int64)
+        return offsets[codes].tolist() if len(codes) > 0 else []
+
+class ZdfNodalAverage:
+    """
+    积分点上的field的节点平均。
+    从odb中按ELEMENT_NODAL批量读取外推到每个element的每个节点上的值(每个element的每个节点一行)，同一个节点的所有行取平均。
+    平均逐块进行: 每块ELEMENT_NODAL的行通过二分查找得到所属节点在mesh所有节点中的序号，按序号累加到每个节点的和与行数上，
+    全部累加之后再相除。内存只与节点个数有关，不需要同时保存整个field的ELEMENT_NODAL数据, 也不需要scipy。
+    by为section或material时只在同一个section或material的element之间平均，每个section或material单独写出一个field，
+    交界处的节点在每个field中各有一个值，不会跨越材料的边界抹平
+    """
+    modes = ("all", "section", "material")
+
+    def __init__(self, odb, by="all", offsets=None) -> None:
+        """
+        :param odb: odb对象
+        :param by: all为所有element一起平均, section或material为只在同一个section或material的element之间平均
+        :param offsets: ZdfInstanceOffsets对象, 与field使用的相同, 为None时根据odb计算
+        """
+        self.odb = odb
+        self.by = by
+        self.offsets = offsets if offsets is not None else ZdfInstanceOffsets(odb)
+        self.groups = self._get_groups(odb, by) # section或material的名称 -> 其中的区域(OdbSet), by为all时为{None: None}
+        self._node_ids = None
+        self._node_lookup = None # 节点id -> 序号的查找表(不存在的id为-1), 节点id稀疏时为None
+
+    @staticmethod
+    def _get_groups(odb, by):
+        if by == "all":
+            return {None: None}
+        groups = {}
+        for instance in odb.rootAssembly.instances.values():
+            for assignment in instance.sectionAssignments:
+                name = assignment.sectionName
+                if by == "material":
+                    # beam general、connector等section没有material, 按section分组
+                    name = getattr(odb.sections[name], "material", None) or name
+                groups.setdefault(name, []).append(assignment.region)
+        return groups
+
+    def node_ids(self):
+        """
+        :return: mesh中所有节点的全局id(从小到大), 第一次调用时从odb中读取, 之后所有的field和frame共用
+        """
+        if self._node_ids is None:
+            node_ids = [np.fromiter(map(operator.attrgetter("label"), instance.nodes), dtype=np.int64,
+                                    count=len(instance.nodes)) + self.offsets.node_offset(instance_name)
+                        for instance_name, instance in self.odb.rootAssembly.instances.items()]
+            self._node_ids = np.unique(np.concatenate(node_ids or [np.zeros(0, dtype=np.int64)]))
+            # label一般是连续的, 此时直接查表比二分查找快; 查表的内存与最大的id成正比, id稀疏时仍然二分查找
+            if len(self._node_ids) > 0 and self._node_ids[-1] < 4 * len(self._node_ids) + 1024:
+                self._node_lookup = np.full(self._node_ids[-1] + 1, -1, dtype=np.int64)
+                self._node_lookup[self._node_ids] = np.arange(len(self._node_ids))
+        return self._node_ids
+
+    def node_index(self, node_ids):
+        """
+        :param node_ids: ELEMENT_NODAL一块中每一行的节点id
+        :return: 每一行所属节点在node_ids()中的序号
+        """
+        all_node_ids = self.node_ids()
+        if len(node_ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        if self._node_lookup is not None:
+            found = node_ids.min() >= 0 and node_ids.max() < len(self._node_lookup)
+            index = self._node_lookup[node_ids] if found else None
+            found = found and index.min() >= 0
+        else:
+            index = np.searchsorted(all_node_ids, node_ids)
+            found = index.max() < len(all_node_ids) and np.array_equal(all_node_ids[index], node_ids)
+        if not found:
+            raise ValueError("ELEMENT_NODAL data refers to a node that is not in the mesh")
+        return index
+
+    def average(self, blocks):
+        """
+        :param blocks: ELEMENT_NODAL数据的(节点id数组, 值数组)的迭代器, 值数组的形状为(行数, 分量个数)
+        :return: 节点id(从小到大, 只包括出现过的节点), 节点上的平均值(与值数组的类型相同); 没有数据时为None
+        """
+        sums, counts, dtype = None, np.zeros(len(self.node_ids()), dtype=np.int64), None
+        for node_ids, values in blocks:
+            index = self.node_index(node_ids)
+            if sums is None:
+                sums, dtype = np.zeros((len(counts), values.shape[1])), values.dtype
+            # 每个分量一次np.bincount, 得到这个block中每个节点的和
+            for column in range(values.shape[1]):
+                sums[:, column] += np.bincount(index, weights=values[:, column], minlength=len(counts))
+            counts += np.bincount(index, minlength=len(counts))
+        if sums is None:
+            return None
+        present = np.flatnonzero(counts)
+        return self.node_ids()[present], (sums[present] / counts[present, None]).astype(dtype)
+
+
+class ZdfNodalField(ZdfField):
+    """
+    积分点上的field按节点平均之后得到的节点field, 参见ZdfNodalAverage。
+    分量先在节点上平均, 再计算invariant。平均需要一个节点的所有行, 因此逐个bulkDataBlock累加到每个节点上，
+    平均之后再按chunk_size分块, 内存只与节点个数和一个block有关
+    """
+    def __init__(self, odb, step_name, field_name, nodal_average, group=None, frame=-1, offsets=None, cache=None,
+                 chunk_size=65536) -> None:
+        """
+        :param nodal_average: ZdfNodalAverage对象
+        :param group: 只平均nodal_average.groups中这个section或material中的element, 为None时平均所有的element
+        其它参数参见ZdfField
+        """
+        super().__init__(odb, step_name, field_name, True, frame, offsets, cache, chunk_size)
+        self.nodal_average = nodal_average
+        self.group = group
+        # 节点上的field, 名称中没有"element result"
+        self.field_name = field_name if group is None else f"{field_name} ({group})"
+
+    @property
+    def cache_key(self):
+        return super().cache_key + ["nodal", self.nodal_average.by, self.group]
+
+    def extract_task(self):
+        return super().extract_task() + (self.nodal_average.by, self.group)
+
+    def _get_subsets(self):
+        field = self.odb.steps[self.step_name].frames[self.frame].fieldOutputs[self.odb_field_name]
+        regions = self.nodal_average.groups[self.group]
+        if regions is None:
+            return [field.getSubset(position=ELEMENT_NODAL)]
+        return [field.getSubset(region=region, position=ELEMENT_NODAL) for region in regions]
+
+    def _iter_blocks(self):
+        """
+        :return: ELEMENT_NODAL数据每个block的(全局节点id数组, 值数组)的生成器
+        """
+        for subset in self._get_subsets():
+            for block in subset.bulkDataBlocks:
+                block_data = np.asarray(block.data)
+                yield (np.asarray(block.nodeLabels) + self.offsets.node_offset(block.instance),
+                       block_data.reshape(len(block_data), -1))
+
+    def _iter_chunks(self):
+        result = self.nodal_average.average(self._iter_blocks())
+        if result is None:
+            return
+        ids, averaged = result
+        for start in range(0, len(ids), self.chunk_size):
+            yield ids[start:start + self.chunk_size], self._get_values(averaged[start:start + self.chunk_size])
+
+
+class ZdfSelection:
+    """
+    选择需要提取的step、field和frame。
+    step和field通过glob模式(如"Step-*", "S*")选择: 先按include选择(为None时选择全部)，再去掉与exclude匹配的。
+    field的模式与field在odb中的名称(如S, U)匹配。
+    默认每个step只提取一个frame; history模式下提取step中的多个frame(时程结果)，可以按时间范围、间隔和最大个数抽取。
+    追加模式下，已经写入zdf的item(existing_items)不再提取; 最后写入的step增加了frame时重新提取, 替换原来的item
+    """
+    def __init__(self, steps=None, exclude_steps=None, fields=None, exclude_fields=None, frame=-1,
+                 history=False, frame_stride=1, time_window=None, max_frames=None, existing_items=None,
+                 last_item=None) -> None:
+        """
+        :param steps: 需要提取的step的模式列表, 为None时提取全部step
+        :param exclude_steps: 不需要提取的step的模式列表
+        :param fields: 需要提取的field的模式列表, 为None时提取全部field
+        :param exclude_fields: 不需要提取的field的模式列表
+        :param frame: 提取的frame在step.frames中的序号, 默认为最后一个frame, history模式下不使用
+        :param history: 是否提取step中的多个frame
+        :param frame_stride: history模式下每隔多少个frame提取一个
+        :param time_window: history模式下只提取frameValue在[start, end]范围内的frame, 为None时不限制
+        :param max_frames: history模式下每个step最多提取多少个frame, 超出时均匀抽取(保留第一个和最后一个)
+        :param existing_items: 已经写入zdf的item, {step名称: frame序号的集合}。
+                               history模式下跳过这些frame, 否则跳过这些step(每个step只能有一个item)
+        :param last_item: 最后写入zdf的item [step名称, frame序号], 可以被替换时给出, 参见ZdfManifest.replaceable_item。
+                          不是history模式时, 如果该step现在选择的frame与写入时不同(例如写入时step还在计算,
+                          之后增加了frame), 重新提取该step
+        """
+        self.steps = steps
+        self.exclude_steps = exclude_steps or []
+        self.fields = fields
+        self.exclude_fields = exclude_fields or []
+        self.frame = frame
+        self.history = history
+        self.frame_stride = frame_stride
+        self.time_window = time_window
+        self.max_frames = max_frames
+        self.existing_items = existing_items or {}
+        self.last_item = last_item
+
+    def select_frames(self, step_name, frames):
+        """
+        选择一个step中需要提取的frame
+        :param step_name: step的名称
+        :param frames: step.frames
+        :return: 需要提取的frame在frames中的序号(非负)列表
+        """
+        if not self.history:
+            # 已经写入的step中只有最后写入的一个可以替换
+            if step_name in self.existing_items and (self.last_item is None or self.last_item[0] != step_name):
+                return []
+            if not -len(frames) <= self.frame < len(frames):
+                raise ValueError(f"frame {self.frame} does not exist in step {step_name}, "
+                                 f"which has {len(frames)} frames")
+            frame = self.frame % len(frames)
+            return [] if frame in self.existing_items.get(step_name, ()) else [frame]
+
+        indices = range(len(frames))
+        if self.time_window is not None:
+            start, end = self.time_window
+            indices = [i for i in indices if start <= frames[i].frameValue <= end]
+        indices = list(indices)[::self.frame_stride]
+        if self.max_frames is not None and len(indices) > self.max_frames:
+            picks = np.unique(np.round(np.linspace(0, len(indices) - 1, self.max_frames)).astype(int))
+            indices = [indices[i] for i in picks]
+        existing_frames = self.existing_items.get(step_name, ())
+        return [i for i in indices if i not in existing_frames]
+
+    @staticmethod
+    def _match(name, include, exclude):
+        if include is not None and not any(fnmatch.fnmatchcase(name, pattern) for pattern in include):
+            return False
+        return not any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude)
+
+    def match_step(self, step_name):
+        return self._match(step_name, self.steps, self.exclude_steps)
+
+    def match_field(self, field_name):
+        return self._match(field_name, self.fields, self.exclude_fields)
+
 
 class ZdfStep:
-    def __init__(self, odb, step_name) -> None:
+    """
+    zdf中的一个result item, 对应odb中一个step的一个frame
+    """
+    def __init__(self, odb, step_name, bulk=False, selection=None, frame=None, offsets=None, cache=None,
+                 chunk_size=65536, nodal_average=None) -> None:
+        """
+        :param odb: odb对象
+        :param step_name: step的名称
+        :param bulk: 是否通过bulkDataBlocks批量读取field的数据, 参见ZdfField
+        :param selection: ZdfSelection对象, 为None时提取最后一个frame中的全部field
+        :param frame: frame在step.frames中的序号, 为None时由selection决定
+        :param offsets: ZdfInstanceOffsets对象, 为None时根据odb计算
+        :param cache: 该odb的ZdfOdbCache, 为None时不使用缓存
+        :param chunk_size: 逐块提取field数据时每块的行数, 参见ZdfField
+        :param nodal_average: ZdfNodalAverage对象, 指定时积分点上的field按节点平均后写出, 否则写出element质心上的值
+        """
         self.odb = odb
         self.step_name = step_name
+        self.offsets = offsets if offsets is not None else ZdfInstanceOffsets(odb)
+        self.selection = selection if selection is not None else ZdfSelection()
+        frames = self.odb.steps[self.step_name].frames
+        self.frame = frame if frame is not None else self.selection.select_frames(step_name, frames)[0]
+        if self.selection.history:
+            # 时程结果中每个frame是一个result item, time_value为frame的时间
+            self.item_name = f"{step_name}-Frame-{self.frame}"
+            self.time_value = frames[self.frame].frameValue
+        else:
+            self.item_name = step_name
+            self.time_value = 1.0
         self.fields = []
-        # 构建field对象
-        for field_name in self.odb.steps[self.step_name].frames[-1].fieldOutputs.keys():
-            self.fields.append(ZdfField(self.odb, self.step_name, field_name))
+        # 构建field对象, 没有选择的field不会创建ZdfField
+        for field_name in frames[self.frame].fieldOutputs.keys():
+            if not self.selection.match_field(field_name):
+                continue
+            field = ZdfField(self.odb, self.step_name, field_name, bulk, self.frame, self.offsets, cache, chunk_size)
+            if nodal_average is not None and field.position == INTEGRATION_POINT:
+                # 每个section或material一个field, 不分组时只有一个
+                self.fields.extend(ZdfNodalField(self.odb, self.step_name, field_name, nodal_average, group,
+                                                 self.frame, self.offsets, cache, chunk_size)
+                                   for group in nodal_average.groups)
+            else:
+                self.fields.append(field)
     
     def get_data(self):
         result = {
             "step" : self.odb.steps[self.step_name].number,
-            "time_value" : 1.0,
+            "time_value" : self.time_value,
         }
         result.update({field.field_name : field.get_data() for field in self.fields})
         return result
 
+    def dump(self, writer, field_data=None):
+        """
+        将step的数据写入writer, 每个field单独序列化，写完即释放
+        :param writer: ZdfStreamWriter对象
+        :param field_data: 按self.fields的顺序依次给出每个field数据的迭代器(例如由worker进程提取),
+                           为None时在当前进程中逐个提取: 使用共享id时提取完整的数据(以便按mesh的顺序重新排列,
+                           参见ZdfSharedIds), 否则逐块提取(或从缓存中逐块读取)和写出
+        :return:
+        """
+        writer.begin_object(self.item_name)
+        writer.write_item("step", self.odb.steps[self.step_name].number)
+        writer.write_item("time_value", self.time_value)
+        for field in self.fields:
+            if field_data is not None:
+                writer.write_item(field.field_name, next(field_data))
+            elif writer.shared_ids is not None:
+                writer.write_item(field.field_name, field.get_data())
+            else:
+                field.dump(writer)
+        writer.end_object()
+
 class ZdfResultItems:
-    def __init__(self, odb) -> None:
+    def __init__(self, odb, bulk=False, selection=None, offsets=None, cache=None, chunk_size=65536,
+                 nodal_average=None) -> None:
         self.odb = odb
-        self.step_names = self.odb.steps.keys()
+        self.selection = selection if selection is not None else ZdfSelection()
+        self.offsets = offsets if offsets is not None else ZdfInstanceOffsets(odb)
+        self.cache = cache
+        self.step_names = [step_name for step_name in self.odb.steps.keys() if self.selection.match_step(step_name)]
         self.steps = []
         for step_name in self.step_names:
-            if len(self.odb.steps[step_name].frames) > 0:
-                self.steps.append(ZdfStep(self.odb, step_name))
+            frames = self.odb.steps[step_name].frames
+            if len(frames) > 0:
+                for frame in self.selection.select_frames(step_name, frames):
+                    self.steps.append(ZdfStep(self.odb, step_name, bulk, self.selection, frame, self.offsets,
+                                              self.cache, chunk_size, nodal_average))
 
     def get_data(self):
-        return {step.step_name : step.get_data() for step in self.steps}
+        return {step.item_name : step.get_data() for step in self.steps}
+
+    def dump(self, writer, pool=None, window=1, progress=None):
+        """
+        将所有step的数据逐个写入writer
+        :param writer: ZdfStreamWriter对象
+        :param pool: 由_init_worker初始化的进程池, 为None时在当前进程中逐个提取field
+        :param window: 使用进程池时, 最多同时有多少个field在提取或等待写出
+        :param progress: 进度回调, 每写完一个item调用progress(已写出的item个数, item总数, item名称)
+        :return:
+        """
+        field_data = None
+        if pool is not None:
+            field_data = self._extract_fields(pool, window)
+        for index, step in enumerate(self.steps):
+            step.dump(writer, field_data)
+            if progress is not None:
+                progress(index + 1, len(self.steps), step.item_name)
+
+    def _extract_fields(self, pool, window):
+        """
+        由进程池提取所有的field, 按step和field的顺序返回结果。
+        缓存中已有的field不提交给进程池, 提取的结果在主进程中写入缓存
+        """
+        fields = [field for step in self.steps for field in step.fields]
+        cached = [self.cache is not None and self.cache.contains(field.cache_key) for field in fields]
+        # 每个(step, field)是一个提取任务，结果按提交的顺序写出
+        tasks = [field.extract_task() for field, is_cached in zip(fields, cached) if not is_cached]
+        results = _imap_ordered(pool, _extract_field, tasks, window)
+        for field, is_cached in zip(fields, cached):
+            if is_cached:
+                yield field.get_data()
+            else:
+                data = next(results)
+                if self.cache is not None:
+                    field.put_cache(data)
+                yield data
+
+
+#==============================================================================#
+# 多进程提取field: 每个worker进程各自以只读方式打开odb，进程之间只传递step和field的名称以及提取结果
+
+_worker_odb = None # worker进程中打开的odb
+_worker_offsets = None # 主进程计算的ZdfInstanceOffsets
+_worker_nodal_averages = {} # ZdfNodalAverage.by -> worker进程中的ZdfNodalAverage
+
+
+def _init_worker(odb_file_path, offsets):
+    global _worker_odb, _worker_offsets
+    _worker_odb = odbAccess.openOdb(odb_file_path, readOnly=True)
+    _worker_offsets = offsets
+
+
+def _extract_field(step_name, field_name, bulk, frame, chunk_size, nodal_average=None, group=None):
+    """
+    参数为ZdfField.extract_task()的返回值
+    """
+    if nodal_average is not None:
+        if nodal_average not in _worker_nodal_averages:
+            _worker_nodal_averages[nodal_average] = ZdfNodalAverage(_worker_odb, nodal_average, _worker_offsets)
+        return ZdfNodalField(_worker_odb, step_name, field_name, _worker_nodal_averages[nodal_average], group, frame,
+                             _worker_offsets, chunk_size=chunk_size).get_data()
+    return ZdfField(_worker_odb, step_name, field_name, bulk, frame, _worker_offsets,
+                    chunk_size=chunk_size).get_data()
+
+
+def _imap_ordered(pool, func, tasks, window):
+    """
+    将任务提交到进程池，并按提交的顺序返回结果。
+    最多同时有window个任务在运行或等待取走结果，避免写出较慢时结果在内存中堆积
+    :param pool: 进程池
+    :param func: 任务函数
+    :param tasks: 每个任务的参数
+    :param window: 同时提交的任务个数
+    :return: 结果的迭代器
+    """
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, task))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+class ZdfManifest:
+    """
+    记录一个zdf文件中已经写入的item, 保存在zdf文件旁的.manifest文件中，用于追加模式。
+    items_end是最后一个item之后(items关闭之前)的位置，追加时从这里截断并写入新的item，再重新关闭外层的object，
+    不需要读取或重写mesh和已有的step。
+    last_item_start记录最后一个item开始时的状态, 最后一个step增加了frame时从这里截断, 重新写出这个step
+    """
+    def __init__(self, items=None, items_end=0, size=0, sidecar_size=None, options=None, shared_ids=None,
+                 last_item_start=None) -> None:
+        """
+        :param items: 已经写入的item, [[step名称, frame序号], ...]
+        :param items_end: 最后一个item之后的位置(字节)
+        :param size: zdf文件的大小(字节), 用于检查zdf文件在写出之后没有被修改
+        :param sidecar_size: sidecar文件的大小(字节), 没有sidecar时为None
+        :param options: 影响输出格式的选项, 追加时必须相同
+        :param shared_ids: 已经写出的id数组的引用(ZdfSharedIds.references), 追加的item可以引用这些id, 不共享id时为None
+        :param last_item_start: 最后一个item开始时的{"position": 位置, "sidecar_size": sidecar文件的大小,
+                                "shared_ids": 已经写出的id数组的引用}, 没有item时为None
+        """
+        self.items = items if items is not None else []
+        self.items_end = items_end
+        self.size = size
+        self.sidecar_size = sidecar_size
+        self.options = options if options is not None else {}
+        self.shared_ids = shared_ids
+        self.last_item_start = last_item_start
+
+    @staticmethod
+    def path(zdf_file_path):
+        return zdf_file_path + ".manifest"
+
+    @classmethod
+    def load(cls, zdf_file_path):
+        """
+        :return: zdf文件的ZdfManifest, zdf文件或manifest不存在时返回None
+        """
+        manifest_path = cls.path(zdf_file_path)
+        if not (os.path.exists(zdf_file_path) and os.path.exists(manifest_path)):
+            return None
+        with open(manifest_path) as f:
+            return cls(**json.load(f))
+
+    def save(self, zdf_file_path):
+        with open(self.path(zdf_file_path), "w") as f:
+            json.dump(vars(self), f, indent=2)
+
+    def existing_items(self):
+        """
+        :return: {step名称: frame序号的集合}, 参见ZdfSelection
+        """
+        existing_items = {}
+        for step_name, frame in self.items:
+            existing_items.setdefault(step_name, set()).add(frame)
+        return existing_items
+
+    def replaceable_item(self):
+        """
+        :return: 可以被替换的最后一个item [step名称, frame序号], 参见ZdfSelection; 没有记录last_item_start时为None
+        """
+        return self.items[-1] if self.items and self.last_item_start is not None else None
 
 
 class ZdfAllData:
     """
     抽取odb中的全部数据
     """
-    def __init__(self, odb_file_path) -> None:
+    def __init__(self, odb_file_path, bulk=False, workers=1, selection=None, cache=None, chunk_size=65536,
+                 progress=None, nodal_average=None) -> None:
+        """
+        :param odb_file_path: odb文件的路径
+        :param bulk: 是否通过bulkDataBlocks批量读取field的数据, 参见ZdfField
+        :param workers: 提取field的进程数, 大于1时每个(step, field)由进程池中的worker提取
+        :param selection: ZdfSelection对象, 选择需要提取的step、field和frame
+        :param cache: ZdfCache对象, 指定时mesh和field的数据优先从缓存中读取
+        :param chunk_size: 逐块提取和写出field数据时每块的行数。
+                           单进程且不使用缓存时，每个field的值一块一块地提取和写出，内存占用与field的大小无关
+        :param progress: 进度回调, 每写完一个item调用progress(已写出的item个数, item总数, item名称)
+        :param nodal_average: 积分点上的field的节点平均方式(all、section或material), 参见ZdfNodalAverage;
+                              为None时写出element质心上的值
+        """
+        self.odb_file_path = odb_file_path
+        self.progress = progress
+        self.workers = workers
+        self.chunk_size = chunk_size
         self.model_name = os.path.basename(odb_file_path).split(".")[0]
-        self.odb = odbAccess.openOdb(odb_file_path)
-        self.items = ZdfResultItems(self.odb)
-        self.model_mesh = ZdfModelMesh(self.odb)
+        self.odb = odbAccess.openOdb(odb_file_path, readOnly=True)
+        # 所有instance合并为一个mesh, mesh和field使用相同的label偏移量
+        self.offsets = ZdfInstanceOffsets(self.odb)
+        self.cache = cache.bind(odb_file_path) if cache is not None else None
+        self.nodal_average = (ZdfNodalAverage(self.odb, nodal_average, self.offsets)
+                              if nodal_average is not None else None)
+        self.items = ZdfResultItems(self.odb, bulk, selection, self.offsets, self.cache, chunk_size,
+                                    self.nodal_average)
+        self.model_mesh = ZdfModelMesh(self.odb, self.offsets, self.cache)
+        self.replaced_item = None # 追加时重新写出的最后一个item, 参见append
+
+    def close(self):
+        """
+        关闭odb, 在同一个进程中转换多个odb时(参见convert_batch)释放odb占用的内存和文件
+        """
+        self.odb.close()
+
+    def _get_header(self):
+        return {
+            "version": 1.0,
+            "date": f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}",
+            "org": "ZWSoft",
+            "author": "",
+            "model": self.model_name,
+            "version_digest": "1.0.0,VERNUM:04/29/2022(9485:eccfecd9f9e4)",
+            "customize_prefix" : "zw_",
+            "zw_app": "ZW3D",
+        }
+
+    @staticmethod
+    def _get_global():
+        return {
+            "units" : {
+                "mass" : "Kilogram",
+                "length" : "Meter",
+                "time" : "Second",
+                "temperature" : "Kelvin",
+                "electric_current" : "Ampere",
+                "substance_amount" : "Mole",
+                "luminous_intensity" : "Candela",
+                "angle" : "Radian",
+            }
+        }
 
     def get_data(self):
         global_template = {
-            "header": {
-                "version": 1.0,
-                "date": f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}",
-                "org": "ZWSoft",
-                "author": "",
-                "model": self.model_name,
-                "version_digest": "1.0.0,VERNUM:04/29/2022(9485:eccfecd9f9e4)",
-                "customize_prefix" : "zw_",
-                "zw_app": "ZW3D",
-            },
-            "global" : {
-                "units" : {
-                    "mass" : "Kilogram",
-                    "length" : "Meter",
-                    "time" : "Second",
-                    "temperature" : "Kelvin",
-                    "electric_current" : "Ampere",
-                    "substance_amount" : "Mole",
-                    "luminous_intensity" : "Candela",
-                    "angle" : "Radian",
-                }
-            },
+            "header": self._get_header(),
+            "global" : self._get_global(),
             "model": {
                 "mesh" : self.model_mesh.get_data()
             },
@@ -427,13 +1403,575 @@ class ZdfAllData:
         }
         return global_template
 
+    def dump(self, f, sidecar=None, precision=None, shared_ids=None, range_ids=False, toc=False,
+             delta_connectivity=False):
+        """
+        以流式的方式将全部数据写入zdf文件。
+        与json.dump(self.get_data(), f, indent=2)的结果相同，但不会在内存中构建完整的字典，
+        header/global、mesh以及每个step中的每个field依次写出，写完即释放
+        :param f: 以文本模式打开的zdf文件对象
+        :param sidecar: ZdfSidecar对象, 指定时__isRecord__的__data__写入二进制sidecar文件
+        :param precision: ZdfPrecision对象, 指定时field的值和节点坐标按精度策略写出, 策略和误差界记录在header中
+        :param shared_ids: ZdfSharedIds对象, 指定时与mesh或之前的field相同的id数组替换为引用
+        :param range_ids: 是否将id数组中连续的label编码为range, 参见zdf_writer.encode_ranges
+        :param toc: 是否在zdf的末尾写出目录, 参见zdf_writer.ZdfTableOfContents
+        :param delta_connectivity: 是否将element的连接关系按行编码为差, 参见zdf_writer.encode_delta。
+                                   只影响mesh, 追加时mesh不会重写, 因此不需要与追加时相同
+        :return: ZdfManifest对象, 用于之后向这个zdf文件追加新的item
+        """
+        writer = ZdfStreamWriter(f, sidecar=sidecar, precision=precision, chunk_size=self.chunk_size,
+                                 shared_ids=shared_ids, range_ids=range_ids,
+                                 toc=ZdfTableOfContents() if toc else None, delta_connectivity=delta_connectivity)
+        header = self._get_header()
+        if precision is not None:
+            header[header["customize_prefix"] + "precision"] = {
+                "mode": precision.mode,
+                "digits": precision.digits,
+                "error_bound": precision.error_bound,
+            }
+        writer.begin_object()
+        writer.write_item("header", header)
+        writer.write_item("global", self._get_global())
+
+        writer.begin_object("model")
+        writer.begin_object("mesh")
+        self.model_mesh.dump(writer)
+        writer.end_object()
+        writer.end_object()
+
+        writer.begin_object("result_sets")
+        writer.begin_object(os.path.basename(self.model_name).split(".")[0])
+        writer.write_item("analysis", 1)
+        writer.begin_object("items")
+        options = self._get_options(sidecar, precision, shared_ids, range_ids, toc)
+        return self._dump_items(writer, ZdfManifest(options=options), sidecar)
+
+    def append(self, f, manifest, sidecar=None, precision=None, shared_ids=None, range_ids=False, toc=False):
+        """
+        向已有的zdf文件追加新的item, mesh和已有的item不会重写。
+        self.items中应只包含新的item, 即selection的existing_items为manifest.existing_items()
+        :param f: 以"r+"模式打开的zdf文件对象
+        :param manifest: zdf文件的ZdfManifest
+        :param sidecar: ZdfSidecar对象, 其offset为manifest.sidecar_size; zdf没有sidecar时为None
+        :param precision: ZdfPrecision对象, 与写出zdf文件时相同
+        :param shared_ids: ZdfSharedIds对象, 其references为manifest.shared_ids; zdf没有共享id时为None。
+                           之前写出的id数组只记录了hash, 追加的item不会按它们的顺序重新排列
+        :param range_ids: 是否将id数组中连续的label编码为range, 与写出zdf文件时相同
+        :param toc: 是否写出目录, 与写出zdf文件时相同。已有的目录从zdf中读取, 追加的item加入其中后重新写出
+        :return: 更新后的ZdfManifest
+        """
+        f.seek(0, os.SEEK_END)
+        if f.tell() != manifest.size:
+            raise ValueError("the zdf file was modified after it was written, cannot append to it")
+        options = self._get_options(sidecar, precision, shared_ids, range_ids, toc)
+        if options != manifest.options:
+            raise ValueError(f"append options {options} differ from the options of the zdf file {manifest.options}")
+        # 目录在items之后, 截断之前读取
+        toc = ZdfTableOfContents(read_toc(f.name)) if toc else None
+        items_end = manifest.items_end
+        last_item = manifest.replaceable_item()
+        if (last_item is not None and not self.items.selection.history
+                and any(step.step_name == last_item[0] for step in self.items.steps)):
+            # 最后一个step增加了frame, 从它开始的位置截断后重新写出(目录中同名的item也会被替换)
+            start = manifest.last_item_start
+            self.replaced_item = manifest.items[-1]
+            manifest.items = manifest.items[:-1]
+            items_end = start["position"]
+            if sidecar is not None:
+                sidecar.offset = start["sidecar_size"]
+            if shared_ids is not None:
+                shared_ids.references = dict(start["shared_ids"] or {})
+        f.seek(items_end)
+        f.truncate()
+        if sidecar is not None:
+            sidecar.f.seek(sidecar.offset)
+            sidecar.f.truncate()
+        writer = ZdfStreamWriter(f, sidecar=sidecar, precision=precision, chunk_size=self.chunk_size,
+                                 shared_ids=shared_ids, range_ids=range_ids, toc=toc)
+        # 最外层、result_sets、result set和items共4层object还没有关闭
+        writer.resume(["result_sets", os.path.basename(self.model_name).split(".")[0], "items"],
+                      is_empty=not manifest.items)
+        return self._dump_items(writer, manifest, sidecar)
+
+    def _dump_items(self, writer, manifest, sidecar):
+        """
+        写出所有的item, 然后关闭items及外层的object
+        :return: 加上新的item后的manifest
+        """
+        # 每个item开始时的状态, 最后一个item的状态记录在manifest中
+        item_starts = [self._get_item_start(writer, sidecar)]
+
+        def progress(done, total, item_name):
+            item_starts[:] = [item_starts[-1], self._get_item_start(writer, sidecar)]
+            if self.progress is not None:
+                self.progress(done, total, item_name)
+
+        if self.workers > 1:
+            with multiprocessing.Pool(self.workers, _init_worker, (self.odb_file_path, self.offsets)) as pool:
+                self.items.dump(writer, pool, window=2 * self.workers, progress=progress)
+        else:
+            self.items.dump(writer, progress=progress)
+        if self.items.steps:
+            manifest.last_item_start = item_starts[0]
+        manifest.items = manifest.items + [[step.step_name, step.frame] for step in self.items.steps]
+        manifest.items_end = writer.f.tell()
+        writer.end_object()
+        writer.end_object()
+        writer.end_object()
+
+        if writer.toc is not None:
+            self._dump_toc(writer)
+        writer.end_object()
+        manifest.size = writer.f.tell()
+        manifest.sidecar_size = sidecar.offset if sidecar is not None else None
+        manifest.shared_ids = writer.shared_ids.references if writer.shared_ids is not None else None
+        return manifest
+
+    @staticmethod
+    def _get_item_start(writer, sidecar):
+        return {
+            "position": writer.f.tell(),
+            "sidecar_size": sidecar.offset if sidecar is not None else None,
+            "shared_ids": dict(writer.shared_ids.references) if writer.shared_ids is not None else None,
+        }
+
+    def _dump_toc(self, writer):
+        """
+        在最外层的object的末尾写出目录, 之后是目录在文件中的范围, 读取时从文件末尾找到目录(参见zdf_reader.read_toc)
+        """
+        prefix = self._get_header()["customize_prefix"]
+        writer.write_item(prefix + "toc_range", writer.write_toc(prefix + "toc"))
+
+    def _get_options(self, sidecar, precision, shared_ids, range_ids, toc):
+        return {
+            "history": self.items.selection.history,
+            # frame的选择方式不同时, 追加的frame与已有的frame不是同一种抽取方式
+            "frame": self.items.selection.frame,
+            "frame_stride": self.items.selection.frame_stride,
+            "time_window": list(self.items.selection.time_window) if self.items.selection.time_window else None,
+            "max_frames": self.items.selection.max_frames,
+            "sidecar": sidecar.file_name if sidecar is not None else None,
+            "precision": [precision.mode, precision.digits] if precision is not None else None,
+            "shared_ids": shared_ids is not None,
+            "range_ids": range_ids,
+            "nodal_average": self.nodal_average.by if self.nodal_average is not None else None,
+            "toc": toc,
+        }
+
+
+def instrument(profiler):
+    """
+    对转换的各个阶段进行性能分析, 参见ZdfProfiler。
+    使用进程池时field在worker进程中提取, 报告中只有主进程中的阶段(等待和写出field的时间计入ZdfResultItems.dump)
+    :param profiler: ZdfProfiler对象
+    :return:
+    """
+    profiler.instrument(ZdfAllData, "get_data", lambda self: self.model_name)
+    profiler.instrument(ZdfAllData, "dump", lambda self, *args: self.model_name)
+    profiler.instrument(ZdfAllData, "append", lambda self, *args: self.model_name)
+    profiler.instrument(ZdfModelMesh, "get_data")
+    profiler.instrument(ZdfModelMesh, "dump")
+    profiler.instrument(ZdfModelMesh, "_get_nodes_data")
+    profiler.instrument(ZdfElement, "get_data")
+    profiler.instrument(ZdfResultItems, "get_data")
+    profiler.instrument(ZdfResultItems, "dump")
+    profiler.instrument(ZdfStep, "get_data", lambda self: self.item_name)
+    profiler.instrument(ZdfStep, "dump", lambda self, *args: self.item_name)
+    profiler.instrument(ZdfField, "get_data", lambda self: f"{self.step_name}/{self.frame}/{self.field_name}")
+    profiler.instrument(ZdfField, "dump", lambda self, *args: f"{self.step_name}/{self.frame}/{self.field_name}")
+    profiler.instrument(ZdfStreamWriter, "write_item", lambda self, key, value: key,
+                        get_rows=lambda self, key, value: count_rows(value))
+    profiler.instrument(ZdfStreamWriter, "write_record", lambda self, key, buffer: key,
+                        get_rows=lambda self, key, buffer: buffer.rows)
+
+
+def convert(args, odb_file_path, zdf_file_path, progress=None):
+    """
+    按命令行参数转换一个odb文件
+    :param args: 命令行参数, 参见make_parser
+    :param odb_file_path: odb文件的路径
+    :param zdf_file_path: zdf文件的路径, 压缩时加上压缩格式的扩展名
+    :param progress: 进度回调, 参见ZdfAllData
+    :return: 转换结果的说明, 每项为一行
+    """
+    profiler = None
+    if args.profile:
+        profiler = ZdfProfiler(memory=args.profile_memory)
+        instrument(profiler)
+    manifest = ZdfManifest.load(zdf_file_path) if args.append else None
+    selection = ZdfSelection(args.steps, args.exclude_steps, args.fields, args.exclude_fields, args.frame,
+                             args.history, args.frame_stride, args.time_window, args.max_frames,
+                             manifest.existing_items() if manifest is not None else None,
+                             manifest.replaceable_item() if manifest is not None else None)
+    precision = ZdfPrecision(args.precision, args.digits) if args.precision else None
+    shared_ids = None
+    if args.share_ids:
+        shared_ids = ZdfSharedIds(manifest.shared_ids if manifest is not None else None)
+    cache = ZdfCache(args.cache_dir, int(args.cache_size * 2**20)) if args.cache_dir else None
+    all_data = ZdfAllData(odb_file_path, bulk=args.bulk, workers=args.workers, selection=selection, cache=cache,
+                          chunk_size=args.chunk_size, progress=progress, nodal_average=args.nodal_average)
+    try:
+        sidecar_path = zdf_file_path + ".bin"
+        zdf_path = zdf_file_path
+        compressed = None
+        if args.compress:
+            extension = CODECS[args.compress][0]
+            zdf_path = zdf_path if zdf_path.endswith(extension) else zdf_path + extension
+            output = open(zdf_path, "wb")
+            f = compressed = ZdfCompressedFile(output, args.compress, args.compress_level, args.compress_workers)
+        else:
+            # 追加时打开已有的文件并从manifest记录的位置继续写入, 否则重新写出整个文件
+            output = f = open(zdf_path, "r+" if manifest is not None else "w")
+        with output:
+            if args.sidecar:
+                with open(sidecar_path, "r+b" if manifest is not None else "wb") as sidecar_file:
+                    if manifest is not None:
+                        sidecar = ZdfSidecar(sidecar_file, os.path.basename(sidecar_path), manifest.sidecar_size or 0)
+                        manifest = all_data.append(f, manifest, sidecar, precision, shared_ids, args.range_ids,
+                                                   args.toc)
+                    else:
+                        manifest = all_data.dump(f, ZdfSidecar(sidecar_file, os.path.basename(sidecar_path)),
+                                                 precision, shared_ids, args.range_ids, args.toc,
+                                                 args.delta_connectivity)
+            elif manifest is not None:
+                manifest = all_data.append(f, manifest, precision=precision, shared_ids=shared_ids,
+                                           range_ids=args.range_ids, toc=args.toc)
+            else:
+                manifest = all_data.dump(f, precision=precision, shared_ids=shared_ids, range_ids=args.range_ids,
+                                         toc=args.toc, delta_connectivity=args.delta_connectivity)
+            if compressed is not None:
+                compressed.close()
+    finally:
+        all_data.close()
+        if profiler is not None:
+            profiler.restore()
+
+    messages = []
+    if compressed is not None:
+        # 压缩的zdf不能追加, 只保存随机读取用的index
+        compressed.save_index(zdf_path)
+        messages.append(f"compressed: {compressed.codec}, {len(compressed.blocks)} blocks, "
+                        f"{compressed.tell() / 2**20:.1f}MB -> {compressed.size / 2**20:.1f}MB")
+    elif args.append:
+        # 只有追加模式才写出manifest, 第一次转换时也使用--append
+        manifest.save(zdf_path)
+    elif os.path.exists(ZdfManifest.path(zdf_path)):
+        # 重新写出的zdf与之前追加时的manifest不再对应
+        os.remove(ZdfManifest.path(zdf_path))
+    if profiler is not None:
+        profiler.save(zdf_file_path + ".profile.json", odb_file=os.path.abspath(odb_file_path),
+                      zdf_file=os.path.abspath(zdf_path), workers=args.workers, bulk=args.bulk)
+    if args.append:
+        replaced = f" ({all_data.replaced_item[0]} rewritten)" if all_data.replaced_item is not None else ""
+        messages.append(f"{len(all_data.items.steps)} new items{replaced}, {len(manifest.items)} items in total")
+    if precision is not None:
+        messages.append(f"precision: {precision.describe()}, max error {precision.max_error:.3g}")
+    if shared_ids is not None:
+        messages.append(shared_ids.describe())
+    if cache is not None:
+        messages.append(cache.describe())
+    return messages
+
+
+def find_odb_files(sources):
+    """
+    :param sources: odb文件、目录(其中所有的*.odb)、glob模式(如"D:\\jobs\\**\\*.odb")
+                    或者每行一个odb路径的列表文件(空行和#开始的行被忽略, 相对路径相对于列表文件所在的目录)
+    :return: 去掉重复之后的odb文件路径, 按sources的顺序, 目录和glob模式中的文件按名称排序
+    """
+    odb_file_paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            odb_file_paths.extend(sorted(glob.glob(os.path.join(glob.escape(source), "*.odb"))))
+        elif os.path.isfile(source) and not source.lower().endswith(".odb"):
+            directory = os.path.dirname(source)
+            with open(source) as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        odb_file_paths.append(os.path.join(directory, line))
+        elif os.path.isfile(source):
+            odb_file_paths.append(source)
+        else:
+            odb_file_paths.extend(sorted(glob.glob(source, recursive=True)))
+    unique = {}
+    for odb_file_path in odb_file_paths:
+        unique.setdefault(os.path.normcase(os.path.abspath(odb_file_path)), odb_file_path)
+    return list(unique.values())
+
+
+def batch_zdf_path(odb_file_path, output_dir=None):
+    """
+    :param odb_file_path: odb文件的路径
+    :param output_dir: 输出目录, 为None时zdf写在odb旁边
+    :return: zdf文件的路径, 与odb同名
+    """
+    zdf_file_name = os.path.splitext(os.path.basename(odb_file_path))[0] + ".zdf"
+    return os.path.join(output_dir if output_dir is not None else os.path.dirname(odb_file_path), zdf_file_name)
+
+
+def _init_element_types(element_types):
+    # batch和服务器的worker进程的初始化函数。
+    # Windows上worker进程重新导入脚本而不执行__main__, 需要重新加载自定义的element type
+    if element_types:
+        element_type_registry.load(element_types)
+
+
+def _convert_batch_file(args, odb_file_path, zdf_file_path):
+    """
+    转换batch中的一个odb文件, 失败时返回错误信息而不是抛出异常, 不影响其它文件
+    :return: 该文件的结果, {odb_file, zdf_file, status, time, messages[, error, traceback]}
+    """
+    start = time.perf_counter()
+    result = {"odb_file": odb_file_path, "zdf_file": zdf_file_path}
+    try:
+        result.update(status="ok", messages=convert(args, odb_file_path, zdf_file_path))
+    except Exception as error:
+        result.update(status="failed", messages=[], error=f"{type(error).__name__}: {error}",
+                      traceback=traceback.format_exc())
+    result["time"] = time.perf_counter() - start
+    return result
+
+
+def convert_batch(args, odb_file_paths, output_dir=None, workers=1):
+    """
+    在同一个python进程(以及workers个worker进程)中依次转换多个odb文件, 避免每个文件都重新启动abaqus python。
+    每个文件完成时输出状态和耗时
+    :param args: 命令行参数, 每个文件使用相同的参数
+    :param odb_file_paths: odb文件的路径
+    :param output_dir: 输出目录, 为None时zdf写在odb旁边
+    :param workers: 同时转换的文件个数, 大于1时每个文件由进程池中的一个worker转换
+    :return: 每个文件的结果(按完成的顺序), 参见_convert_batch_file
+    """
+    tasks = [(args, odb_file_path, batch_zdf_path(odb_file_path, output_dir)) for odb_file_path in odb_file_paths]
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    results = []
+
+    def report(result):
+        results.append(result)
+        if result["status"] == "ok":
+            print(f"[{len(results)}/{len(tasks)}] ok     {result['time']:8.1f}s  "
+                  f"{result['odb_file']} -> {result['zdf_file']}", flush=True)
+        else:
+            print(f"[{len(results)}/{len(tasks)}] FAILED {result['time']:8.1f}s  "
+                  f"{result['odb_file']}: {result['error']}", flush=True)
+        for message in result["messages"]:
+            print("    " + message, flush=True)
+
+    if workers > 1:
+        with multiprocessing.Pool(workers, _init_element_types, (args.element_types,)) as pool:
+            for result in pool.imap_unordered(_convert_batch_task, tasks):
+                report(result)
+    else:
+        for task in tasks:
+            report(_convert_batch_file(*task))
+    return results
+
+
+def _convert_batch_task(task):
+    return _convert_batch_file(*task)
+
+
+def make_parser():
+    """
+    :return: 命令行参数的parser, 转换服务器也用它解析每个任务的参数
+    """
+    # abaqus python odb2zdf.py odb_file zdf_file [--bulk] [--element-types JSON_FILE] [--workers N] [--chunk-size N]
+    #                          [--steps PATTERN ...] [--exclude-steps PATTERN ...]
+    #                          [--fields PATTERN ...] [--exclude-fields PATTERN ...] [--frame INDEX]
+    #                          [--history [--frame-stride N] [--time-window START END] [--max-frames N]]
+    #                          [--nodal-average [{all,section,material}]]
+    #                          [--sidecar] [--precision {float32,digits,quantize} [--digits N]]
+    #                          [--share-ids] [--range-ids] [--delta-connectivity] [--toc]
+    #                          [--compress {gzip,bz2,lzma,zstd} [--compress-level N] [--compress-workers N]]
+    #                          [--cache-dir DIR [--cache-size MB]] [--append] [--profile [--profile-memory]]
+    # abaqus python odb2zdf.py --batch SOURCE ... [--output-dir DIR] [--batch-workers N] [--batch-report JSON_FILE]
+    #                          [其它转换参数]
+    # abaqus python odb2zdf.py --serve [--address ADDRESS] [--max-jobs N]
+    parser = argparse.ArgumentParser(description="convert an abaqus odb file to a zwsim zdf file")
+    parser.add_argument("odb_file", nargs="?", help="path to the odb file")
+    parser.add_argument("zdf_file", nargs="?", help="path to the zdf file to be output")
+    parser.add_argument("--batch", nargs="+", metavar="SOURCE",
+                        help="convert many odb files in this session instead of ODB_FILE: odb files, directories, "
+                             "glob patterns or text files listing one odb path per line")
+    parser.add_argument("--output-dir", metavar="DIR",
+                        help="with --batch, directory of the zdf files, next to every odb file by default")
+    parser.add_argument("--batch-workers", type=int, default=1,
+                        help="with --batch, number of worker processes that convert files in parallel")
+    parser.add_argument("--batch-report", metavar="JSON_FILE",
+                        help="with --batch, write the status, time and error of every file to JSON_FILE")
+    parser.add_argument("--serve", action="store_true",
+                        help="run a conversion server that keeps the converter loaded and converts the jobs "
+                             "submitted by zdf_client.py")
+    parser.add_argument("--address",
+                        help="with --serve, named pipe, unix socket or HOST:PORT to listen on, "
+                             "see zdf_server.default_address")
+    parser.add_argument("--max-jobs", type=int, default=1,
+                        help="with --serve, number of jobs converted at the same time, later jobs wait in a queue")
+    parser.add_argument("--bulk", action="store_true",
+                        help="read field data through bulkDataBlocks as numpy arrays")
+    parser.add_argument("--element-types", metavar="JSON_FILE",
+                        help='custom element type mappings: {"abaqus type": ["zdf type", type id], ...}')
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes that extract fields in parallel")
+    parser.add_argument("--chunk-size", type=int, default=65536, metavar="N",
+                        help="number of field values extracted and written at a time, "
+                             "bounds the memory used by a single field")
+    parser.add_argument("--steps", nargs="+", metavar="PATTERN",
+                        help="glob patterns of the steps to convert, all steps by default")
+    parser.add_argument("--exclude-steps", nargs="+", metavar="PATTERN", help="glob patterns of the steps to skip")
+    parser.add_argument("--fields", nargs="+", metavar="PATTERN",
+                        help="glob patterns of the field names to convert (e.g. U S), all fields by default")
+    parser.add_argument("--exclude-fields", nargs="+", metavar="PATTERN",
+                        help="glob patterns of the field names to skip")
+    parser.add_argument("--frame", type=int, default=-1,
+                        help="index of the frame to convert in every step, the last frame by default")
+    parser.add_argument("--history", action="store_true",
+                        help="convert every frame of each step as a separate result item with its frame value")
+    parser.add_argument("--frame-stride", type=int, default=1, help="with --history, convert every N-th frame")
+    parser.add_argument("--time-window", type=float, nargs=2, metavar=("START", "END"),
+                        help="with --history, only convert frames whose frame value is within [START, END]")
+    parser.add_argument("--max-frames", type=int,
+                        help="with --history, convert at most N evenly spaced frames per step "
+                             "(cannot be used with --append)")
+    parser.add_argument("--nodal-average", nargs="?", const="all", choices=ZdfNodalAverage.modes,
+                        help="write integration point fields as nodal fields averaged from their element nodal "
+                             "values, over all elements or only within each section or material (one field each), "
+                             "instead of element centroid values")
+    parser.add_argument("--sidecar", action="store_true",
+                        help="write record data as raw little-endian arrays to ZDF_FILE.bin "
+                             "and keep only references in the zdf file")
+    parser.add_argument("--precision", choices=ZdfPrecision.modes,
+                        help="precision policy of field values and node coordinates: float32 shortest repr, "
+                             "DIGITS significant digits, or per-column quantization to DIGITS digits")
+    parser.add_argument("--digits", type=int, default=6,
+                        help="significant digits of the digits and quantize precision policies")
+    parser.add_argument("--share-ids", action="store_true",
+                        help="write every distinct id array once, later identical id arrays (e.g. of nodal fields) "
+                             "reference it and fields are reordered to the mesh order when possible")
+    parser.add_argument("--range-ids", action="store_true",
+                        help="write contiguous runs of ids (e.g. labels 1..N) as [start, stop, step] ranges")
+    parser.add_argument("--delta-connectivity", action="store_true",
+                        help="write element connectivity as the first node of each row plus the differences of the "
+                             "other nodes, in the narrowest integer type with --sidecar")
+    parser.add_argument("--toc", action="store_true",
+                        help="append a table of contents with the structure, dims, dtype and byte range of every "
+                             "step, field and record to the zdf")
+    parser.add_argument("--compress", choices=list(CODECS),
+                        help="write a compressed zdf (ZDF_FILE.gz etc.) made of independently compressed blocks, "
+                             "with a block index in ZDF_FILE.gz.index for random access")
+    parser.add_argument("--compress-level", type=int, help="compression level, the codec's default by default")
+    parser.add_argument("--compress-workers", type=int, default=os.cpu_count() or 1,
+                        help="number of threads that compress blocks in parallel with the extraction")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="directory of the extraction cache, unchanged mesh and fields are read from it "
+                             "chunk by chunk (--chunk-size rows each). The key is the sha256 of the whole odb, "
+                             "computed again whenever its size or mtime changes, so a growing odb (--append on a "
+                             "running job) is hashed on every run and never hits the cache")
+    parser.add_argument("--cache-size", type=float, default=2048, metavar="MB",
+                        help="maximum total size of the extraction cache, least recently used entries are evicted")
+    parser.add_argument("--append", action="store_true",
+                        help="write ZDF_FILE.manifest; if ZDF_FILE was written with --append before, only convert "
+                             "the steps (frames with --history) it does not contain yet and append them to it, "
+                             "rewriting the last step if it gained frames")
+    parser.add_argument("--profile", action="store_true",
+                        help="record the wall time, cpu time, items and throughput of every stage "
+                             "to ZDF_FILE.profile.json")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="with --profile, also record the peak memory of every stage (slower)")
+    return parser
+
+
+def check_args(parser, args):
+    """
+    检查参数之间的冲突, 有冲突时调用parser.error
+    """
+    if args.batch or args.serve:
+        if args.odb_file or args.zdf_file:
+            parser.error("ODB_FILE and ZDF_FILE cannot be used with --batch (use --output-dir) or --serve")
+        if args.batch and args.serve:
+            parser.error("--batch cannot be used with --serve")
+    elif not args.zdf_file:
+        parser.error("ODB_FILE and ZDF_FILE are required without --batch or --serve")
+    if args.batch and args.batch_workers > 1 and args.workers > 1:
+        # 进程池中的worker不能再创建进程池
+        parser.error("--workers cannot be used with --batch-workers")
+    if args.append and args.max_frames is not None:
+        # 均匀抽取与frame的总数有关, step增加frame后抽取的frame与已经写入的不同
+        parser.error("--max-frames cannot be used with --append")
+    if args.compress:
+        if args.append:
+            parser.error("--append cannot be used with --compress")
+        try:
+            check_codec(args.compress)
+        except ValueError as error:
+            parser.error(str(error))
+
+
+def _serve_job(argv, progress):
+    """
+    转换服务器的任务, 在服务器的worker进程中执行, 参见zdf_server.ZdfServer
+    :param argv: 与命令行相同的参数, 如["Job-1.odb", "Job-1.zdf", "--fields", "U", "S"]
+    :param progress: 进度回调, 参见ZdfAllData
+    :return: 转换结果的说明
+    """
+    parser = make_parser()
+    stderr = io.StringIO()
+    try:
+        with contextlib.redirect_stderr(stderr):
+            args = parser.parse_args(argv)
+            check_args(parser, args)
+    except SystemExit:
+        message = stderr.getvalue().strip().splitlines()[-1]
+        raise ValueError(message.partition("error: ")[2] or message) from None
+    if args.batch or args.serve:
+        raise ValueError("--batch and --serve cannot be used in a server job")
+    if args.workers > 1:
+        # 服务器的worker进程不能再创建进程池, 用--max-jobs同时转换多个任务
+        raise ValueError("--workers cannot be used in a server job, start the server with --max-jobs instead")
+    # 任务的自定义element type只在这个任务中有效
+    with element_type_registry.scoped():
+        if args.element_types:
+            element_type_registry.load(args.element_types)
+        return convert(args, args.odb_file, args.zdf_file, progress)
+
 
 if __name__ == "__main__":
-    odb_file = sys.argv[1]
-    zdf_file = sys.argv[2]
+    parser = make_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+    if args.element_types:
+        element_type_registry.load(args.element_types)
     # odb_file_path = "D:\\temp\\Job-12.odb"
 
-    data = ZdfAllData(odb_file).get_data()
+    if args.batch:
+        odb_file_paths = find_odb_files(args.batch)
+        if not odb_file_paths:
+            parser.error(f"no odb files found in {args.batch}")
+        zdf_file_paths = [os.path.normcase(os.path.abspath(batch_zdf_path(path, args.output_dir)))
+                          for path in odb_file_paths]
+        if len(set(zdf_file_paths)) < len(zdf_file_paths):
+            parser.error("several odb files would be converted to the same zdf file, "
+                         "convert them to separate --output-dir directories")
+        start = time.perf_counter()
+        results = convert_batch(args, odb_file_paths, args.output_dir, args.batch_workers)
+        failed = [result for result in results if result["status"] != "ok"]
+        print(f"batch: {len(results) - len(failed)} converted, {len(failed)} failed "
+              f"in {time.perf_counter() - start:.1f}s")
+        for result in failed:
+            print(f"    failed: {result['odb_file']}")
+        if args.batch_report:
+            with open(args.batch_report, "w") as f:
+                json.dump(results, f, indent=2)
+        sys.exit(1 if failed else 0)
+
+    if args.serve:
+        server = ZdfServer(_serve_job, parse_address(args.address) if args.address else None, max_jobs=args.max_jobs,
+                           initializer=_init_element_types, initargs=(args.element_types,))
+        print(f"serving on {server.address} with {args.max_jobs} job(s) at a time", flush=True)
+        server.serve_forever()
+        sys.exit(0)
 
-    with open(zdf_file, "w") as f:
-        json.dump(data, f, indent=2)
+    for message in convert(args, args.odb_file, args.zdf_file):
+        print(message)
@@ -5,10 +5,21 @@ if %errorlevel% neq 0 (
 )
 :: abaqus python python_script odb_file zdf_file
 :: %1 is the path to odb2zdf.py, %2 the path to odb file, %3 the path to zdf file to be output
+:: if a conversion server (abaqus python odb2zdf.py --serve) is running, submit the job to it with zdf_client.py,
+:: which is next to odb2zdf.py; zdf_client.py exits with 4 when the server reports that the conversion failed,
+:: any other nonzero code (no server, a crashed server worker, python 2 or a broken python on PATH) falls back
+:: to abaqus python
+where python >nul 2>nul
+if %errorlevel% neq 0 goto convert
+python "%~dp1zdf_client.py" %2 %3
+if %errorlevel% equ 0 goto success
+if %errorlevel% equ 4 goto failure
+:convert
 abaqus python %1 %2 %3
-if %errorlevel% neq 0 (
-	echo command execution failed
-	exit /b 1
-)
+if %errorlevel% neq 0 goto failure
+:success
 echo Command executed successfully
-exit /b 0
\ No newline at end of file
+exit /b 0
+:failure
+echo command execution failed
+exit /b 1
\ No newline at end of file
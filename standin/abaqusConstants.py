@@ -0,0 +1,55 @@
+"""
+abaqusConstants的本地替身(stand-in)。
+只定义了odb2zdf以及standin/odbAccess.py用到的符号常量，用于在没有安装Abaqus的机器上测试和benchmark。
+"""
+
+#==============================================================================#
+
+class SymbolicConstant:
+    """
+    与Abaqus的SymbolicConstant一致: str()返回常量的名称, 相同名称的常量相等
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return self.name
+
+    def __eq__(self, other):
+        return isinstance(other, SymbolicConstant) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+
+# field的位置
+NODAL = SymbolicConstant("NODAL")
+INTEGRATION_POINT = SymbolicConstant("INTEGRATION_POINT")
+ELEMENT_NODAL = SymbolicConstant("ELEMENT_NODAL")
+CENTROID = SymbolicConstant("CENTROID")
+WHOLE_ELEMENT = SymbolicConstant("WHOLE_ELEMENT")
+
+# field的类型
+SCALAR = SymbolicConstant("SCALAR")
+VECTOR = SymbolicConstant("VECTOR")
+TENSOR_3D_FULL = SymbolicConstant("TENSOR_3D_FULL")
+TENSOR_3D_PLANAR = SymbolicConstant("TENSOR_3D_PLANAR")
+TENSOR_3D_SURFACE = SymbolicConstant("TENSOR_3D_SURFACE")
+TENSOR_2D_PLANAR = SymbolicConstant("TENSOR_2D_PLANAR")
+TENSOR_2D_SURFACE = SymbolicConstant("TENSOR_2D_SURFACE")
+
+# invariant
+MAGNITUDE = SymbolicConstant("MAGNITUDE")
+MISES = SymbolicConstant("MISES")
+TRESCA = SymbolicConstant("TRESCA")
+PRESS = SymbolicConstant("PRESS")
+INV3 = SymbolicConstant("INV3")
+MAX_PRINCIPAL = SymbolicConstant("MAX_PRINCIPAL")
+MID_PRINCIPAL = SymbolicConstant("MID_PRINCIPAL")
+MIN_PRINCIPAL = SymbolicConstant("MIN_PRINCIPAL")
+MAX_INPLANE_PRINCIPAL = SymbolicConstant("MAX_INPLANE_PRINCIPAL")
+MIN_INPLANE_PRINCIPAL = SymbolicConstant("MIN_INPLANE_PRINCIPAL")
+OUTOFPLANE_PRINCIPAL = SymbolicConstant("OUTOFPLANE_PRINCIPAL")
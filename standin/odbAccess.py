@@ -0,0 +1,500 @@
+"""
+odbAccess的本地替身(stand-in)。
+只实现了odb2zdf用到的接口，用于在没有安装Abaqus的机器上测试和benchmark。
+使用时把standin目录加入sys.path，使`import odbAccess`和`from abaqusConstants import *`导入这里的模块。
+"""
+import json
+import os
+from collections.abc import Mapping
+
+import numpy as np
+from abaqusConstants import *
+
+#==============================================================================#
+
+# Abaqus中应变类field的剪切分量是工程剪应变(gamma = 2 * epsilon)，计算主值时需要除以2
+STRAIN_FIELD_NAMES = ("E", "LE", "NE", "PE", "EE", "IE", "THE", "ER", "DE")
+
+
+def default_invariants(field_name, field_type):
+    """
+    根据field的类型返回Abaqus中该field的validInvariants
+    :param field_name: field的名称, 如U, S, LE
+    :param field_type: field的类型, 如VECTOR, TENSOR_3D_FULL
+    :return: invariant的列表
+    """
+    if field_type == VECTOR:
+        return [MAGNITUDE]
+    if field_type not in (TENSOR_3D_FULL, TENSOR_3D_PLANAR, TENSOR_3D_SURFACE,
+                          TENSOR_2D_PLANAR, TENSOR_2D_SURFACE):
+        return []
+
+    invariants = [] if field_name in STRAIN_FIELD_NAMES else [MISES]
+    invariants += [MAX_PRINCIPAL, MID_PRINCIPAL, MIN_PRINCIPAL]
+    if field_type != TENSOR_3D_FULL:
+        invariants += [MAX_INPLANE_PRINCIPAL, MIN_INPLANE_PRINCIPAL, OUTOFPLANE_PRINCIPAL]
+    if field_name not in STRAIN_FIELD_NAMES:
+        invariants += [TRESCA, PRESS, INV3]
+    return invariants
+
+
+class FieldLocation:
+    def __init__(self, position):
+        self.position = position
+
+
+class FieldValue:
+    """
+    单个位置上的field值。
+    invariant按照Abaqus的定义逐个计算，作为逐值(per-value)路径的参考实现
+    """
+    def __init__(self, field, data, index):
+        self._field = field
+        self._data = data
+        self._index = index
+
+    @property
+    def nodeLabel(self):
+        labels = self._field._node_labels
+        return None if labels is None else int(labels[self._index])
+
+    @property
+    def elementLabel(self):
+        labels = self._field._element_labels
+        return None if labels is None else int(labels[self._index])
+
+    @property
+    def instance(self):
+        return self._field._get_instance(self._index)
+
+    @property
+    def data(self):
+        row = self._data[self._index]
+        if self._field.type == SCALAR:
+            return float(row[0])
+        return row.copy()
+
+    def _tensor(self):
+        """
+        根据componentLabels(如S11, S22, S12)组装3x3的对称张量
+        """
+        tensor = np.zeros((3, 3))
+        is_strain = self._field.name in STRAIN_FIELD_NAMES
+        for label, component in zip(self._field.componentLabels, self._data[self._index]):
+            i, j = int(label[-2]) - 1, int(label[-1]) - 1
+            if i != j and is_strain:
+                component = component / 2.0
+            tensor[i, j] = tensor[j, i] = component
+        return tensor
+
+    def _principals(self):
+        return np.linalg.eigvalsh(self._tensor())  # 从小到大排列
+
+    def _deviator(self):
+        tensor = self._tensor()
+        return tensor - np.trace(tensor) / 3.0 * np.eye(3)
+
+    @property
+    def magnitude(self):
+        return float(np.float32(np.linalg.norm(self._data[self._index].astype(np.float64))))
+
+    @property
+    def mises(self):
+        deviator = self._deviator()
+        return float(np.float32(np.sqrt(1.5 * np.sum(deviator * deviator))))
+
+    @property
+    def tresca(self):
+        principals = self._principals()
+        return float(np.float32(principals[2] - principals[0]))
+
+    @property
+    def press(self):
+        return float(np.float32(-np.trace(self._tensor()) / 3.0))
+
+    @property
+    def inv3(self):
+        return float(np.float32(np.cbrt(13.5 * np.linalg.det(self._deviator()))))
+
+    @property
+    def maxPrincipal(self):
+        return float(np.float32(self._principals()[2]))
+
+    @property
+    def midPrincipal(self):
+        return float(np.float32(self._principals()[1]))
+
+    @property
+    def minPrincipal(self):
+        return float(np.float32(self._principals()[0]))
+
+    @property
+    def maxInPlanePrincipal(self):
+        return float(np.float32(np.linalg.eigvalsh(self._tensor()[:2, :2])[1]))
+
+    @property
+    def minInPlanePrincipal(self):
+        return float(np.float32(np.linalg.eigvalsh(self._tensor()[:2, :2])[0]))
+
+    @property
+    def outOfPlanePrincipal(self):
+        return float(np.float32(self._tensor()[2, 2]))
+
+
+class FieldBulkData:
+    """
+    与Abaqus的FieldBulkData一致: 一个block内的label和data都是连续的NumPy数组
+    """
+    def __init__(self, field, data, mises, start, stop):
+        self.position = field.locations[0].position
+        self.type = field.type
+        self.instance = field._get_instance(start)
+        self.componentLabels = field.componentLabels
+        self.nodeLabels = None if field._node_labels is None else field._node_labels[start:stop]
+        self.elementLabels = None if field._element_labels is None else field._element_labels[start:stop]
+        self.data = data[start:stop]
+        self.mises = None if mises is None else mises[start:stop]
+
+
+class FieldOutput:
+    """
+    Abaqus的FieldOutput。
+    data的每一行对应一个节点或一个element(INTEGRATION_POINT的field每个element只保存质心上的一行)。
+    与Abaqus一样，FieldOutput本身不保存数据: 如果data是一个函数，只有在读取values或bulkDataBlocks时才生成数据
+    """
+    def __init__(self, name, type, position, componentLabels, data, nodeLabels=None, elementLabels=None,
+                 validInvariants=None, instance=None, blockSize=None, description=""):
+        """
+        :param name: field的名称, 如U, S
+        :param type: field的类型, 如VECTOR, TENSOR_3D_FULL
+        :param position: field的位置, 如NODAL, INTEGRATION_POINT
+        :param componentLabels: 分量的名称, 如("U1", "U2", "U3")
+        :param data: 形状为(n, len(componentLabels))的数组, 标量field为(n, 1); 也可以是返回这个数组的函数
+        :param nodeLabels: 每一行的节点label, 没有则为None
+        :param elementLabels: 每一行的element label, 没有则为None
+        :param validInvariants: 为None时根据field的类型生成
+        :param instance: field所在的instance; 数据来自多个instance时为[(instance, 行数), ...], 按行的顺序排列
+        :param blockSize: bulkDataBlocks中每个block的行数, 为None时只有一个block
+        :param description: field的描述
+        """
+        self.name = name
+        self.description = description
+        self.type = type
+        self.componentLabels = tuple(componentLabels)
+        self.validInvariants = (default_invariants(name, type) if validInvariants is None
+                                else list(validInvariants))
+        self.locations = [FieldLocation(position)]
+
+        self._data = data
+        self._node_labels = None if nodeLabels is None else np.asarray(nodeLabels, dtype=np.int32)
+        self._element_labels = None if elementLabels is None else np.asarray(elementLabels, dtype=np.int32)
+        self._instance = instance
+        self._block_size = blockSize
+        # 每个instance对应的行的范围 [(instance, start, stop), ...]
+        self._instance_segments = []
+        if isinstance(instance, (list, tuple)):
+            start = 0
+            for segment_instance, num_rows in instance:
+                self._instance_segments.append((segment_instance, start, start + num_rows))
+                start += num_rows
+
+    def _get_instance(self, index):
+        for instance, start, stop in self._instance_segments:
+            if start <= index < stop:
+                return instance
+        return None if self._instance_segments else self._instance
+
+    def _load_data(self):
+        data = self._data() if callable(self._data) else self._data
+        return np.asarray(data, dtype=np.float32).reshape(len(data), -1)
+
+    def _get_mises(self, data):
+        """
+        Abaqus在bulkDataBlocks中直接给出mises, 这里一次性计算所有行的mises
+        """
+        tensors = np.zeros((len(data), 3, 3))
+        is_strain = self.name in STRAIN_FIELD_NAMES
+        for column, label in enumerate(self.componentLabels):
+            i, j = int(label[-2]) - 1, int(label[-1]) - 1
+            component = data[:, column].astype(np.float64)
+            if i != j and is_strain:
+                component = component / 2.0
+            tensors[:, i, j] = tensors[:, j, i] = component
+        deviators = tensors - np.trace(tensors, axis1=1, axis2=2)[:, None, None] / 3.0 * np.eye(3)
+        return np.sqrt(1.5 * np.sum(deviators * deviators, axis=(1, 2))).astype(np.float32)
+
+    @property
+    def values(self):
+        data = self._load_data()
+        return [FieldValue(self, data, i) for i in range(len(data))]
+
+    @property
+    def bulkDataBlocks(self):
+        data = self._load_data()
+        mises = self._get_mises(data) if MISES in self.validInvariants else None
+        # 与Abaqus一样, 一个block只包含一个instance中的数据
+        segments = [(start, stop) for _, start, stop in self._instance_segments] or [(0, len(data))]
+        blocks = []
+        for segment_start, segment_stop in segments:
+            block_size = self._block_size or max(segment_stop - segment_start, 1)
+            for start in range(segment_start, segment_stop, block_size):
+                blocks.append(FieldBulkData(self, data, mises, start, min(start + block_size, segment_stop)))
+        return blocks
+
+    def getSubset(self, position=None, region=None, **kwargs):
+        """
+        按position取子集, 除ELEMENT_NODAL以外数据不变，只改变position。
+        element上的field取ELEMENT_NODAL子集时, 每个element的每个节点一行(按connectivity的顺序)，
+        值为该element的值乘以每个节点各自的随机系数; region(OdbSet)指定时只包含region中的element
+        """
+        if position == ELEMENT_NODAL and self._element_labels is not None:
+            return self._get_element_nodal_subset(region)
+        subset = FieldOutput(self.name, self.type, position or self.locations[0].position,
+                             self.componentLabels, self._data, self._node_labels, self._element_labels,
+                             self.validInvariants, self._instance, self._block_size, self.description)
+        return subset
+
+
+    def _get_element_nodal_subset(self, region):
+        # element上的field的每一行对应instance.elements中的一个element
+        segments = self._instance_segments or [(self._instance, 0, len(self._element_labels))]
+        region_elements = None
+        if region is not None:
+            region_elements = {(element.instanceName, element.label) for element in region.elements}
+        rows, node_labels, element_labels, instances = [], [], [], []
+        for instance, start, stop in segments:
+            selected = [(start + index, element) for index, element in enumerate(instance.elements[:stop - start])
+                        if region_elements is None or (instance.name, element.label) in region_elements]
+            counts = [len(element.connectivity) for _, element in selected]
+            rows.append(np.repeat(np.array([row for row, _ in selected], dtype=np.int64), counts))
+            node_labels.extend(element.connectivity for _, element in selected)
+            element_labels.append(np.repeat(np.array([element.label for _, element in selected]), counts))
+            instances.append((instance, sum(counts)))
+        rows = np.concatenate(rows)
+        node_labels = np.array([label for connectivity in node_labels for label in connectivity], dtype=np.int32)
+
+        def data():
+            values = self._load_data()[rows]
+            return values * np.random.default_rng(len(rows)).uniform(0.8, 1.2, size=values.shape)
+
+        return FieldOutput(self.name, self.type, ELEMENT_NODAL, self.componentLabels, data, node_labels,
+                           np.concatenate(element_labels), self.validInvariants, instances, self._block_size,
+                           self.description)
+
+
+class OdbMeshNode:
+    def __init__(self, label, coordinates, instanceName=None):
+        self.label = label
+        self.coordinates = np.asarray(coordinates, dtype=np.float32)
+        self.instanceName = instanceName
+
+
+class OdbMeshElement:
+    def __init__(self, label, type, connectivity, instanceName=None):
+        self.label = label
+        self.type = type
+        self.connectivity = tuple(connectivity)
+        self.instanceName = instanceName
+
+
+class OdbSet:
+    def __init__(self, name, elements):
+        self.name = name
+        self.elements = elements
+
+
+class SectionAssignment:
+    def __init__(self, region, sectionName):
+        self.region = region
+        self.sectionName = sectionName
+
+
+class Section:
+    def __init__(self, name, material):
+        self.name = name
+        self.material = material
+
+
+class OdbInstance:
+    def __init__(self, name, nodes, elements, sectionAssignments=()):
+        self.name = name
+        self.nodes = nodes
+        self.elements = elements
+        self.sectionAssignments = list(sectionAssignments)
+
+
+class OdbAssembly:
+    def __init__(self, instances):
+        self.instances = instances
+
+
+class OdbFrame:
+    def __init__(self, frameId, frameValue, fieldOutputs, description=""):
+        self.frameId = frameId
+        self.frameValue = frameValue
+        self.fieldOutputs = fieldOutputs
+        self.description = description
+
+
+class OdbStep:
+    def __init__(self, name, number, frames):
+        self.name = name
+        self.number = number
+        self.frames = frames
+
+
+class Odb:
+    def __init__(self, name, steps, rootAssembly=None, sections=None):
+        self.name = name
+        self.steps = steps
+        self.rootAssembly = rootAssembly if rootAssembly is not None else OdbAssembly({})
+        self.sections = sections if sections is not None else {}
+
+    def close(self):
+        pass
+
+
+class FieldOutputRepository(Mapping):
+    """
+    frame.fieldOutputs, 只有在读取某个field时才创建对应的FieldOutput
+    """
+    def __init__(self, factories):
+        """
+        :param factories: field名称 -> 创建FieldOutput的函数
+        """
+        self._factories = factories
+
+    def __getitem__(self, name):
+        return self._factories[name]()
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+
+#==============================================================================#
+# 生成参数化的模型
+
+# 可以生成的field: 名称 -> (类型, 位置, 分量名称, 数值的量级)
+FIELD_DEFINITIONS = {
+    "U": (VECTOR, NODAL, ("U1", "U2", "U3"), 1e-3),
+    "RF": (VECTOR, NODAL, ("RF1", "RF2", "RF3"), 1e2),
+    "S": (TENSOR_3D_FULL, INTEGRATION_POINT, ("S11", "S22", "S33", "S12", "S13", "S23"), 1e4),
+    "LE": (TENSOR_3D_FULL, INTEGRATION_POINT, ("LE11", "LE22", "LE33", "LE12", "LE13", "LE23"), 1e-3),
+    "PEEQ": (SCALAR, INTEGRATION_POINT, (), 1e-2),
+    "NT11": (SCALAR, NODAL, (), 1e2),
+}
+
+
+# 可以生成的element type: abaqus element type -> node个数。
+# 例如C3D10(tetra10)、C3D20R(hexa20)、C3D15(wedge15)、S4(quad4)和B31(beam2)
+ELEMENT_NODE_COUNTS = {
+    "B31": 2, "B32": 3,
+    "S3": 3, "S4": 4, "S4R": 4, "S8R": 8,
+    "C3D4": 4, "C3D10": 10,
+    "C3D6": 6, "C3D15": 15,
+    "C3D8": 8, "C3D8R": 8, "C3D20": 20, "C3D20R": 20,
+}
+
+
+def _make_elements(rng, num_elements, num_nodes, element_types, instance_name=None):
+    """
+    生成num_elements个element, 按element_types的顺序分成连续的几段，每段是同一种type, connectivity是随机的node label
+    """
+    elements = []
+    for element_type, labels in zip(element_types, np.array_split(np.arange(1, num_elements + 1),
+                                                                   len(element_types))):
+        connectivity = rng.integers(1, num_nodes + 1, size=(len(labels), ELEMENT_NODE_COUNTS[element_type]))
+        elements.extend(OdbMeshElement(int(label), element_type, connect.tolist(), instance_name)
+                        for label, connect in zip(labels, connectivity))
+    return elements
+
+
+def _make_field_output(name, seed, node_segments, element_segments):
+    field_type, position, component_labels, scale = FIELD_DEFINITIONS[name]
+    segments = node_segments if position == NODAL else element_segments
+    labels = np.concatenate([segment_labels for _, segment_labels in segments])
+    instances = [(instance, len(segment_labels)) for instance, segment_labels in segments]
+    shape = (len(labels), max(len(component_labels), 1))
+
+    def data():
+        return np.random.default_rng(seed).normal(scale=scale, size=shape)
+
+    if position == NODAL:
+        return FieldOutput(name, field_type, position, component_labels, data, nodeLabels=labels, instance=instances)
+    return FieldOutput(name, field_type, position, component_labels, data, elementLabels=labels, instance=instances)
+
+
+def make_odb(name="synthetic", num_nodes=1000, num_steps=1, num_frames=1, fields=("U", "S"), num_instances=1,
+             element_types=("C3D8R",), num_elements=None, num_materials=1, seed=0):
+    """
+    生成一个参数化的模型。相同的参数总是生成相同的模型，field的数据在读取时才生成
+    :param name: odb的名称
+    :param num_nodes: 节点个数, 平均分配到每个instance
+    :param num_steps: step个数
+    :param num_frames: 每个step的frame个数
+    :param fields: 每个frame中的field, 参见FIELD_DEFINITIONS
+    :param num_instances: instance的个数, 每个instance中节点和element的label都从1开始
+    :param element_types: element的type, 每个instance中的element平均分配给每种type, 参见ELEMENT_NODE_COUNTS
+    :param num_elements: element个数, 平均分配到每个instance, 为None时为节点个数的一半
+    :param num_materials: material的个数。每种element type有一个section(如SECTION-C3D8R),
+                          第i种element type的section使用第(i % num_materials)个material
+    :param seed: 随机数种子
+    :return: Odb对象
+    """
+    rng = np.random.default_rng(seed)
+    instances = {}
+    node_segments, element_segments = [], [] # [(instance, 该instance的label), ...]
+    sections = {f"SECTION-{element_type}": Section(f"SECTION-{element_type}", f"MATERIAL-{index % num_materials + 1}")
+                for index, element_type in enumerate(element_types)}
+    for instance_index in range(num_instances):
+        instance_num_nodes = max(num_nodes // num_instances, 1)
+        node_labels = np.arange(1, instance_num_nodes + 1)
+        coordinates = rng.uniform(-50.0, 50.0, size=(instance_num_nodes, 3))
+        nodes = [OdbMeshNode(int(label), xyz) for label, xyz in zip(node_labels, coordinates)]
+
+        instance_num_elements = max((num_nodes if num_elements is None else 2 * num_elements)
+                                    // (2 * num_instances), 1)
+        element_labels = np.arange(1, instance_num_elements + 1)
+        instance_name = f"PART-{instance_index + 1}-1"
+        elements = _make_elements(rng, instance_num_elements, instance_num_nodes, element_types, instance_name)
+        section_assignments = [
+            SectionAssignment(OdbSet(f"SET-{element_type}", [element for element in elements
+                                                              if element.type == element_type]),
+                              f"SECTION-{element_type}")
+            for element_type in element_types]
+
+        instance = OdbInstance(instance_name, nodes, elements, section_assignments)
+        instances[instance.name] = instance
+        node_segments.append((instance, node_labels))
+        element_segments.append((instance, element_labels))
+
+    steps = {}
+    for step_index in range(num_steps):
+        step_name = f"Step-{step_index + 1}"
+        frames = []
+        for frame_index in range(num_frames):
+            factories = {}
+            for field_index, field_name in enumerate(fields):
+                field_seed = [seed, step_index, frame_index, field_index]
+                factories[field_name] = (lambda field_name=field_name, field_seed=field_seed:
+                                         _make_field_output(field_name, field_seed, node_segments, element_segments))
+            frames.append(OdbFrame(frame_index, (frame_index + 1.0) / num_frames, FieldOutputRepository(factories)))
+        steps[step_name] = OdbStep(step_name, step_index + 1, frames)
+
+    return Odb(name, steps, OdbAssembly(instances), sections)
+
+
+def openOdb(path, readOnly=False, readInternalSets=False):
+    """
+    替身中的odb文件是一个json文件，记录了make_odb的参数，例如
+        {"num_nodes": 100000, "num_steps": 2, "fields": ["U", "S"], "element_types": ["C3D10", "S4", "B31"]}
+    :param path: odb文件的路径
+    :return: Odb对象
+    """
+    with open(path) as f:
+        params = json.load(f)
+    params.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    return make_odb(**params)
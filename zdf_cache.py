@@ -0,0 +1,241 @@
+import hashlib
+import json
+import os
+import pickle
+import uuid
+
+#==============================================================================#
+
+class ZdfCache:
+    """
+    提取结果的磁盘缓存, 同一个odb反复转换时，没有变化的mesh和field直接从缓存中读取，不再从odb中提取。
+    缓存是按内容寻址的: 每一项的key是odb内容的hash加上数据的名称(如step、frame和field的名称)的hash，
+    因此odb被复制、移动或者只修改了mtime时缓存仍然有效，odb的内容改变后所有的项自然失效。
+    计算odb内容的hash需要读一遍文件，结果按(路径, 大小, mtime)记录在identities目录中(每个odb路径一个文件)，文件不变时不再重新计算。
+    多个进程可以同时使用同一个缓存目录: 每次写入都先写到唯一的临时文件再替换, 不同odb的记录也不在同一个文件中
+    缓存的总大小超过max_size时，按最近一次使用的时间(即缓存文件的mtime)删除最久没有使用的项(LRU)
+    """
+    version = 3 # 提取结果的格式改变时增加版本号, 旧的缓存项自然失效
+    hash_block_size = 16 * 2**20
+
+    def __init__(self, directory, max_size=2 * 2**30):
+        """
+        :param directory: 缓存目录, 不存在时自动创建
+        :param max_size: 缓存的最大总字节数
+        """
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self._total_size = None # 所有缓存项的总字节数, 第一次写入时扫描目录得到
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        self.hit_bytes, self.written_bytes = 0, 0
+
+    def odb_digest(self, odb_file_path):
+        """
+        :param odb_file_path: odb文件的路径
+        :return: odb文件内容的sha256
+        """
+        path = os.path.abspath(odb_file_path)
+        stat = os.stat(path)
+        # 每个odb路径的记录是一个单独的小文件, 同时转换不同odb的进程不会互相覆盖记录
+        identity_path = os.path.join(self.directory, "identities",
+                                     hashlib.sha256(path.encode()).hexdigest() + ".json")
+        try:
+            with open(identity_path) as f:
+                identity = json.load(f)
+        except (OSError, ValueError):
+            identity = None
+        if (identity is not None and identity.get("path") == path and identity.get("size") == stat.st_size
+                and identity.get("mtime_ns") == stat.st_mtime_ns):
+            return identity["digest"]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(self.hash_block_size), b""):
+                digest.update(block)
+        identity = {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": digest.hexdigest()}
+        os.makedirs(os.path.dirname(identity_path), exist_ok=True)
+        self._replace(identity_path, json.dumps(identity, indent=2).encode())
+        return identity["digest"]
+
+    def bind(self, odb_file_path):
+        """
+        :param odb_file_path: odb文件的路径
+        :return: 该odb的ZdfOdbCache
+        """
+        return ZdfOdbCache(self, self.odb_digest(odb_file_path))
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+    def key(self, odb_digest, parts):
+        """
+        :param odb_digest: odb文件内容的hash
+        :param parts: 数据的名称, 可以被json序列化, 如["field", step名称, frame序号, field名称]
+        :return: 缓存项的key
+        """
+        return hashlib.sha256(json.dumps([self.version, odb_digest, parts]).encode()).hexdigest()
+
+    def contains(self, key):
+        return os.path.exists(self._entry_path(key))
+
+    def get(self, key, count=True):
+        """
+        :param count: 是否计入命中次数, 按块缓存的数据只有记录块数的项计入
+        :return: 缓存的数据, 不存在或者无法读取时返回None
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+                size = f.tell()
+        except FileNotFoundError:
+            self.misses += count
+            return None
+        except Exception:
+            # 不完整或者由不兼容的版本写入的项, 删除后按没有命中处理, 之后重新提取并写入
+            self.misses += count
+            self._remove(path)
+            return None
+        try:
+            os.utime(path) # 记录最近一次使用的时间
+        except FileNotFoundError:
+            pass # 读取之后被其它进程删除
+        self.hits += count
+        self.hit_bytes += size
+        return data
+
+    def put(self, key, data):
+        """
+        写入一项数据, 之后按LRU删除超出max_size的项
+        """
+        content = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(content) > self.max_size:
+            return
+        if self._total_size is None:
+            self._total_size = 0
+            for entry in self._entries():
+                try:
+                    self._total_size += entry.stat().st_size
+                except FileNotFoundError:
+                    pass
+        path = self._entry_path(key)
+        try:
+            old_size = os.path.getsize(path)
+        except FileNotFoundError:
+            old_size = 0
+        if not self._replace(path, content):
+            return
+        self._total_size += len(content) - old_size
+        self.written_bytes += len(content)
+        if self._total_size > self.max_size:
+            self._evict()
+
+    def get_or_compute(self, key, compute):
+        """
+        :param key: 缓存项的key
+        :param compute: 没有命中时提取数据的函数
+        :return: 缓存的或者新提取的数据
+        """
+        data = self.get(key)
+        if data is None:
+            data = compute()
+            self.put(key, data)
+        return data
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(".pkl")]
+
+    def _evict(self):
+        # 其它进程可能同时删除或替换缓存项, 已经不存在的项直接跳过
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append((entry.stat().st_mtime_ns, entry.stat().st_size, entry.path))
+            except FileNotFoundError:
+                pass
+        for _, size, path in sorted(entries):
+            if self._total_size <= self.max_size:
+                break
+            self._total_size -= size
+            if self._remove(path):
+                self.evictions += 1
+
+    @staticmethod
+    def _remove(path):
+        """
+        :return: 是否删除了path, 已经被其它进程删除(或者windows上正在被其它进程读取)时返回False
+        """
+        try:
+            os.remove(path)
+        except (FileNotFoundError, PermissionError):
+            return False
+        return True
+
+    @staticmethod
+    def _replace(path, content):
+        """
+        :return: 是否写入了path
+        """
+        # 先写入临时文件再替换，中断时不会留下不完整的缓存项。
+        # 临时文件名包含进程id和随机数, 多个进程同时写入同一项时各自写完整的文件, 最后一次替换的生效
+        temp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        except PermissionError:
+            # windows上其他进程正在读取path时不能替换它, 放弃这次写入(同一个key的内容相同)
+            os.remove(temp_path)
+            return False
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return True
+
+    def report(self):
+        """
+        :return: 缓存命中情况的统计
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "hit_bytes": self.hit_bytes,
+            "written_bytes": self.written_bytes,
+            "evictions": self.evictions,
+        }
+
+    def describe(self):
+        report = self.report()
+        return (f"cache: {report['hits']} hits, {report['misses']} misses (hit rate {report['hit_rate']:.0%}), "
+                f"read {report['hit_bytes'] / 2**20:.1f}MB, wrote {report['written_bytes'] / 2**20:.1f}MB, "
+                f"{report['evictions']} evictions")
+
+
+class ZdfOdbCache:
+    """
+    绑定到一个odb的ZdfCache, 数据的名称自动加上odb内容的hash
+    """
+    def __init__(self, cache, odb_digest):
+        self.cache = cache
+        self.odb_digest = odb_digest
+
+    def contains(self, parts):
+        return self.cache.contains(self.cache.key(self.odb_digest, parts))
+
+    def get(self, parts, count=True):
+        return self.cache.get(self.cache.key(self.odb_digest, parts), count)
+
+    def get_or_compute(self, parts, compute):
+        return self.cache.get_or_compute(self.cache.key(self.odb_digest, parts), compute)
+
+    def put(self, parts, data, miss=True):
+        """
+        写入调用者自己提取的数据(例如由worker进程提取)
+        :param miss: 是否计为一次miss, 已经通过get计入时为False
+        """
+        self.cache.misses += miss
+        self.cache.put(self.cache.key(self.odb_digest, parts), data)
@@ -0,0 +1,130 @@
+"""
+odb2zdf转换服务器的客户端, 只依赖标准库, 可以用任何python 3运行:
+    python zdf_client.py [--address ADDRESS] odb_file zdf_file [转换参数...]
+    python zdf_client.py [--address ADDRESS] --status | --shutdown
+服务器由 abaqus python odb2zdf.py --serve 启动。
+返回0表示转换成功, 4表示服务器报告转换失败, 3表示服务器没有运行或者没有接受任务;
+其它非0的值(如连接中断, 或者python的版本太低、不能运行这个脚本)也不是转换本身的失败, odb2zdf.bat在4以外的情况下直接用abaqus python转换
+"""
+import argparse
+import os
+import sys
+from multiprocessing.connection import Client
+
+from zdf_server import default_address, load_authkey, parse_address
+
+#==============================================================================#
+
+EXIT_NO_SERVER = 3
+EXIT_FAILED = 4 # 服务器执行了转换任务, 但转换失败
+EXIT_CRASHED = 5 # 执行任务的worker进程意外退出, 不是转换本身报告的失败, 可以不通过服务器重新转换
+
+
+def connect(address=None, authkey=None):
+    """
+    :param address: 服务器的地址, 为None时使用default_address()
+    :param authkey: 服务器的authkey, 为None时使用load_authkey()
+    :return: 与服务器的连接, 服务器没有运行时抛出ConnectionError
+    """
+    authkey = authkey if authkey is not None else load_authkey()
+    if authkey is None:
+        raise ConnectionError("no conversion server has been started by this user")
+    try:
+        return Client(address if address is not None else default_address(), authkey=authkey)
+    except OSError as error:
+        raise ConnectionError(f"cannot connect to the conversion server: {error}") from None
+
+
+def request(message, address=None, authkey=None):
+    """
+    发送一个请求, 依次返回服务器发回的事件, 直到最后一个事件(finished、status或shutdown)或者服务器关闭连接。
+    不等待服务器关闭连接: 其它系统上进程池fork出的新worker进程(替换意外退出的worker进程)会继承这个连接,
+    服务器关闭连接之后客户端也可能读不到连接的结束
+    :param message: 请求, 如{"command": "convert", "argv": [...], "cwd": ...}
+    :param address: 服务器的地址
+    :param authkey: 服务器的authkey
+    :return: 事件的迭代器
+    """
+    with connect(address, authkey) as connection:
+        connection.send(message)
+        while True:
+            try:
+                event = connection.recv()
+            except EOFError:
+                return
+            yield event
+            if event["event"] in ("finished", "status", "shutdown"):
+                return
+
+
+def submit(argv, address=None, authkey=None):
+    """
+    提交一个转换任务
+    :param argv: 与odb2zdf.py命令行相同的参数, 如["Job-1.odb", "Job-1.zdf", "--fields", "U"]
+    :param address: 服务器的地址
+    :param authkey: 服务器的authkey
+    :return: 事件的迭代器, 最后一个事件为finished
+    """
+    return request({"command": "convert", "argv": argv, "cwd": os.getcwd()}, address, authkey)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="submit an odb conversion job to the odb2zdf server")
+    parser.add_argument("--address", help="named pipe, unix socket or HOST:PORT of the server")
+    parser.add_argument("--status", action="store_true", help="print the jobs of the server")
+    parser.add_argument("--shutdown", action="store_true", help="stop the server after its current jobs")
+    parser.add_argument("argv", nargs=argparse.REMAINDER,
+                        help="odb_file zdf_file [options], the same arguments as odb2zdf.py")
+    args = parser.parse_args()
+    address = parse_address(args.address) if args.address else None
+    if args.status:
+        message = {"command": "status"}
+    elif args.shutdown:
+        message = {"command": "shutdown"}
+    elif len(args.argv) >= 2:
+        message = {"command": "convert", "argv": args.argv, "cwd": os.getcwd()}
+    else:
+        parser.error("odb_file and zdf_file are required")
+
+    status = 1
+    finished = False
+    try:
+        for event in request(message, address):
+            if event["event"] == "queued":
+                print(f"job {event['job']} queued, {event['position']} job(s) ahead", flush=True)
+            elif event["event"] == "started":
+                print(f"job {event['job']} started", flush=True)
+            elif event["event"] == "progress":
+                print(f"[{event['done']}/{event['total']}] {event['item']}", flush=True)
+            elif event["event"] == "finished":
+                finished = True
+                for line in event["messages"]:
+                    print(line)
+                if event["status"] == "ok":
+                    print(f"converted in {event['time']:.1f}s")
+                    status = 0
+                else:
+                    print(f"conversion failed: {event['error']}", file=sys.stderr)
+                    # job为None时服务器正在停止, 没有接受任务
+                    if event["job"] is None:
+                        status = EXIT_NO_SERVER
+                    else:
+                        status = EXIT_CRASHED if event.get("crashed") else EXIT_FAILED
+            elif event["event"] == "status":
+                print(f"max jobs: {event['max_jobs']}")
+                for job in event["jobs"]:
+                    print(f"job {job['job']} {job['state']}: {' '.join(job['argv'])}")
+                status = 0
+            elif event["event"] == "shutdown":
+                print("server is shutting down")
+                status = 0
+    except ConnectionError as error:
+        print(error, file=sys.stderr)
+        return EXIT_NO_SERVER
+    if message["command"] == "convert" and not finished:
+        print("the connection to the conversion server was lost", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+import bz2
+import collections
+import gzip
+import json
+import lzma
+from concurrent.futures import ThreadPoolExecutor
+
+#==============================================================================#
+
+def _get_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression requires the zstandard package (pip install zstandard)") from None
+    return zstandard
+
+
+# 每种压缩格式: (扩展名, 默认压缩级别, 压缩函数, 解压函数, 以文本模式打开整个文件的函数)。
+# 这些格式都允许多个独立压缩的块(gzip member, bz2/xz stream, zstd frame)直接拼接，拼接结果仍然是一个合法的压缩文件
+CODECS = {
+    "gzip": (".gz", 6,
+             lambda data, level: gzip.compress(data, level, mtime=0),
+             gzip.decompress,
+             lambda path: gzip.open(path, "rt")),
+    "bz2": (".bz2", 9,
+            lambda data, level: bz2.compress(data, level),
+            bz2.decompress,
+            lambda path: bz2.open(path, "rt")),
+    "lzma": (".xz", 6,
+             lambda data, level: lzma.compress(data, preset=level),
+             lzma.decompress,
+             lambda path: lzma.open(path, "rt")),
+    "zstd": (".zst", 3,
+             lambda data, level: _get_zstd().ZstdCompressor(level=level).compress(data),
+             lambda data: _get_zstd().ZstdDecompressor().decompressobj().decompress(data),
+             lambda path: _get_zstd().open(path, "rt")),
+}
+
+
+def check_codec(codec):
+    """
+    检查压缩格式是否可用, 不可用时抛出ValueError
+    """
+    if codec not in CODECS:
+        raise ValueError(f"unknown codec: {codec}, expected one of {tuple(CODECS)}")
+    if codec == "zstd":
+        _get_zstd()
+
+
+def get_codec(path):
+    """
+    :param path: 文件路径
+    :return: 按扩展名判断的压缩格式, 不是压缩文件时返回None
+    """
+    for codec, (extension, *_) in CODECS.items():
+        if path.endswith(extension):
+            return codec
+    return None
+
+
+def open_zdf(path):
+    """
+    以文本模式打开zdf文件, 压缩的zdf文件按扩展名解压
+    """
+    codec = get_codec(path)
+    if codec is None:
+        return open(path)
+    return CODECS[codec][4](path)
+
+
+class ZdfCompressedFile:
+    """
+    压缩的zdf文件, 代替文本文件作为ZdfStreamWriter的输出。
+    写出的文本按块独立压缩，各块依次拼接成一个标准的压缩文件(如gzip的多个member)，用gunzip等工具可以直接解压出完整的zdf。
+    ZdfStreamWriter在写出每个数据块(如一个field)之前调用begin_item: 当前块不小于block_size时在这里开始新的块，
+    因此较大的field各自压缩为一块，较小的数据块合并; 单个块超过max_block_size时在任意位置分块。
+    压缩由workers个线程完成(zlib、bz2、lzma和zstd压缩时都会释放GIL)，与提取和序列化并行。
+    index记录每一块的位置以及每个数据块在解压后的文本中的范围, close时写入"压缩文件.index"，
+    ZdfCompressedReader根据index只解压需要的块
+    """
+    def __init__(self, f, codec="gzip", level=None, workers=1, block_size=4 * 2**20, max_block_size=64 * 2**20):
+        """
+        :param f: 以二进制模式打开的文件对象
+        :param codec: 压缩格式, 参见CODECS
+        :param level: 压缩级别, 为None时使用该格式的默认级别
+        :param workers: 压缩线程数, 为1时在写出的线程中压缩
+        :param block_size: 在数据块之间分块时每块的最小字节数(压缩前)
+        :param max_block_size: 每块的最大字节数(压缩前)
+        """
+        check_codec(codec)
+        self.f = f
+        self.codec = codec
+        self.level = level if level is not None else CODECS[codec][1]
+        self.workers = workers
+        self.block_size = block_size
+        self.max_block_size = max_block_size
+        self.blocks = [] # 每一块: {"offset", "size", "start", "length"}, 分别为压缩后和压缩前的位置和字节数
+        self.items = {} # 数据块的JSON Pointer -> 解压后的[起始位置, 结束位置]
+        self.size = 0 # 压缩后的字节数
+        self._compress = CODECS[codec][2]
+        self._executor = ThreadPoolExecutor(workers) if workers > 1 else None
+        self._pending = collections.deque() # 正在压缩的块: (block, future)
+        self._buffer = []
+        self._buffer_size = 0
+        self._position = 0 # 解压后的位置
+
+    def write(self, text):
+        data = text.encode()
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        self._position += len(data)
+        if self._buffer_size >= self.max_block_size:
+            self._flush_block()
+
+    def tell(self):
+        """
+        :return: 解压后的位置
+        """
+        return self._position
+
+    def begin_item(self, pointer):
+        """
+        开始写出一个数据块, 当前块足够大时在这里分块
+        :param pointer: 数据块的JSON Pointer
+        """
+        if self._buffer_size >= self.block_size:
+            self._flush_block()
+        self.items[pointer] = [self._position, None]
+
+    def end_item(self, pointer):
+        self.items[pointer][1] = self._position
+
+    def _flush_block(self):
+        if not self._buffer_size:
+            return
+        data = b"".join(self._buffer)
+        self._buffer, self._buffer_size = [], 0
+        block = {"offset": None, "size": None, "start": self._position - len(data), "length": len(data)}
+        self.blocks.append(block)
+        if self._executor is None:
+            self._write_block(block, self._compress(data, self.level))
+            return
+        self._pending.append((block, self._executor.submit(self._compress, data, self.level)))
+        # 最多有2 * workers块在压缩或等待写出，避免写出较慢时未压缩的数据在内存中堆积
+        while len(self._pending) >= 2 * self.workers:
+            self._write_block(*self._pop_pending())
+
+    def _pop_pending(self):
+        block, future = self._pending.popleft()
+        return block, future.result()
+
+    def _write_block(self, block, compressed):
+        self.f.write(compressed)
+        block["offset"], block["size"] = self.size, len(compressed)
+        self.size += len(compressed)
+
+    def close(self):
+        """
+        压缩并写出剩余的数据
+        :return: index
+        """
+        self._flush_block()
+        while self._pending:
+            self._write_block(*self._pop_pending())
+        if self._executor is not None:
+            self._executor.shutdown()
+        return self.index()
+
+    def index(self):
+        return {"codec": self.codec, "blocks": self.blocks, "items": self.items}
+
+    def save_index(self, path):
+        """
+        :param path: 压缩文件的路径, index写入path + ".index"
+        """
+        with open(path + ".index", "w") as f:
+            json.dump(self.index(), f)
+
+
+class ZdfCompressedReader:
+    """
+    根据ZdfCompressedFile写出的index随机读取压缩的zdf文件, 只解压需要的块
+    """
+    def __init__(self, path):
+        """
+        :param path: 压缩文件的路径
+        """
+        self.path = path
+        with open(path + ".index") as f:
+            index = json.load(f)
+        self.codec = index["codec"]
+        self.blocks = index["blocks"]
+        self.items = index["items"]
+        self._decompress = CODECS[self.codec][3]
+
+    def read(self, start, stop):
+        """
+        :return: 解压后的文本中[start, stop)范围内的文本
+        """
+        parts = []
+        with open(self.path, "rb") as f:
+            for block in self.blocks:
+                if block["start"] + block["length"] <= start or block["start"] >= stop:
+                    continue
+                f.seek(block["offset"])
+                data = self._decompress(f.read(block["size"]))
+                parts.append(data[max(start - block["start"], 0):stop - block["start"]])
+        return b"".join(parts).decode()
+
+    def read_item(self, pointer):
+        """
+        :param pointer: 数据块的JSON Pointer, 如"/result_sets/Job-1/items/Step-1/U"
+        :return: 数据块的值
+        """
+        start, stop = self.items[pointer]
+        # 文本为 ',\n    "key": value', 去掉前面的逗号后作为一个object解析
+        text = self.read(start, stop).lstrip(",\n ")
+        return next(iter(json.loads("{" + text + "}").values()))
+
+    def find_items(self, prefix):
+        """
+        :param prefix: JSON Pointer的前缀, 如"/result_sets/Job-1/items/Step-1"
+        :return: 以prefix开始的数据块的JSON Pointer
+        """
+        return [pointer for pointer in self.items if pointer == prefix or pointer.startswith(prefix + "/")]
@@ -0,0 +1,157 @@
+import functools
+import json
+import time
+import tracemalloc
+
+#==============================================================================#
+
+def count_rows(value):
+    """
+    数据块中的行数(节点、element或field值的个数)。
+    每个数据块的id和value行数相同, 只计算value; 包含多个数据块的字典(如step、element的各个type)计算总和
+    """
+    if not isinstance(value, dict):
+        return 0
+    record = value.get("value")
+    if isinstance(record, dict) and record.get("__isRecord__"):
+        return record["__dims__"][0]
+    return sum(count_rows(item) for item in value.values())
+
+
+class _Stage:
+    def __init__(self, stage, name, depth):
+        self.stage = stage
+        self.name = name
+        self.depth = depth
+        self.start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.serialized_rows = 0 # 这个阶段中写出的行数
+        self.peak_memory = 0 # 子阶段的峰值内存
+
+
+class ZdfProfiler:
+    """
+    可选的分阶段性能分析。
+    instrument将类的方法(如ZdfField.get_data)替换为记录耗时的版本, restore恢复原来的方法，不使用时没有任何开销。
+    每次调用记录一条结果: 耗时(wall time)、CPU时间、行数、吞吐量(行/秒)以及峰值内存(需要memory=True)。
+    行数: 返回数据块的方法为返回值中的行数, 其它方法(如dump)为其中写出的行数。
+    峰值内存通过tracemalloc测量, 包括NumPy数组, 但会明显降低运行速度
+    """
+    def __init__(self, memory=False):
+        """
+        :param memory: 是否通过tracemalloc记录每个阶段的峰值内存
+        """
+        self.memory = memory
+        self.records = []
+        self._stack = []
+        self._patched = [] # [(类, 方法名称, 原来的方法), ...]
+        self._start = None
+
+    def instrument(self, cls, method_name, get_name=None, get_rows=None):
+        """
+        替换cls的方法, 每次调用时记录一条结果
+        :param cls: 类
+        :param method_name: 方法名称
+        :param get_name: 根据方法的参数(self, *args)返回这次调用的名称(如field名称)的函数, 为None时名称为空
+        :param get_rows: 写出数据块的方法指定, 根据方法的参数(self, *args)返回写出的行数(如count_rows(value)),
+                         计入所有外层阶段的写出行数
+        :return:
+        """
+        method = getattr(cls, method_name)
+        stage = f"{cls.__name__}.{method_name}"
+
+        @functools.wraps(method)
+        def profiled(*args, **kwargs):
+            self._begin(stage, get_name(*args) if get_name is not None else "")
+            result = None
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                rows = get_rows(*args) if get_rows is not None else None
+                self._end(result, rows)
+            return result
+
+        self._patched.append((cls, method_name, method))
+        setattr(cls, method_name, profiled)
+
+    def restore(self):
+        """
+        恢复所有被替换的方法
+        """
+        for cls, method_name, method in reversed(self._patched):
+            setattr(cls, method_name, method)
+        self._patched = []
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _begin(self, stage, name):
+        if self._start is None:
+            self._start = time.perf_counter()
+            if self.memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+        if self.memory:
+            # 外层阶段到目前为止的峰值先记录下来, 再为这个阶段重新开始统计峰值
+            peak = tracemalloc.get_traced_memory()[1]
+            for outer in self._stack:
+                outer.peak_memory = max(outer.peak_memory, peak)
+            tracemalloc.reset_peak()
+        self._stack.append(_Stage(stage, name, len(self._stack)))
+
+    def _end(self, result, serialized_rows):
+        wall_time = time.perf_counter()
+        current = self._stack.pop()
+        wall_time -= current.start
+        cpu_time = time.process_time() - current.cpu_start
+        if serialized_rows is not None:
+            for outer in self._stack:
+                outer.serialized_rows += serialized_rows
+            rows = serialized_rows
+        elif isinstance(result, dict):
+            rows = count_rows(result)
+        else:
+            rows = current.serialized_rows
+
+        record = {
+            "stage": current.stage,
+            "name": current.name,
+            "depth": current.depth,
+            "start": current.start - self._start,
+            "wall_time": wall_time,
+            "cpu_time": cpu_time,
+            "items": rows,
+            "throughput": rows / wall_time if wall_time > 0 else 0.0,
+        }
+        if self.memory:
+            peak = max(current.peak_memory, tracemalloc.get_traced_memory()[1])
+            record["peak_memory"] = peak
+            for outer in self._stack:
+                outer.peak_memory = max(outer.peak_memory, peak)
+        self.records.append(record)
+
+    def summary(self):
+        """
+        :return: 按阶段汇总的结果, {阶段: {calls, wall_time, cpu_time, items, throughput[, peak_memory]}}
+        """
+        summary = {}
+        for record in self.records:
+            stage = summary.setdefault(record["stage"], {"calls": 0, "wall_time": 0.0, "cpu_time": 0.0, "items": 0})
+            stage["calls"] += 1
+            stage["wall_time"] += record["wall_time"]
+            stage["cpu_time"] += record["cpu_time"]
+            stage["items"] += record["items"]
+            if self.memory:
+                stage["peak_memory"] = max(stage.get("peak_memory", 0), record["peak_memory"])
+        for stage in summary.values():
+            stage["throughput"] = stage["items"] / stage["wall_time"] if stage["wall_time"] > 0 else 0.0
+        return summary
+
+    def report(self, **info):
+        """
+        :param info: 写入报告的其它信息, 如odb文件的路径
+        :return: 可以被json序列化的报告
+        """
+        return dict(info, memory=self.memory, stages=self.summary(), records=self.records)
+
+    def save(self, file_path, **info):
+        with open(file_path, "w") as f:
+            json.dump(self.report(**info), f, indent=2)
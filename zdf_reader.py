@@ -0,0 +1,578 @@
+import json
+import mmap
+import os
+import re
+import warnings
+
+import numpy as np
+
+from zdf_compress import get_codec, open_zdf
+from zdf_writer import json_pointer
+
+#==============================================================================#
+
+def is_reference(data):
+    """
+    :param data: __isRecord__中的__data__
+    :return: __data__是否是指向sidecar文件的引用, 参见zdf_writer.ZdfSidecar
+    """
+    return isinstance(data, dict) and "__file__" in data
+
+
+class ZdfRangeArray:
+    """
+    以range编码的id数组(参见zdf_writer.encode_ranges), 只有需要时才展开。
+    len、下标访问和迭代不会展开整个数组; np.asarray(或其它需要完整数组的操作)时才展开，展开的结果会被保存
+    """
+    def __init__(self, segments):
+        """
+        :param segments: [[start, stop, step], id, ...]
+        """
+        self.segments = segments
+        lengths = [len(range(*segment)) if isinstance(segment, list) else 1 for segment in segments]
+        self._ends = np.cumsum(lengths, dtype=np.int64) # 每一段结束的位置
+        self._array = None
+
+    def __len__(self):
+        return int(self._ends[-1]) if len(self._ends) else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return np.asarray(self)[index]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("range array index out of range")
+        position = int(np.searchsorted(self._ends, index, side="right"))
+        segment = self.segments[position]
+        if not isinstance(segment, list):
+            return segment
+        start = int(self._ends[position - 1]) if position > 0 else 0
+        return range(*segment)[index - start]
+
+    def __iter__(self):
+        for segment in self.segments:
+            if isinstance(segment, list):
+                yield from range(*segment)
+            else:
+                yield segment
+
+    def __array__(self, dtype=None, copy=None):
+        if self._array is None:
+            parts, values = [], [] # values: 连续的单个id
+            for segment in self.segments:
+                if isinstance(segment, list):
+                    if values:
+                        parts.append(np.array(values, dtype=np.int64))
+                        values = []
+                    parts.append(np.arange(*segment, dtype=np.int64))
+                else:
+                    values.append(segment)
+            if values:
+                parts.append(np.array(values, dtype=np.int64))
+            self._array = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        return self._array if dtype is None else self._array.astype(dtype, copy=False)
+
+    def tolist(self):
+        return list(self)
+
+    def __eq__(self, other):
+        return np.array_equal(np.asarray(self), np.asarray(other))
+
+    def __repr__(self):
+        return f"ZdfRangeArray({self.segments})"
+
+
+def resolve_ranges(data):
+    """
+    将data中所有{"__ranges__": [...]}形式的__data__替换为ZdfRangeArray, 直接修改data
+    :param data: zdf的字典
+    :return: data
+    """
+    if isinstance(data, dict):
+        if data.get("__isRecord__"):
+            ranges = data.get("__data__")
+            if isinstance(ranges, dict) and "__ranges__" in ranges:
+                data["__data__"] = ZdfRangeArray(ranges["__ranges__"])
+        else:
+            for item in data.values():
+                resolve_ranges(item)
+    return data
+
+
+def resolve_shared_ids(data):
+    """
+    将data中所有{"__ref__": JSON Pointer}形式的__data__替换为被引用的数据块的__data__(同一个对象), 直接修改data。
+    sidecar形式的共享id与普通的sidecar引用相同，不需要处理, 参见zdf_writer.ZdfSharedIds
+    :param data: zdf的字典
+    :return: data
+    """
+    def resolve(value):
+        if not isinstance(value, dict):
+            return
+        if value.get("__isRecord__"):
+            reference = value.get("__data__")
+            if isinstance(reference, dict) and "__ref__" in reference:
+                value["__data__"] = get_pointer(reference["__ref__"])["__data__"]
+            return
+        for item in value.values():
+            resolve(item)
+
+    def get_pointer(pointer):
+        value = data
+        for key in pointer.split("/")[1:]:
+            value = value[key.replace("~1", "/").replace("~0", "~")]
+        return value
+
+    resolve(data)
+    return data
+
+
+def decode_delta(first, delta):
+    """
+    将按行编码为差的连接关系(参见zdf_writer.encode_delta)还原, 所有行一次计算
+    :param first: 每一行的第一个节点, 形状为(n,)
+    :param delta: 其余节点与第一个节点的差, 形状为(n, 节点数 - 1)
+    :return: 形状为(n, 节点数)的int64数组
+    """
+    first = np.asarray(first, dtype=np.int64)
+    delta = np.asarray(delta).reshape(len(first), -1)
+    connectivity = np.empty((len(first), delta.shape[1] + 1), dtype=np.int64)
+    connectivity[:, 0] = first
+    # 较窄的delta在相加时才转换为int64, 不需要先复制一份int64的数组
+    np.add(first[:, None], delta, out=connectivity[:, 1:])
+    return connectivity
+
+
+def decode_quantized(quantized, exponents, rows, nan=None):
+    """
+    将定点编码的浮点数据(参见zdf_writer.ZdfPrecision.quantize)还原, 所有块一次计算
+    :param quantized: 整数数组
+    :param exponents: 每一块每一列的十进制指数, 形状为(块数,) + quantized.shape[1:]
+    :param rows: 每一块的行数
+    :param nan: 表示非有限的值的整数, 没有时为None
+    :return: 与quantized形状相同的float64数组, 值 = 整数 * 10^指数
+    """
+    quantized = np.asarray(quantized)
+    exponents = np.asarray(exponents, dtype=np.int64).reshape((len(rows),) + quantized.shape[1:])
+    exponents = np.repeat(exponents, rows, axis=0)
+    scale = 10.0 ** np.abs(exponents)
+    # 与写出时相同, 整数除以(或乘以)精确的10^|k|, 得到的就是最接近该十进制数的双精度数
+    values = np.where(exponents < 0, quantized / scale, quantized * scale)
+    if nan is not None:
+        values[quantized == nan] = np.nan
+    return values
+
+
+class ZdfSidecarReader:
+    """
+    读取sidecar中的数组。
+    每个sidecar文件只打开一次并memory-map，引用对应的数组是mmap上的只读视图，只有访问时才会从磁盘读入
+    """
+    def __init__(self, directory, mmap=True):
+        """
+        :param directory: zdf文件所在的目录, 引用中的文件名相对于这个目录
+        :param mmap: 是否memory-map sidecar文件, 为False时把每个数组读入内存
+        """
+        self.directory = directory
+        self.mmap = mmap
+        self._buffers = {} # sidecar文件名 -> np.memmap
+
+    def read(self, reference):
+        """
+        :param reference: 指向sidecar的引用
+        :return: 形状为reference["__dims__"]的数组
+        """
+        dtype = np.dtype(reference["__dtype__"])
+        dims = tuple(reference["__dims__"])
+        count = int(np.prod(dims, dtype=np.int64))
+        if count == 0:
+            return np.empty(dims, dtype) # 空文件不能memory-map
+        path = os.path.join(self.directory, reference["__file__"])
+        if not self.mmap:
+            with open(path, "rb") as f:
+                f.seek(reference["__offset__"])
+                return np.fromfile(f, dtype, count).reshape(dims)
+        if path not in self._buffers:
+            self._buffers[path] = np.memmap(path, dtype=np.uint8, mode="r")
+        return np.frombuffer(self._buffers[path], dtype, count, reference["__offset__"]).reshape(dims)
+
+    def read_delta(self, data):
+        """
+        :param data: {"__first__": ..., "__delta__": ...}形式的__data__, 两部分为json文本的数据或者指向sidecar的引用
+        :return: 还原的连接关系
+        """
+        return decode_delta(*(self.read(part) if is_reference(part) else part
+                              for part in (data["__first__"], data["__delta__"])))
+
+    def read_quantized(self, data):
+        """
+        :param data: {"__exponent__": ..., "__rows__": ..., "__quantized__": ...}形式的__data__,
+                     __quantized__为json文本的数据或者指向sidecar的引用
+        :return: 还原的浮点数组
+        """
+        quantized = data["__quantized__"]
+        return decode_quantized(self.read(quantized) if is_reference(quantized) else quantized,
+                                data["__exponent__"], data["__rows__"], data.get("__nan__"))
+
+    def resolve(self, value):
+        """
+        将value中所有指向sidecar的__data__替换为数组, 按差编码的连接关系和定点编码的浮点数据还原为数组, 直接修改value
+        :return: value
+        """
+        if isinstance(value, dict):
+            data = value.get("__data__") if value.get("__isRecord__") else None
+            if is_reference(data):
+                value["__data__"] = self.read(data)
+            elif isinstance(data, dict) and "__delta__" in data:
+                value["__data__"] = self.read_delta(data)
+            elif isinstance(data, dict) and "__quantized__" in data:
+                value["__data__"] = self.read_quantized(data)
+            else:
+                for item in value.values():
+                    self.resolve(item)
+        return value
+
+
+def load_zdf(file_path, mmap=True):
+    """
+    读取zdf文件, 压缩的zdf文件(如.zdf.gz)按扩展名解压。
+    json文本形式的__data__保持为list; sidecar形式的__data__读取为NumPy数组; range编码的id数组为ZdfRangeArray;
+    共享的id数组替换为被引用的数据; 按差编码的连接关系还原为int64数组; 定点编码的浮点数据还原为float64数组
+    :param file_path: zdf文件的路径
+    :param mmap: 是否memory-map sidecar文件
+    :return: zdf的字典
+    """
+    with open_zdf(file_path) as f:
+        data = json.load(f)
+    data = ZdfSidecarReader(os.path.dirname(os.path.abspath(file_path)), mmap).resolve(data)
+    return resolve_shared_ids(resolve_ranges(data))
+
+
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]') # 字符串和括号, 数值等其它文本不影响结构
+_KEY_END = re.compile(rb"\s*:")
+_FLOAT = re.compile(rb"[.eEIN]") # 小数点、指数、Infinity和NaN
+_SCAN_SIZE = 64 * 2**20
+_TOC_RANGE = re.compile(rb'"[^"]*toc_range":\s*\[\s*(\d+),\s*(\d+)\s*\]\s*\}\s*$') # zdf末尾的目录范围
+
+
+def _skip_numeric_array(buffer, start):
+    """
+    :param buffer: zdf文件的内容
+    :param start: 数组开始的"["的位置
+    :return: 数组中只有数值和嵌套的数组时返回数组结束的位置("]"之后), 否则返回None
+    """
+    # 数组之后最近的字符串或object的位置。find比正则表达式快得多, 后两次查找限制在"}"之前
+    stop = buffer.find(b"}", start)
+    stop = stop if stop >= 0 else len(buffer)
+    for char in (b'"', b"{"):
+        position = buffer.find(char, start, stop)
+        stop = position if position >= 0 else stop
+    # 到下一个字符串或object之前括号成对时, 数组在这里已经结束; 否则数组中含有字符串或object
+    depth = 0
+    for begin in range(start, stop, _SCAN_SIZE):
+        part = buffer[begin:min(begin + _SCAN_SIZE, stop)]
+        depth += part.count(b"[") - part.count(b"]")
+    if depth != 0:
+        return None
+    return buffer.rfind(b"]", start, stop) + 1
+
+
+def index_records(buffer):
+    """
+    扫描zdf的文本, 得到每个object和__isRecord__的字节范围, 不解析数值。
+    只有字符串和括号需要逐个处理, 数值数组(如__data__)通过查找和计数整段跳过
+    :param buffer: zdf文件的内容(bytes或mmap)
+    :return: (records, objects): records为JSON Pointer -> {"range": [起始位置, 结束位置], "dims": __dims__,
+             "data": __data__的范围}; objects为其它object的JSON Pointer -> [起始位置, 结束位置], 最外层的object为""。
+             数组中的object没有JSON Pointer, 不在结果中
+    """
+    records, objects = {}, {}
+    # 每一层已打开的object或数组: [JSON Pointer, 在上一层object中的key, 起始位置, object的成员(数组为None)]。
+    # object的成员只记录是否有__isRecord__以及__dims__和__data__的范围
+    stack = []
+    key = None # 当前object中下一个值的key
+    position = 0
+    while True:
+        match = _TOKEN.search(buffer, position)
+        if match is None:
+            break
+        token, start, position = match.group(), match.start(), match.end()
+        parent = stack[-1] if stack else None
+        in_object = parent is not None and parent[3] is not None
+        if token[:1] == b'"':
+            colon = _KEY_END.match(buffer, position) if in_object else None
+            if colon is not None:
+                key = json.loads(token)
+                position = colon.end()
+                if key == "__isRecord__":
+                    parent[3]["__isRecord__"] = True
+            continue
+        if token in b"[{":
+            if parent is None:
+                pointer = ""
+            elif in_object and parent[0] is not None:
+                pointer = parent[0] + json_pointer([key])
+            else:
+                pointer = None
+            if token == b"[":
+                end = _skip_numeric_array(buffer, start)
+                if end is not None:
+                    position = end
+                    if in_object:
+                        parent[3][key] = [start, end]
+                    continue
+            stack.append([pointer, key if in_object else None, start, {} if token == b"{" else None])
+            continue
+        pointer, member_key, start, members = stack.pop()
+        if stack and stack[-1][3] is not None:
+            stack[-1][3][member_key] = [start, position]
+        if members is None or pointer is None:
+            continue
+        if members.get("__isRecord__"):
+            dims = members.get("__dims__")
+            records[pointer] = {"range": [start, position],
+                                "dims": json.loads(buffer[dims[0]:dims[1]]) if dims is not None else None,
+                                "data": members.get("__data__")}
+        else:
+            objects[pointer] = [start, position]
+    return records, objects
+
+
+def read_toc(file_path):
+    """
+    读取写在zdf末尾的目录(参见zdf_writer.ZdfTableOfContents), 只读取文件的末尾和目录本身
+    :param file_path: zdf文件的路径, 不能是压缩的zdf(使用ZdfCompressedReader.read_item("/zw_toc"))
+    :return: 目录, zdf中没有目录时返回None
+    """
+    with open(file_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(size - 256, 0))
+        match = _TOC_RANGE.search(f.read())
+        if match is None:
+            return None
+        start, stop = map(int, match.groups())
+        f.seek(start)
+        text = f.read(stop - start)
+    # 文本为 ',\n  "zw_toc": {...}', 去掉前面的逗号后作为一个object解析
+    return next(iter(json.loads(b"{" + text.lstrip(b",\r\n ") + b"}").values()))
+
+
+def index_toc(toc):
+    """
+    :param toc: read_toc读取的目录
+    :return: 与index_records相同的(records, objects)
+    """
+    records, objects = {}, {}
+
+    def visit(node, pointer):
+        if node.get("__isRecord__"):
+            records[pointer] = {"range": node["__range__"], "dims": node.get("__dims__"),
+                                "data": node.get("__data_range__")}
+            return
+        objects[pointer] = node["__range__"]
+        for key, value in node.items():
+            if isinstance(value, dict) and "__range__" in value:
+                visit(value, pointer + json_pointer([key]))
+
+    visit(toc, "")
+    return records, objects
+
+
+def decode_array(text, dims):
+    """
+    将__data__的json文本转换为NumPy数组, 不经过json解析和Python的list。
+    整数数组为int64, 其它为float64; 不规则的数组或含有null等时按json解析
+    :param text: __data__的文本(bytes)
+    :param dims: __dims__
+    :return: 形状为dims的数组
+    """
+    dims = tuple(dims)
+    dtype = np.float64 if _FLOAT.search(text) else np.int64
+    try:
+        with warnings.catch_warnings():
+            # 较早的NumPy在文本不能完整读取时只给出DeprecationWarning, 通过下面的个数检查
+            warnings.simplefilter("ignore", DeprecationWarning)
+            data = np.fromstring(text.translate(None, b"[]"), dtype, sep=",")
+    except ValueError:
+        data = None
+    if data is None or data.size != int(np.prod(dims, dtype=np.int64)):
+        return np.array(json.loads(text))
+    return data.reshape(dims)
+
+
+def _split_pointer(pointer):
+    return [key.replace("~1", "/").replace("~0", "~") for key in pointer.split("/")[1:]]
+
+
+class ZdfLazyReader:
+    """
+    按需读取zdf文件中的数据块, 不解析整个文件, 用于json.load无法处理的大文件。
+    zdf末尾有目录时(参见zdf_writer.ZdfTableOfContents)直接使用目录中的位置;
+    否则第一次打开时扫描一遍文件(参见index_records), 记录每个object和__isRecord__的字节范围,
+    索引保存在zdf旁的"zdf文件.records"中, 之后文件的大小和修改时间不变时直接读取索引。
+    read读取一个__isRecord__时只转换它的__data__, 得到NumPy数组; 读取一个object(如一个field)时只解析这个object,
+    其中的__isRecord__同样直接转换为NumPy数组。文件通过mmap访问, 只有读取的部分会从磁盘读入。
+    sidecar、range编码和共享的id数组与load_zdf一样解析
+    """
+    index_version = 1
+
+    def __init__(self, file_path, cache=True, mmap=True):
+        """
+        :param file_path: zdf文件的路径, 不能是压缩的zdf(使用zdf_compress.ZdfCompressedReader)
+        :param cache: 是否把索引保存在zdf旁并在之后重复使用
+        :param mmap: 是否memory-map sidecar文件
+        """
+        if get_codec(file_path) is not None:
+            raise ValueError(f"{file_path} is compressed, use zdf_compress.ZdfCompressedReader to read it")
+        self.file_path = file_path
+        self._file = open(file_path, "rb")
+        self._buffer = self._map(self._file)
+        self._sidecar = ZdfSidecarReader(os.path.dirname(os.path.abspath(file_path)), mmap)
+        self.toc = read_toc(file_path)
+        self.records, self.objects = index_toc(self.toc) if self.toc is not None else self._load_index(cache)
+
+    @staticmethod
+    def _map(f):
+        if os.fstat(f.fileno()).st_size == 0:
+            return b"" # 空文件不能memory-map
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def index_path(self):
+        return self.file_path + ".records"
+
+    def _load_index(self, cache):
+        stat = os.stat(self.file_path)
+        identity = {"version": self.index_version, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        if cache:
+            try:
+                with open(self.index_path()) as f:
+                    index = json.load(f)
+                if all(index.get(key) == value for key, value in identity.items()):
+                    return index["records"], index["objects"]
+            except (OSError, ValueError, KeyError):
+                pass
+        records, objects = index_records(self._buffer)
+        if cache:
+            temp_path = f"{self.index_path()}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, "w") as f:
+                    json.dump(dict(identity, records=records, objects=objects), f)
+                os.replace(temp_path, self.index_path())
+            except OSError:
+                pass # zdf所在的目录不可写时不保存索引
+        return records, objects
+
+    @staticmethod
+    def _pointer(path):
+        """
+        :param path: JSON Pointer(如"/result_sets/Job-1/items/Step-1/U/value"), 也可以省略开头的"/"
+        """
+        return path if not path or path.startswith("/") else "/" + path
+
+    def __contains__(self, path):
+        path = self._pointer(path)
+        return path in self.records or path in self.objects
+
+    def find_records(self, prefix=""):
+        """
+        :param prefix: JSON Pointer的前缀, 如"/result_sets/Job-1/items/Step-1"
+        :return: 以prefix开始的__isRecord__的JSON Pointer
+        """
+        prefix = self._pointer(prefix)
+        return [pointer for pointer in self.records if pointer == prefix or pointer.startswith(prefix + "/")]
+
+    def dims(self, path):
+        """
+        :return: __isRecord__的__dims__, 不读取数据
+        """
+        return self.records[self._pointer(path)]["dims"]
+
+    def read(self, path):
+        """
+        :param path: __isRecord__或object的JSON Pointer
+        :return: __isRecord__为__data__的NumPy数组; object为字典, 其中__isRecord__的__data__为NumPy数组
+        """
+        pointer = self._pointer(path)
+        if pointer in self.records:
+            return self._read_record(self.records[pointer])
+        if pointer in self.objects:
+            return self._read_object(pointer)
+        raise KeyError(path)
+
+    def _read_record(self, record):
+        if record["data"] is None:
+            raise ValueError(f"the record at byte {record['range'][0]} has no __data__")
+        start, stop = record["data"]
+        text = self._buffer[start:stop]
+        if text[:1] == b"[":
+            return decode_array(text, record["dims"])
+        if text.find(b'"__first__"', 0, 256) >= 0 and b'"__file__"' not in text:
+            return self._read_delta_text(text, record["dims"])
+        if text.find(b'"__exponent__"', 0, 256) >= 0 and b'"__file__"' not in text:
+            return self._read_quantized_text(text, record["dims"])
+        data = json.loads(text)
+        if is_reference(data):
+            return self._sidecar.read(data)
+        if isinstance(data, dict) and "__ranges__" in data:
+            return np.asarray(ZdfRangeArray(data["__ranges__"]))
+        if isinstance(data, dict) and "__ref__" in data:
+            return self.read(data["__ref__"])
+        if isinstance(data, dict) and "__delta__" in data:
+            return self._sidecar.read_delta(data)
+        if isinstance(data, dict) and "__quantized__" in data:
+            return self._sidecar.read_quantized(data)
+        return np.asarray(data)
+
+    def _read_delta_text(self, text, dims):
+        # json文本形式的差编码: 两个数值数组依次为__first__和__delta__, 各自直接转换为NumPy数组
+        try:
+            first_start = text.index(b"[", text.index(b'"__first__"'))
+            delta_key = text.index(b'"__delta__"', first_start)
+            first_stop = text.rindex(b"]", first_start, delta_key) + 1
+            delta_start = text.index(b"[", delta_key)
+            delta_stop = text.rindex(b"]") + 1
+        except ValueError:
+            return self._sidecar.read_delta(json.loads(text))
+        return decode_delta(decode_array(text[first_start:first_stop], dims[:1]),
+                            decode_array(text[delta_start:delta_stop], [dims[0], dims[1] - 1]))
+
+    def _read_quantized_text(self, text, dims):
+        # json文本形式的定点编码: __quantized__是最后一项, 之前的指数等较小, 按json解析, 整数数组直接转换为NumPy数组
+        key = text.rfind(b'"__quantized__"')
+        start = text.find(b"[", key)
+        if key < 0 or start < 0:
+            return self._sidecar.read_quantized(json.loads(text))
+        data = json.loads(text[:key].rstrip().rstrip(b",") + b"}")
+        return decode_quantized(decode_array(text[start:text.rindex(b"]") + 1], dims),
+                                data["__exponent__"], data["__rows__"], data.get("__nan__"))
+
+    def _read_object(self, pointer):
+        # 只解析这个object的文本, 其中__data__的文本替换为null, 再逐个转换为NumPy数组。
+        # 目录中最外层object的结束位置为None, 即文件末尾
+        start, stop = self.objects[pointer]
+        inner = sorted((record["data"], key) for key, record in self.records.items()
+                       if key.startswith(pointer + "/") and record["data"] is not None)
+        parts, position = [], start
+        for (data_start, data_stop), _ in inner:
+            parts.extend([self._buffer[position:data_start], b"null"])
+            position = data_stop
+        parts.append(self._buffer[position:stop])
+        value = json.loads(b"".join(parts))
+        for _, key in inner:
+            record = value
+            for name in _split_pointer(key[len(pointer):]):
+                record = record[name]
+            record["__data__"] = self._read_record(self.records[key])
+        return value
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
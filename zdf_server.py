@@ -0,0 +1,256 @@
+import multiprocessing
+import os
+import queue
+import secrets
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+#==============================================================================#
+# 常驻的转换服务器。服务器和客户端之间通过multiprocessing.connection通信:
+# Windows上是命名管道, 其它系统上是unix socket(也可以指定HOST:PORT), 连接时用authkey认证。
+# 客户端发送一个请求, 服务器依次发回事件, 每个事件是一个字典, event为事件的类型:
+#   请求: {"command": "convert", "argv": [odb_file, zdf_file, 其它参数...], "cwd": 客户端的工作目录}
+#         {"command": "status"} 或 {"command": "shutdown"}
+#   事件: queued(job, position) -> started(job, pid) -> progress(job, done, total, item)... -> finished(job, status, time,
+#         messages[, error, crashed]); status请求返回status(max_jobs, jobs), shutdown请求返回shutdown。
+#         执行任务的worker进程意外退出(例如odbAccess崩溃或者内存不足被杀掉)时, finished的status为failed, crashed为True
+
+def default_address():
+    """
+    :return: 服务器默认的地址, Windows上为命名管道, 其它系统上为临时目录中的unix socket
+    """
+    if sys.platform == "win32":
+        return r"\\.\pipe\odb2zdf"
+    return os.path.join(tempfile.gettempdir(), f"odb2zdf-{os.getuid()}.sock")
+
+
+def parse_address(text):
+    """
+    :param text: 命名管道(如\\\\.\\pipe\\odb2zdf)、unix socket的路径或者HOST:PORT
+    :return: multiprocessing.connection使用的地址
+    """
+    host, _, port = text.rpartition(":")
+    if host and port.isdigit() and not text.startswith("\\\\"):
+        return host, int(port)
+    return text
+
+
+def authkey_path():
+    return os.path.join(os.path.expanduser("~"), ".odb2zdf_authkey")
+
+
+def load_authkey(create=False):
+    """
+    读取服务器和客户端共用的authkey, 只有能读取这个文件的用户可以提交任务
+    :param create: 文件不存在时是否创建新的authkey(由服务器创建)
+    :return: authkey, 文件不存在且create为False时返回None
+    """
+    path = authkey_path()
+    if not os.path.exists(path):
+        if not create:
+            return None
+        with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            f.write(secrets.token_hex(32))
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+_server_events = None # worker进程中向服务器发送事件的队列
+
+
+def _init_server_worker(events, initializer, initargs):
+    global _server_events
+    _server_events = events
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _run_job(handler, job_id, argv, cwd):
+    """
+    在worker进程中执行一个任务, 开始、进度和结束都作为事件发回服务器, 失败时不抛出异常
+    """
+    _server_events.put({"event": "started", "job": job_id, "pid": os.getpid()})
+    start = time.perf_counter()
+
+    def progress(done, total, item):
+        _server_events.put({"event": "progress", "job": job_id, "done": done, "total": total, "item": item})
+
+    try:
+        if cwd is not None:
+            # 每个worker进程同时只执行一个任务, 相对路径相对于客户端的工作目录
+            os.chdir(cwd)
+        result = {"status": "ok", "messages": handler(argv, progress)}
+    except Exception as error:
+        result = {"status": "failed", "messages": [], "error": f"{type(error).__name__}: {error}",
+                  "traceback": traceback.format_exc()}
+    _server_events.put(dict(result, event="finished", job=job_id, time=time.perf_counter() - start))
+
+
+class ZdfServer:
+    """
+    常驻的转换服务器, python解释器和转换模块只加载一次。
+    每个任务由进程池中的worker进程执行, 最多同时执行max_jobs个任务, 其它任务在进程池的队列中等待。
+    worker进程一直保留, 模块已经导入, 任务开始时不需要重新启动。
+    任务的事件(开始、每个item的进度、结束)由worker进程放入队列, 服务器的分发线程把它们发回提交任务的客户端。
+    worker进程在执行任务时意外退出, 进程池会启动新的worker进程, 但不会结束这个任务;
+    分发线程在没有事件时检查执行任务的worker进程是否还在, 不在时替它发出失败的finished事件
+    """
+    poll_interval = 1.0 # 分发线程没有事件时检查worker进程的间隔(秒)
+
+    def __init__(self, handler, address=None, authkey=None, max_jobs=1, initializer=None, initargs=()):
+        """
+        :param handler: 执行任务的函数handler(argv, progress), 返回转换结果的说明(每项一行), 失败时抛出异常。
+                        progress(done, total, item)报告进度。handler在worker进程中调用, 必须是模块级的函数
+        :param address: 监听的地址, 为None时使用default_address()
+        :param authkey: 客户端认证用的authkey, 为None时使用load_authkey(create=True)
+        :param max_jobs: 同时执行的任务个数
+        :param initializer: 每个worker进程启动时调用initializer(*initargs), 必须是模块级的函数。
+                            Windows上worker进程重新导入模块而不执行__main__, 服务器进程中的设置需要在这里重新加载
+        :param initargs: initializer的参数
+        """
+        self.handler = handler
+        self.address = address if address is not None else default_address()
+        self.authkey = authkey if authkey is not None else load_authkey(create=True)
+        self.max_jobs = max_jobs
+        self.initializer = initializer
+        self.initargs = tuple(initargs)
+        self._events = multiprocessing.Queue()
+        self._jobs = {} # job id -> {"argv", "state", "connection"[, "pid", "start"]}
+        self._next_job_id = 1
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.ready = threading.Event() # 开始监听后设置, 在其它线程中运行serve_forever时可以等待它
+
+    def serve_forever(self):
+        """
+        接受并执行任务, 直到收到shutdown请求; 停止时等待已经提交的任务完成
+        """
+        self._remove_stale_socket()
+        listener = Listener(self.address, authkey=self.authkey)
+        pool = multiprocessing.Pool(self.max_jobs, _init_server_worker,
+                                    (self._events, self.initializer, self.initargs))
+        dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        dispatcher.start()
+        self.ready.set()
+        try:
+            while not self._stopping:
+                try:
+                    connection = listener.accept()
+                except (AuthenticationError, OSError, EOFError):
+                    continue
+                threading.Thread(target=self._handle, args=(connection, pool), daemon=True).start()
+        finally:
+            listener.close()
+            pool.close()
+            # worker进程意外退出时进程池中留下永远不会完成的任务, pool.join()会一直等待它,
+            # 因此等分发线程结束所有的任务之后直接停止worker进程
+            while True:
+                with self._lock:
+                    if not self._jobs:
+                        break
+                time.sleep(0.1)
+            pool.terminate()
+            pool.join()
+            self._events.put(None)
+            dispatcher.join()
+
+    def _remove_stale_socket(self):
+        # 上一次的服务器没有正常退出时会留下unix socket文件, 没有服务器在监听时删除它
+        if not isinstance(self.address, str) or self.address.startswith("\\\\") or not os.path.exists(self.address):
+            return
+        try:
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            os.remove(self.address)
+            return
+        raise RuntimeError(f"another server is listening on {self.address}")
+
+    def _handle(self, connection, pool):
+        try:
+            request = connection.recv()
+        except (OSError, EOFError):
+            connection.close()
+            return
+        command = request.get("command", "convert")
+        if command == "status":
+            with self._lock:
+                jobs = [{"job": job_id, "argv": job["argv"], "state": job["state"]}
+                        for job_id, job in self._jobs.items()]
+            self._send(connection, {"event": "status", "max_jobs": self.max_jobs, "jobs": jobs})
+            connection.close()
+        elif command == "shutdown":
+            self._stopping = True
+            self._send(connection, {"event": "shutdown"})
+            connection.close()
+            # 唤醒阻塞在accept中的主线程
+            try:
+                Client(self.address, authkey=self.authkey).close()
+            except OSError:
+                pass
+        elif command == "convert" and not self._stopping:
+            with self._lock:
+                job_id = self._next_job_id
+                self._next_job_id += 1
+                position = sum(job["state"] == "queued" for job in self._jobs.values())
+                self._jobs[job_id] = {"argv": request["argv"], "state": "queued", "connection": connection}
+                self._send(connection, {"event": "queued", "job": job_id, "position": position})
+            pool.apply_async(_run_job, (self.handler, job_id, request["argv"], request.get("cwd")))
+        else:
+            self._send(connection, {"event": "finished", "job": None, "status": "failed", "time": 0.0,
+                                    "messages": [], "error": f"server cannot accept the {command} request"})
+            connection.close()
+
+    def _dispatch(self):
+        """
+        把worker进程的事件发回对应的客户端
+        """
+        while True:
+            try:
+                event = self._events.get(timeout=self.poll_interval)
+            except queue.Empty:
+                # 队列为空时已经退出的worker进程发出的事件都已经处理
+                self._fail_crashed_jobs()
+                continue
+            if event is None:
+                return
+            self._send_event(event)
+
+    def _send_event(self, event):
+        with self._lock:
+            job = self._jobs.get(event["job"])
+            if job is None:
+                return # 已经作为意外退出的任务结束
+            if event["event"] == "started":
+                job["state"] = "running"
+                job["pid"], job["start"] = event["pid"], time.perf_counter()
+            if job["connection"] is not None and not self._send(job["connection"], event):
+                job["connection"] = None # 客户端已经断开, 任务继续执行
+            if event["event"] == "finished":
+                if job["connection"] is not None:
+                    job["connection"].close()
+                del self._jobs[event["job"]]
+
+    def _fail_crashed_jobs(self):
+        """
+        执行任务的worker进程已经退出(不再是服务器的子进程)时, 替它发出失败的finished事件
+        """
+        alive = {process.pid for process in multiprocessing.active_children()}
+        with self._lock:
+            crashed = [(job_id, job) for job_id, job in self._jobs.items()
+                       if job["state"] == "running" and job["pid"] not in alive]
+        for job_id, job in crashed:
+            self._send_event({"event": "finished", "job": job_id, "status": "failed", "crashed": True,
+                              "time": time.perf_counter() - job["start"], "messages": [],
+                              "error": f"the worker process {job['pid']} exited unexpectedly during the conversion"})
+
+    @staticmethod
+    def _send(connection, event):
+        try:
+            connection.send(event)
+        except (OSError, EOFError):
+            return False
+        return True
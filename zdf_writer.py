@@ -0,0 +1,829 @@
+import hashlib
+import json
+import shutil
+import tempfile
+
+import numpy as np
+
+#==============================================================================#
+
+class ZdfPrecision:
+    """
+    浮点数据的精度策略, 作用于__isRecord__中的浮点数组, 即field的值和节点坐标(id和connectivity是整数，不受影响)。
+    odb中的数据是单精度的，但转为Python float后会按双精度写出(如0.000305751571431756)，文本长度远超实际精度。
+    三种模式, 每种模式的误差界(error_bound)含义不同:
+        float32: 写出能还原为同一个float32的最短十进制表示, 读取后与odb中的float32数据完全相同,
+                 写出的十进制数与原数据的相对误差 <= 2^-24
+        digits: 每个值保留digits位有效数字, 每个值的相对误差 <= 0.5 * 10^(1 - digits)
+        quantize: 定点编码。每一列(每个variable或坐标分量)按统一的十进制步长10^k取整, 保存为以10^k为单位的整数,
+                  10^k由该列的最大绝对值和digits决定, 误差 <= 0.5 * 10^(1 - digits) * 该列的最大绝对值。
+                  整数的绝对值不超过10^digits, 使用能容纳它的最窄的整数类型(digits <= 4时为int16)。
+                  ZdfStreamWriter按chunk_size行分块处理数据, 每一块单独选择步长, __data__写为
+                  {"__exponent__": 每一块每一列的k, "__rows__": 每一块的行数, "__quantized__": 整数数组},
+                  参见zdf_reader.decode_quantized
+    """
+    modes = ("float32", "digits", "quantize")
+
+    def __init__(self, mode="float32", digits=6):
+        """
+        :param mode: float32, digits或quantize
+        :param digits: digits和quantize模式下的有效数字位数
+        """
+        if mode not in self.modes:
+            raise ValueError(f"unknown precision mode: {mode}, expected one of {self.modes}")
+        if mode != "float32" and not 1 <= digits <= 17:
+            raise ValueError(f"digits must be between 1 and 17, got {digits}")
+        self.mode = mode
+        self.digits = digits
+        self.max_error = 0.0 # 已处理的数据中实际的最大误差, 与error_bound的含义相同
+
+    @property
+    def error_bound(self):
+        if self.mode == "float32":
+            return 2.0 ** -24
+        return 0.5 * 10.0 ** (1 - self.digits)
+
+    def describe(self):
+        """
+        :return: 精度策略和误差界的说明
+        """
+        if self.mode == "float32":
+            return f"float32 shortest repr (reads back as the same float32), relative error <= {self.error_bound:.3g}"
+        if self.mode == "digits":
+            return f"{self.digits} significant digits, relative error <= {self.error_bound:.3g}"
+        return (f"quantized to {self.digits} significant digits of each column's max, "
+                f"error <= {self.error_bound:.3g} * max |column|")
+
+    def apply(self, data):
+        """
+        按精度策略处理一个数组, 并更新max_error
+        :param data: NumPy数组或者嵌套的list, 非浮点数据原样返回
+        :return: float64数组, 每个值的repr即为处理后的十进制表示; quantize模式下为定点编码还原后的值
+        """
+        data = np.asarray(data)
+        if data.dtype.kind != "f":
+            return data
+        if self.mode == "quantize":
+            quantized, exponents = self.quantize(data)
+            result = _from_decimal(quantized, exponents)
+            return np.where(np.isfinite(data), result, data)
+        original = data.astype(np.float64)
+        with np.errstate(all="ignore"):
+            if self.mode == "float32":
+                result = self._shortest_float32(data)
+            else:
+                result = _round_significant(original, self.digits)
+            error = np.abs(result - original) / np.abs(original)
+            result = np.where(np.isfinite(original), result, original)
+        self._update_error(error)
+        return result
+
+    @property
+    def quantized_dtype(self):
+        """
+        :return: quantize模式下整数的类型, 能容纳[-10^digits, 10^digits], 最小值保留给非有限的值(NaN、inf)
+        """
+        return narrow_int(np.array([-10 ** self.digits - 1, 10 ** self.digits])).dtype
+
+    def quantize(self, data):
+        """
+        quantize模式的定点编码, 并更新max_error
+        :param data: 浮点数组, 二维数组的每一列单独选择步长, 一维数组作为一列
+        :return: (整数数组, 每一列的十进制指数k), 值 = 整数 * 10^k; 非有限的值为quantized_dtype的最小值
+        """
+        original = np.asarray(data, dtype=np.float64)
+        finite = np.isfinite(original)
+        column_max = np.max(np.abs(original), axis=0, initial=0.0, where=finite)
+        with np.errstate(all="ignore"):
+            exponents = np.floor(np.log10(column_max, out=np.zeros_like(column_max), where=column_max > 0))
+            exponents = exponents.astype(np.int64) - self.digits + 1
+            quantized = _to_decimal(original, exponents)
+            # log10在10的整数次幂附近可能偏小1, 此时整数超过10^digits, 改用大一级的步长
+            overflow = np.max(np.abs(quantized), axis=0, initial=0.0, where=finite) > 10 ** self.digits
+            if np.any(overflow):
+                exponents = exponents + overflow
+                quantized = _to_decimal(original, exponents)
+            self._update_error(np.abs(_from_decimal(quantized, exponents) - original) / column_max)
+        dtype = self.quantized_dtype
+        quantized = np.where(finite, quantized, np.iinfo(dtype).min).astype(dtype)
+        return quantized, exponents
+
+    def _update_error(self, error):
+        error = error[np.isfinite(error)]
+        if error.size > 0:
+            self.max_error = max(self.max_error, float(error.max()))
+
+    @staticmethod
+    def _shortest_float32(data):
+        """
+        对每个值依次尝试6~9位有效数字, 取能还原为同一个float32的最短的一个。9位有效数字总是可以还原
+        """
+        single = data.astype(np.float32).ravel()
+        original = single.astype(np.float64)
+        result = original.copy()
+        pending = np.flatnonzero(np.isfinite(original) & (original != 0))
+        for digits in (6, 7, 8, 9):
+            candidate = _round_significant(original[pending], digits)
+            exact = candidate.astype(np.float32) == single[pending]
+            result[pending[exact]] = candidate[exact]
+            pending = pending[~exact]
+        return result.reshape(data.shape)
+
+
+def _to_decimal(data, exponents):
+    """
+    :return: data以10^exponents为单位取整的整数(float64数组)
+    """
+    scale = 10.0 ** np.abs(exponents)
+    return np.where(exponents < 0, np.round(data * scale), np.round(data / scale))
+
+
+def _from_decimal(quantized, exponents):
+    """
+    :return: quantized * 10^exponents。
+             10^|exponents|在22以内时是精确的双精度数, 整数除以(或乘以)它得到的就是最接近该十进制数的双精度数，repr即为该十进制数
+    """
+    scale = 10.0 ** np.abs(exponents)
+    return np.where(exponents < 0, quantized / scale, quantized * scale)
+
+
+def _round_decimal(data, exponents):
+    """
+    将data取整为10^exponents的整数倍
+    """
+    return _from_decimal(_to_decimal(data, exponents), exponents)
+
+
+def _round_significant(data, digits):
+    """
+    每个值保留digits位有效数字
+    """
+    magnitude = np.floor(np.log10(np.abs(data), out=np.zeros_like(data), where=data != 0))
+    return _round_decimal(data, magnitude - digits + 1)
+
+
+class ZdfSidecar:
+    """
+    zdf的二进制sidecar文件。
+    sidecar模式下，__isRecord__的__data__不再写成json文本，而是以little-endian的原始数组依次写入sidecar文件，
+    zdf中的__data__替换为指向sidecar的引用:
+        {"__file__": "Job-1.zdf.bin", "__offset__": 0, "__dtype__": "<f4", "__dims__": [2767, 4]}
+    读取时可以直接memory-map sidecar文件，不需要解析文本，参见zdf_reader.py
+    """
+    alignment = 8 # 每个数组的起始位置按8字节对齐
+
+    def __init__(self, f, file_name, offset=0):
+        """
+        :param f: 以二进制模式打开的sidecar文件对象
+        :param file_name: 写入引用中的sidecar文件名, 相对于zdf文件所在的目录
+        :param offset: f当前位置在sidecar文件中的偏移量, 向已有的sidecar文件追加时为原来的文件大小
+        """
+        self.f = f
+        self.file_name = file_name
+        self.offset = offset
+
+    def write_array(self, data, reference=None):
+        """
+        将一个数组写入sidecar文件
+        :param data: NumPy数组或者嵌套的list
+        :param reference: 之前写入的数组的引用, 指定时data紧接着写在该数组之后(按行拼接), 并更新引用中的__dims__,
+                          用于逐块写入一个数组; 之间不能写入其它数组
+        :return: 替代__data__的引用
+        """
+        data = np.asarray(data)
+        if reference is not None:
+            data = np.ascontiguousarray(data, dtype=np.dtype(reference["__dtype__"]))
+            self.f.write(memoryview(data).cast("B"))
+            self.offset += data.nbytes
+            reference["__dims__"][0] += len(data)
+            return reference
+        data = np.ascontiguousarray(data, dtype=data.dtype.newbyteorder("<"))
+        padding = -self.offset % self.alignment
+        if padding:
+            self.f.write(bytes(padding))
+            self.offset += padding
+        reference = {
+            "__file__": self.file_name,
+            "__offset__": self.offset,
+            "__dtype__": data.dtype.str,
+            "__dims__": list(data.shape),
+        }
+        self.f.write(memoryview(data).cast("B"))
+        self.offset += data.nbytes
+        return reference
+
+
+class ZdfSharedIds:
+    """
+    id数组的去重。
+    节点上的field(U, RF等)的id通常与mesh中节点的id完全相同, 单元上的field之间的id也相同。
+    每个key为id的__isRecord__按内容计算hash, 第一次出现时正常写出, 之后相同的id数组的__data__替换为引用:
+        json文本: {"__ref__": "/model/mesh/nodes/id"}, 即第一次写出该数组的数据块的JSON Pointer(RFC 6901)
+        sidecar: 与第一次写出时相同的sidecar引用, 不会重复写入sidecar文件
+    align为True时, 如果一个数据块的id与之前写出的某个id数组只是顺序不同, 先将该数据块的各行按之前的顺序重新排列
+    (例如按mesh中节点的顺序), 再替换为引用
+    """
+    def __init__(self, references=None, align=True):
+        """
+        :param references: 已经写出的id数组, {hash: 替代__data__的引用}, 向已有的zdf追加时由ZdfManifest给出
+        :param align: 是否按之前写出的id数组的顺序重新排列数据块
+        """
+        self.references = dict(references) if references is not None else {}
+        self.align = align
+        self._orders = {} # 排序后的id数组的hash -> 第一次写出的id数组, 用于重新排列
+        self.shared_arrays, self.shared_ids, self.aligned_arrays = 0, 0, 0
+
+    @staticmethod
+    def is_ids(data):
+        return isinstance(data, np.ndarray) and data.ndim == 1 and data.dtype.kind in "iu"
+
+    @staticmethod
+    def _digest(ids):
+        # int32和int64的id数组内容相同时hash也相同
+        return hashlib.sha1(np.ascontiguousarray(ids, dtype="<i8")).hexdigest()
+
+    def lookup(self, ids):
+        """
+        :param ids: id数组
+        :return: 之前写出的相同id数组的引用, 没有时返回None
+        """
+        reference = self.references.get(self._digest(ids))
+        if reference is not None:
+            self.shared_arrays += 1
+            self.shared_ids += len(ids)
+        return reference
+
+    def register(self, ids, reference):
+        """
+        记录一个第一次写出的id数组
+        :param ids: id数组
+        :param reference: 之后相同的id数组替代__data__的引用
+        """
+        self.references[self._digest(ids)] = reference
+        if self.align:
+            self._orders.setdefault(self._digest(np.sort(ids)), ids)
+
+    def align_records(self, value):
+        """
+        :param value: 包含id数据块的字典, 如一个field
+        :return: value的id与之前写出的某个id数组只是顺序不同时, 返回按该数组的顺序重新排列各数据块之后的value(不修改原来的value),
+                 否则返回value
+        """
+        ids = np.asarray(value["id"]["__data__"])
+        if not self.align or not self.is_ids(ids) or self._digest(ids) in self.references:
+            return value
+        target = self._orders.get(self._digest(np.sort(ids)))
+        if target is None:
+            return value
+        sorter = np.argsort(ids, kind="stable")
+        sorted_ids = ids[sorter]
+        if np.any(sorted_ids[1:] == sorted_ids[:-1]):
+            return value # 有重复的id时各行的对应关系不确定
+        rows = sorter[np.searchsorted(sorted_ids, target)]
+        self.aligned_arrays += 1
+        # 与id行数相同的数据块(id, value)按同样的顺序重新排列
+        return {key: dict(item, __data__=np.asarray(item["__data__"])[rows])
+                if isinstance(item, dict) and item.get("__isRecord__") and item["__dims__"][:1] == [len(ids)]
+                else item
+                for key, item in value.items()}
+
+    def describe(self):
+        return (f"shared ids: {self.shared_arrays} id arrays replaced by references ({self.shared_ids} ids), "
+                f"{self.aligned_arrays} reordered to an existing order")
+
+
+def encode_ranges(ids, min_run=4):
+    """
+    将id数组中的等差数列(如1..N)编码为[start, stop, step](与Python的range相同, 不包括stop), 其余的id保留为整数:
+        [1, 2, 3, 4, 5, 9, 20, 22, 24, 26] -> [[1, 6, 1], 9, [20, 28, 2]]
+    相邻的差按向量化的方式比较, 只在等差数列的个数上循环
+    :param ids: 一维的整数数组
+    :param min_run: 至少多少个id的等差数列才编码为range
+    :return: 编码结果的list, 没有足够长的等差数列时返回None
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) < min_run:
+        return None
+    steps = np.diff(ids)
+    if np.all(steps == steps[0]) and steps[0] != 0:
+        return [[int(ids[0]), int(ids[-1] + steps[0]), int(steps[0])]]
+    # 差相同的连续区间: 第r个区间为steps[starts[r]:starts[r + 1]], 对应ids[starts[r]]到ids[starts[r + 1]]
+    starts = np.concatenate([[0], np.flatnonzero(steps[1:] != steps[:-1]) + 1, [len(steps)]])
+    runs = np.flatnonzero((starts[1:] - starts[:-1] >= min_run - 1) & (steps[starts[:-1]] != 0))
+    if len(runs) == 0:
+        return None
+    segments = []
+    position = 0 # 之前的id都已经编码
+    for run in runs:
+        start = max(int(starts[run]), position) # 与前一个range共用的第一个id已经编码
+        stop = int(starts[run + 1]) + 1
+        if stop - start < min_run:
+            continue
+        segments.extend(ids[position:start].tolist())
+        step = int(steps[starts[run]])
+        segments.append([int(ids[start]), int(ids[stop - 1]) + step, step])
+        position = stop
+    segments.extend(ids[position:].tolist())
+    return segments if len(segments) < len(ids) else None
+
+
+def narrow_int(data):
+    """
+    :param data: 整数数组
+    :return: 转换为能表示其中所有值的最窄的整数类型(如int8、uint16)的数组
+    """
+    if data.size == 0:
+        return data
+    low, high = int(data.min()), int(data.max())
+    for dtype in (np.uint8, np.uint16, np.uint32) if low >= 0 else (np.int8, np.int16, np.int32):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return data.astype(dtype, copy=False)
+    return data.astype(np.int64, copy=False)
+
+
+def encode_delta(connectivity):
+    """
+    将element的连接关系按行编码为第一个节点和其余节点与第一个节点的差。
+    同一个element的节点通常是相邻的节点, label相近, 差比label本身小得多, 两部分各自使用最窄的整数类型:
+        [[1001, 1002, 1051, 1052], ...] -> first: [1001, ...] (uint16), delta: [[1, 50, 51], ...] (uint8)
+    :param connectivity: 形状为(n, 每个element的节点数)的整数数组
+    :return: (first, delta), 形状分别为(n,)和(n, 节点数 - 1), 参见zdf_reader.decode_delta
+    """
+    connectivity = np.asarray(connectivity, dtype=np.int64)
+    first = connectivity[:, 0]
+    return narrow_int(first), narrow_int(connectivity[:, 1:] - first[:, None])
+
+
+def json_pointer(path):
+    """
+    :param path: key的列表, 如["model", "mesh", "nodes", "id"]
+    :return: JSON Pointer, 如"/model/mesh/nodes/id"
+    """
+    return "".join("/" + str(key).replace("~", "~0").replace("/", "~1") for key in path)
+
+
+class ZdfTableOfContents:
+    """
+    zdf文件的目录, 由ZdfStreamWriter在写出时填写, 写在zdf的末尾, 参见zdf_reader.read_toc。
+    目录与zdf的层级结构相同, 但不包含__data__:
+        每个object记录它在文件中的字节范围"__range__": [起始位置, 结束位置](最外层object的结束位置为null);
+        每个__isRecord__记录__dims__、__dtype__、本身的范围"__range__"以及__data__的范围"__data_range__";
+        其它的值(如header、step的time_value、field的variables)原样保留。
+    读取目录就可以得到所有step和field的结构、大小和位置, 不需要解析数据
+    """
+    def __init__(self, data=None):
+        """
+        :param data: 已有的目录, 向已有的zdf追加时由zdf_reader.read_toc读取
+        """
+        self.data = data
+        self._stack = [] # 已打开的object在目录中对应的字典
+
+    def begin(self, key, position):
+        """
+        :param key: object的key, 最外层的object为None
+        :param position: object开始的位置
+        """
+        node = {"__range__": [position, None]}
+        if self._stack:
+            self._stack[-1][key] = node
+        else:
+            self.data = node
+        self._stack.append(node)
+
+    def end(self, position):
+        self._stack.pop()["__range__"][1] = position
+
+    def add(self, key, value, start, stop):
+        """
+        记录当前object中的一个值
+        :param start: 值开始的位置
+        :param stop: 值结束的位置
+        """
+        node = self._stack[-1]
+        if key == "__data__" and node.get("__isRecord__"):
+            node["__dtype__"] = self._get_dtype(value)
+            node["__data_range__"] = [start, stop]
+        else:
+            node[key] = value
+
+    def _get_dtype(self, data):
+        if isinstance(data, dict):
+            if "__quantized__" in data: # 定点编码的浮点数据
+                return "float64"
+            if "__dtype__" in data: # sidecar
+                return np.dtype(data["__dtype__"]).name
+            if "__ref__" in data: # 共享的id数组
+                node = self.data
+                for key in data["__ref__"].split("/")[1:]:
+                    node = node[key.replace("~1", "/").replace("~0", "~")]
+                return node["__dtype__"]
+            return "int64" # range编码的id数组或者按差编码的连接关系
+        return data.dtype.name if hasattr(data, "dtype") else np.asarray(data).dtype.name
+
+    def resume(self, path):
+        """
+        继续填写已有的目录, 与ZdfStreamWriter.resume相同, path对应的object及外层的object还没有关闭
+        :param path: 已经打开的object的key(不包括最外层)
+        """
+        self._stack = [self.data]
+        for key in path:
+            self._stack.append(self._stack[-1][key])
+
+
+class ZdfRecordBuffer:
+    """
+    逐块写入一个__isRecord__的__data__, 用于行数事先未知或者不能一次放入内存的数据块。
+    __data__的文本先写入临时文件(较小时保存在内存中), sidecar模式下直接写入sidecar文件;
+    全部写完后通过ZdfStreamWriter.write_record写出完整的数据块
+    """
+    spool_size = 16 * 2**20 # 文本超过这个大小时临时文件才写到磁盘上
+    text_rows = 1024 # 每次转换为文本的行数
+
+    def __init__(self, writer):
+        """
+        :param writer: ZdfStreamWriter对象, 数据块将写在writer当前打开的object中
+        """
+        self.writer = writer
+        self.rows = 0
+        self.row_shape = None # 每一行的形状, 即__dims__[1:]
+        self.dtype = None # 应用精度策略之后的数据类型, 定点编码时为还原后的类型
+        self.quantized = None # 定点编码时的{"__exponent__": [...], "__rows__": [...]}, 参见ZdfPrecision.quantize
+        # 数据块本身是一层object, __data__的各行按数据块的层级缩进; 定点编码时各行在__data__的__quantized__中, 再深一层
+        self._level = len(writer._is_empty) + 1
+        self._padding = "\n" + " " * (writer.indent * self._level)
+        self._reference = None
+        self._text = None if writer.sidecar is not None else tempfile.SpooledTemporaryFile(self.spool_size, "w+")
+
+    def write(self, data):
+        """
+        写入一块数据, 按行拼接在之前写入的数据之后
+        :param data: NumPy数组, 第一维是行
+        :return:
+        """
+        data = np.asarray(data)
+        if self.row_shape is None:
+            self.row_shape = list(data.shape[1:])
+            self.dtype = data.dtype
+            if self.writer._is_quantized(data):
+                self.dtype = np.dtype(np.float64)
+                self.quantized = {"__exponent__": [], "__rows__": []}
+                self._padding += " " * self.writer.indent
+        if len(data) == 0:
+            return
+        if self.quantized is not None:
+            quantized = self.writer._quantize(data)
+            for key in ("__exponent__", "__rows__"):
+                self.quantized[key].extend(quantized[key])
+            self.quantized.update((key, value) for key, value in quantized.items() if key == "__nan__")
+            data = quantized["__quantized__"]
+        else:
+            data = self.writer._apply_precision(data)
+        if self._text is None:
+            self._reference = self.writer.sidecar.write_array(data, self._reference)
+        else:
+            # 每次只把text_rows行转换为文本, 去掉列表的"["和"\n]", 只保留各行的文本
+            for start in range(0, len(data), self.text_rows):
+                text = self.writer._encoder.encode(data[start:start + self.text_rows].tolist())[1:-2]
+                self._text.write(("," if self.rows or start else "") + text.replace("\n", self._padding))
+        self.rows += len(data)
+
+    def data(self):
+        """
+        :return: sidecar模式下替代__data__的引用, 定点编码时为包含引用的字典
+        """
+        if self.quantized is None or self._reference is None:
+            return self._reference
+        return dict(self.quantized, __quantized__=self._reference)
+
+    def dump(self, f):
+        """
+        将__data__写入zdf文件
+        """
+        if self._text is None:
+            return
+        if self.rows == 0:
+            f.write("[]")
+            return
+        if self.quantized is not None:
+            # 与json.dump写出{"__exponent__": ..., "__rows__": ..., "__quantized__": [...]}的文本相同
+            f.write("{")
+            for key, value in self.quantized.items():
+                text = self.writer._encoder.encode(value).replace("\n", self._padding)
+                f.write(f"{self._padding}{json.dumps(key)}: {text},")
+            f.write(f'{self._padding}"__quantized__": ')
+        f.write("[")
+        self._text.seek(0)
+        shutil.copyfileobj(self._text, f)
+        self._text.close()
+        f.write(self._padding + "]")
+        if self.quantized is not None:
+            f.write("\n" + " " * (self.writer.indent * self._level) + "}")
+
+
+class ZdfStreamWriter:
+    """
+    流式写出zdf文件。
+    zdf文件的外层结构(header, global, model, result_sets, step等)通过begin_object/end_object逐层打开和关闭，
+    mesh、field等大的数据块通过write_item逐块序列化后立即写入文件，写完即可释放，
+    因此峰值内存只取决于最大的单个数据块，而不是整个文件。
+    写出的文本与json.dump(data, f, indent=2)的结果完全一致。
+    指定sidecar时，__isRecord__的__data__写入二进制sidecar文件，zdf中只保留引用，参见ZdfSidecar;
+    指定precision时，__isRecord__中的浮点数据按精度策略写出，参见ZdfPrecision;
+    指定shared_ids时，重复的id数组替换为引用，参见ZdfSharedIds;
+    range_ids为True时，id数组中的等差数列编码为{"__ranges__": [[start, stop, step], id, ...]}，参见encode_ranges;
+    delta_connectivity为True时，element的连接关系编码为{"__first__": [...], "__delta__": [[...], ...]}，参见encode_delta;
+    指定toc时，每个object和__isRecord__的位置记录在目录中，参见ZdfTableOfContents。
+    f有begin_item/end_item方法时(如zdf_compress.ZdfCompressedFile)，每个object和数据块写出前后都会通知f
+    """
+    def __init__(self, f, indent=2, sidecar=None, precision=None, chunk_size=65536, shared_ids=None,
+                 range_ids=False, toc=None, delta_connectivity=False):
+        """
+        :param f: 以文本模式打开的文件对象, 或者zdf_compress.ZdfCompressedFile
+        :param indent: 缩进的空格数, 与json.dump的indent参数含义相同
+        :param sidecar: ZdfSidecar对象, 为None时__data__写成json文本
+        :param precision: ZdfPrecision对象, 为None时浮点数据按双精度的repr写出
+        :param chunk_size: 精度策略每次处理的行数。逐块写出的数据块(ZdfRecordBuffer)应使用相同的行数,
+                           这样quantize模式下一次写出和逐块写出的结果相同
+        :param shared_ids: ZdfSharedIds对象, 为None时每个id数组都完整写出
+        :param range_ids: 是否将id数组中的等差数列编码为range
+        :param toc: ZdfTableOfContents对象, 为None时不记录目录。
+                    记录目录时数据块中的object逐层写出(写出的文本不变), 位置由f.tell()得到
+        :param delta_connectivity: 是否将mesh中element的连接关系(elements下每种type的value)按行编码为差,
+                                   sidecar中的两部分各自使用最窄的整数类型
+        """
+        self.f = f
+        self.indent = indent
+        self.sidecar = sidecar
+        self.precision = precision
+        self.chunk_size = chunk_size
+        self.shared_ids = shared_ids
+        self.range_ids = range_ids
+        self.toc = toc
+        self.delta_connectivity = delta_connectivity
+        self._encoder = json.JSONEncoder(indent=indent, default=self._default)
+        self._is_empty = []  # 每一层已打开的object是否还没有写入任何item
+        self._path = [] # 已打开的object的key(不包括最外层), 用于生成引用中的JSON Pointer
+        self._items = f if hasattr(f, "begin_item") else None
+        self._in_record = False # 是否正在写出write_record的数据块, 其中的item不通知f
+
+    @staticmethod
+    def _default(o):
+        """
+        NumPy数组和NumPy标量在写出时才转换为list和Python数值
+        """
+        if hasattr(o, "tolist"):
+            return o.tolist()
+        raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+    def _write_key(self, key):
+        """
+        写出item之前的逗号、换行、缩进以及key
+        :param key: item的key, 最外层的object没有key
+        :return:
+        """
+        level = len(self._is_empty)
+        if level == 0:
+            return
+        self.f.write("\n" if self._is_empty[-1] else ",\n")
+        self._is_empty[-1] = False
+        self.f.write(" " * (self.indent * level))
+        self.f.write(json.dumps(key) + ": ")
+
+    def resume(self, path, is_empty):
+        """
+        继续写入一个已经写出的文件: f的当前位置位于path对应的object中最后一个item之后, 这一层及外层的object还没有关闭
+        :param path: 已经打开的object的key(不包括最外层), 如["result_sets", "Job-1", "items"]
+        :param is_empty: path对应的object是否还没有任何item
+        :return:
+        """
+        self._is_empty = [False] * len(path) + [is_empty]
+        self._path = list(path)
+        if self.toc is not None:
+            self.toc.resume(path)
+
+    def begin_object(self, key=None):
+        """
+        打开一个object, 之后写入的item都属于这个object
+        :param key: object的key, 最外层的object为None
+        :return:
+        """
+        if self._is_empty:
+            self._begin_item(key)
+            self._path.append(key)
+        self._write_key(key)
+        if self.toc is not None:
+            self.toc.begin(key, self.f.tell())
+        self.f.write("{")
+        self._is_empty.append(True)
+
+    def end_object(self):
+        """
+        关闭最近一次打开的object
+        :return:
+        """
+        is_empty = self._is_empty.pop()
+        if not is_empty:
+            self.f.write("\n" + " " * (self.indent * len(self._is_empty)))
+        self.f.write("}")
+        if self.toc is not None:
+            self.toc.end(self.f.tell())
+        if self._is_empty:
+            key = self._path.pop()
+            self._end_item(key)
+
+    def write_item(self, key, value):
+        """
+        序列化一个数据块并写入当前object
+        :param key: 数据块的key
+        :param value: 可以被json序列化的数据块
+        :return:
+        """
+        if (self.sidecar is not None or self.precision is not None or self.shared_ids is not None
+                or self.range_ids or self.delta_connectivity):
+            value = self._write_records(value, self._path + [key])
+        self._write_value(key, value)
+
+    def _write_value(self, key, value):
+        """
+        写出一个已经应用了精度策略、sidecar等处理的数据块
+        """
+        if self.toc is not None and isinstance(value, dict) and not self._in_record:
+            # 逐层写出object中的item, 以便在目录中记录每一层和每个__isRecord__的位置; __isRecord__中的item不通知f
+            self.begin_object(key)
+            self._in_record = bool(value.get("__isRecord__"))
+            for item_key, item in value.items():
+                self._write_value(item_key, item)
+            self._in_record = False
+            self.end_object()
+            return
+        self._begin_item(key)
+        self._write_key(key)
+        start = self.f.tell() if self.toc is not None else None
+        # iterencode按缩进层级0生成文本，需要在每个换行后补上当前层级的缩进
+        padding = "\n" + " " * (self.indent * len(self._is_empty))
+        for chunk in self._encoder.iterencode(value):
+            self.f.write(chunk.replace("\n", padding))
+        if self.toc is not None:
+            self.toc.add(key, value, start, self.f.tell())
+        self._end_item(key)
+
+    def write_toc(self, key):
+        """
+        将目录写入当前object, 之后不再记录目录(目录本身不记录在目录中)
+        :param key: 目录的key
+        :return: 目录在文件中的范围[起始位置, 结束位置], 包括之前的逗号和key
+        """
+        toc, self.toc = self.toc, None
+        start = self.f.tell()
+        self._write_value(key, toc.data)
+        return [start, self.f.tell()]
+
+    def _begin_item(self, key):
+        if self._items is not None and not self._in_record:
+            self._items.begin_item(json_pointer(self._path + [key]))
+
+    def _end_item(self, key):
+        if self._items is not None and not self._in_record:
+            self._items.end_item(json_pointer(self._path + [key]))
+
+    def record_buffer(self):
+        """
+        :return: 写在当前object中的数据块的ZdfRecordBuffer
+        """
+        return ZdfRecordBuffer(self)
+
+    def write_record(self, key, buffer):
+        """
+        将逐块写完的数据块写入当前object
+        :param key: 数据块的key
+        :param buffer: 由record_buffer得到的ZdfRecordBuffer
+        :return:
+        """
+        self.begin_object(key)
+        self._in_record = True
+        self.write_item("__isRecord__", True)
+        self.write_item("__dims__", [buffer.rows] + (buffer.row_shape or []))
+        if buffer._reference is not None:
+            self.write_item("__data__", buffer.data())
+        elif self.sidecar is not None:
+            self.write_item("__data__", self.sidecar.write_array(np.empty([0] + (buffer.row_shape or []))))
+        else:
+            self._write_key("__data__")
+            start = self.f.tell() if self.toc is not None else None
+            buffer.dump(self.f)
+            if self.toc is not None:
+                self.toc.add("__data__", np.empty(0, buffer.dtype), start, self.f.tell())
+        self._in_record = False
+        self.end_object()
+
+    def _write_records(self, value, path):
+        """
+        对value中所有__isRecord__的__data__应用精度策略并写入sidecar, 重复的id数组替换为引用,
+        返回把__data__替换为处理结果或引用之后的value(不修改原来的value)
+        :param value: 数据块
+        :param path: value的key的路径(不包括最外层)
+        """
+        if not isinstance(value, dict):
+            return value
+        if value.get("__isRecord__") and "__data__" in value:
+            write_data = self._write_connectivity if self._is_connectivity(path) else self._write_shared_ids
+            return {key: write_data(item, path) if key == "__data__" else item for key, item in value.items()}
+        if self.shared_ids is not None and isinstance(value.get("id"), dict) and value["id"].get("__isRecord__"):
+            value = self.shared_ids.align_records(value)
+        return {key: self._write_records(item, path + [key]) for key, item in value.items()}
+
+    def _write_shared_ids(self, data, path):
+        if path[-1] != "id" or not ZdfSharedIds.is_ids(np.asarray(data)):
+            return self._write_record_data(data)
+        ids = np.asarray(data)
+        if self.shared_ids is not None:
+            reference = self.shared_ids.lookup(ids)
+            if reference is not None:
+                return reference
+        ranges = encode_ranges(ids) if self.range_ids else None
+        data = self._write_record_data(ids) if ranges is None else {"__ranges__": ranges}
+        if self.shared_ids is not None:
+            self.shared_ids.register(ids, data if self.sidecar is not None else {"__ref__": json_pointer(path)})
+        return data
+
+    def _is_connectivity(self, path):
+        # mesh中每种element type的连接关系, 如["model", "mesh", "elements", "tetra10", "value"]
+        return self.delta_connectivity and len(path) >= 3 and path[-3] == "elements" and path[-1] == "value"
+
+    def _write_connectivity(self, data, path):
+        data = np.asarray(data)
+        if data.ndim != 2 or data.shape[1] < 2 or len(data) == 0 or data.dtype.kind not in "iu":
+            return self._write_record_data(data)
+        first, delta = encode_delta(data)
+        return {"__first__": self._write_record_data(first), "__delta__": self._write_record_data(delta)}
+
+    def _write_record_data(self, data):
+        if self.precision is not None and self._is_quantized(np.asarray(data)) and np.ndim(data) > 0 and len(data) > 0:
+            quantized = self._quantize(np.asarray(data))
+            if self.sidecar is not None:
+                quantized["__quantized__"] = self.sidecar.write_array(quantized["__quantized__"])
+            return quantized
+        if self.precision is not None:
+            data = np.asarray(data)
+            if data.ndim > 0 and len(data) > self.chunk_size:
+                data = np.concatenate([self._apply_precision(data[start:start + self.chunk_size])
+                                       for start in range(0, len(data), self.chunk_size)])
+            else:
+                data = self._apply_precision(data)
+        if self.sidecar is not None:
+            return self.sidecar.write_array(data)
+        return data
+
+    def _is_quantized(self, data):
+        """
+        :return: data是否按quantize模式定点编码
+        """
+        return self.precision is not None and self.precision.mode == "quantize" and data.dtype.kind == "f"
+
+    def _quantize(self, data):
+        """
+        每chunk_size行定点编码一次
+        :return: {"__exponent__": 每一块的指数, "__rows__": 每一块的行数, ["__nan__": 非有限的值对应的整数,]
+                  "__quantized__": 整数数组}
+        """
+        parts, exponents = [], []
+        for start in range(0, len(data), self.chunk_size):
+            quantized, exponent = self.precision.quantize(data[start:start + self.chunk_size])
+            parts.append(quantized)
+            exponents.append(exponent)
+        result = {"__exponent__": exponents, "__rows__": [len(part) for part in parts]}
+        quantized = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        if not np.all(np.isfinite(data)):
+            result["__nan__"] = int(np.iinfo(quantized.dtype).min)
+        result["__quantized__"] = quantized
+        return result
+
+    def _apply_precision(self, data):
+        if self.precision is None or data.dtype.kind != "f":
+            return data
+        dtype = np.float32 if self.precision.mode == "float32" else data.dtype
+        data = self.precision.apply(data)
+        if self.sidecar is not None:
+            # sidecar中的二进制数据保持原来的精度(float32模式下为float32)，只保留取整的效果
+            data = data.astype(dtype, copy=False)
+        return data
+
+
+def dump_zdf(data, f, sidecar=None, precision=None, shared_ids=None, range_ids=False, delta_connectivity=False):
+    """
+    将zdf的字典(例如zdf_reader.load_zdf的结果)写入文件, 可以在json文本和sidecar两种形式之间转换
+    :param data: zdf的字典
+    :param f: 以文本模式打开的zdf文件对象
+    :param sidecar: ZdfSidecar对象, 为None时__data__写成json文本
+    :param precision: ZdfPrecision对象, 为None时浮点数据按双精度的repr写出
+    :param shared_ids: ZdfSharedIds对象, 为None时每个id数组都完整写出
+    :param range_ids: 是否将id数组中的等差数列编码为range
+    :param delta_connectivity: 是否将element的连接关系按行编码为差
+    :return:
+    """
+    writer = ZdfStreamWriter(f, sidecar=sidecar, precision=precision, shared_ids=shared_ids, range_ids=range_ids,
+                             delta_connectivity=delta_connectivity)
+    writer.begin_object()
+    for key, value in data.items():
+        writer.write_item(key, value)
+    writer.end_object()